@@ -0,0 +1,66 @@
+"""
+Times the DataReader loaders used by the run.py prologue with a cold cache (csv parse + cache write)
+and with a warm cache (np.load of the cached arrays).
+
+Run from the repository root with the usual .env paths set:
+    python -m Benchmarks.benchmark_data_loading --repetitions 3
+"""
+
+import os
+import time
+import argparse
+import tempfile
+
+from Data_Handler.DataReader import DataReader
+from Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
+
+
+# Loader name and the environment variables of the files it reads
+PROLOGUE_LOADERS = [
+    ("load_target", ["TARGET_PATH"]),
+    ("load_aug_ucm", ["DATA_AUG_UCM"]),
+    ("load_augmented_binary_urm", ["INTERACTIONS_AND_IMPRESSIONS_PATH"]),
+    ("load_icm", ["DATA_ICM_TYPE_PATH"]),
+    ("load_ICM_stacked_with_weighted_impressions", ["WEIGHTED_IMPRESSIONS_ICM", "DATA_ICM_TYPE_PATH"]),
+]
+
+
+def run_prologue(dataReader, loaders):
+    start_time = time.time()
+    for loader_name in loaders:
+        getattr(dataReader, loader_name)()
+    return time.time() - start_time
+
+
+def format_time(seconds):
+    value, unit = seconds_to_biggest_unit(seconds)
+    return "{:.2f} {}".format(value, unit)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repetitions", type=int, default=3)
+    args = parser.parse_args()
+
+    loaders = []
+    for loader_name, env_vars in PROLOGUE_LOADERS:
+        if all(os.getenv(env_var) is not None and os.path.exists(os.getenv(env_var)) for env_var in env_vars):
+            loaders.append(loader_name)
+        else:
+            print("Skipping {}: source file not available".format(loader_name))
+
+    with tempfile.TemporaryDirectory() as cache_folder_path:
+
+        uncached_time = run_prologue(DataReader(use_cache=False), loaders)
+        print("No cache:   {}".format(format_time(uncached_time)))
+
+        dataReader = DataReader(cache_folder_path=cache_folder_path)
+
+        cold_time = run_prologue(dataReader, loaders)
+        print("Cold cache: {}".format(format_time(cold_time)))
+
+        warm_times = [run_prologue(dataReader, loaders) for _ in range(args.repetitions)]
+        warm_time = min(warm_times)
+        print("Warm cache: {} (best of {}), speedup {:.1f}x".format(format_time(warm_time), args.repetitions,
+                                                                   uncached_time / max(warm_time, 1e-9)))
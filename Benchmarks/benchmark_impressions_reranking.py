@@ -0,0 +1,51 @@
+"""
+Compares the per-user Impressions.update_ranking loop with Impressions.update_ranking_batch
+on random top-10 lists for every target user, and checks that both give the same rankings.
+
+Run from the repository root with the usual .env paths set:
+    python -m Benchmarks.benchmark_impressions_reranking --cutoff 10
+"""
+
+import time
+import argparse
+
+import numpy as np
+
+from Data_Handler.DataReader import DataReader
+from impressions import Impressions
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cutoff", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    dataReader = DataReader()
+    target = dataReader.load_target()
+    impressions_count_urm = dataReader.load_impressions_count_urm()
+    n_items = impressions_count_urm.shape[1]
+
+    rng = np.random.default_rng(args.seed)
+    # Random distinct items for each user, as a recommender would return
+    recommendations_list = [rng.choice(n_items, args.cutoff, replace=False).tolist() for _ in range(len(target))]
+
+    impressions = Impressions()
+
+    dataReader.save_impressions()
+
+    start_time = time.time()
+    loop_ranking = [impressions.update_ranking(int(user_id), recommended_items, dataReader)
+                    for user_id, recommended_items in zip(target, recommendations_list)]
+    loop_time = time.time() - start_time
+    print("Per-user loop: {:.2f} sec, {:.0f} users/sec".format(loop_time, len(target) / loop_time))
+
+    start_time = time.time()
+    batch_ranking = impressions.update_ranking_batch(target, recommendations_list, impressions_count_urm)
+    batch_time = time.time() - start_time
+    print("Batch:         {:.2f} sec, {:.0f} users/sec, speedup {:.1f}x".format(batch_time, len(target) / batch_time,
+                                                                              loop_time / max(batch_time, 1e-9)))
+
+    assert [list(ranking) for ranking in loop_ranking] == batch_ranking, "Batch and per-user rankings differ"
+    print("Rankings are identical")
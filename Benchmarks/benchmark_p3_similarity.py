@@ -0,0 +1,119 @@
+"""
+Compares the RP3beta similarity computed one row at a time, as RP3betaRecommender did before
+compute_P3_similarity_topK, with the block kernel on one or more threads: columns per second and largest
+difference of the sorted values of each row, items with the same value may be selected in either.
+
+Run from the repository root with the usual .env paths set:
+    python -m Benchmarks.benchmark_p3_similarity --n_threads 1 4
+
+Without the data files, --synthetic builds a random matrix with the shape of URM_train_pow:
+    python -m Benchmarks.benchmark_p3_similarity --synthetic
+"""
+
+import time
+import argparse
+
+import numpy as np
+from sklearn.preprocessing import normalize
+
+from Benchmarks.benchmark_slim_fit import load_URM_train_pow, build_synthetic_URM_train_pow, format_time
+from Recommenders.Recommender_utils import check_matrix
+from Recommenders.GraphBased.P3_similarity import compute_P3_similarity_topK
+from Recommenders.Similarity.Compute_Similarity_Python import Incremental_Similarity_Builder
+
+
+def get_RP3beta_transitions(URM_train, alpha, beta):
+    """Pui, Piu and degree as computed by RP3betaRecommender.fit"""
+    Pui = normalize(URM_train, norm='l1', axis=1)
+
+    X_bool = URM_train.transpose(copy=True)
+    X_bool.data = np.ones(X_bool.data.size, np.float32)
+    X_bool_sum = np.array(X_bool.sum(axis=1)).ravel()
+
+    degree = np.zeros(URM_train.shape[1])
+    nonZeroMask = X_bool_sum != 0.0
+    degree[nonZeroMask] = np.power(X_bool_sum[nonZeroMask], -beta)
+
+    Piu = normalize(X_bool, norm='l1', axis=1)
+
+    return Pui.power(alpha), Piu.power(alpha), degree
+
+
+def compute_P3_similarity_row_loop(Piu, Pui, topK, degree, block_size=200):
+    """The previous implementation: top-K selection and append of each row of the block in a Python loop"""
+    n_items = Pui.shape[1]
+    similarity_builder = Incremental_Similarity_Builder(n_items, initial_data_block=n_items*topK, dtype=np.float32)
+
+    for start_row in range(0, n_items, block_size):
+        end_row = min(start_row + block_size, n_items)
+        similarity_block = (Piu[start_row:end_row] * Pui).toarray()
+
+        for row_in_block in range(end_row - start_row):
+            row_data = np.multiply(similarity_block[row_in_block, :], degree)
+            row_data[start_row + row_in_block] = 0
+
+            relevant_items_partition = np.argpartition(-row_data, topK-1, axis=0)[:topK]
+            row_data = row_data[relevant_items_partition]
+
+            non_zero_mask = row_data != 0.0
+            similarity_builder.add_data_lists(row_list_to_add=np.full(non_zero_mask.sum(), start_row + row_in_block, dtype=np.int32),
+                                              col_list_to_add=relevant_items_partition[non_zero_mask],
+                                              data_list_to_add=row_data[non_zero_mask])
+
+    return similarity_builder.get_SparseMatrix()
+
+
+def get_sorted_row_values(W_sparse, topK):
+    """Values of each row sorted and padded with zeros to topK, items with the same value may be selected in any order"""
+    W_sparse = W_sparse.tocsr()
+    row_nnz = np.diff(W_sparse.indptr)
+    sorted_row_values = np.zeros((W_sparse.shape[0], topK), dtype=np.float32)
+    sorted_row_values[np.repeat(np.arange(W_sparse.shape[0]), row_nnz),
+                      np.arange(W_sparse.nnz) - np.repeat(W_sparse.indptr[:-1], row_nnz)] = W_sparse.data
+
+    return np.sort(sorted_row_values, axis=1)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--topK", type=int, default=89)
+    parser.add_argument("--alpha", type=float, default=0.6951524535062256)
+    parser.add_argument("--beta", type=float, default=0.39985511876562174)
+    parser.add_argument("--block_size", type=int, default=200)
+    parser.add_argument("--n_threads", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--synthetic", action="store_true")
+    parser.add_argument("--n_users", type=int, default=41629)
+    parser.add_argument("--n_items", type=int, default=27968)
+    parser.add_argument("--n_features", type=int, default=8)
+    parser.add_argument("--interactions_per_user", type=int, default=40)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        URM_train_pow = build_synthetic_URM_train_pow(args.n_users, args.n_items, args.n_features,
+                                                      args.interactions_per_user, 0.825, args.seed)
+    else:
+        URM_train_pow = load_URM_train_pow(0.9, args.seed)
+
+    URM_train_pow = check_matrix(URM_train_pow, 'csr', dtype=np.float32)
+    n_items = URM_train_pow.shape[1]
+    print("URM_train_pow: shape {}, nnz {}".format(URM_train_pow.shape, URM_train_pow.nnz))
+
+    Pui, Piu, degree = get_RP3beta_transitions(URM_train_pow, args.alpha, args.beta)
+
+    start_time = time.time()
+    W_row_loop = compute_P3_similarity_row_loop(Piu, Pui, args.topK, degree, block_size=args.block_size)
+    row_loop_time = time.time() - start_time
+    sorted_row_values_row_loop = get_sorted_row_values(W_row_loop, args.topK)
+    print("row loop:           {}, {:.0f} columns/sec".format(format_time(row_loop_time), n_items / row_loop_time))
+
+    for n_threads in args.n_threads:
+        start_time = time.time()
+        W_block = compute_P3_similarity_topK(Piu, Pui, args.topK, degree=degree, block_size=args.block_size,
+                                             n_threads=n_threads, print_function=lambda message: None)
+        block_time = time.time() - start_time
+
+        print("block, {:2d} threads: {}, {:.0f} columns/sec, speedup {:.1f}x, largest difference {:.2e}".format(
+            n_threads, format_time(block_time), n_items / block_time, row_loop_time / block_time,
+            np.abs(sorted_row_values_row_loop - get_sorted_row_values(W_block, args.topK)).max()))
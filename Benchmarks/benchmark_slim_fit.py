@@ -0,0 +1,118 @@
+"""
+Compares the scikit-learn and the Gram matrix ElasticNet solvers of SLIMElasticNetRecommender on URM_train_pow:
+time to fit a random sample of items, full fit time extrapolated from it, and largest difference of the topK
+coefficients of the sampled items.
+
+Run from the repository root with the usual .env paths set:
+    python -m Benchmarks.benchmark_slim_fit --n_items_timed 200
+
+Without the data files, --synthetic builds a random matrix with the shape of URM_train_pow:
+    python -m Benchmarks.benchmark_slim_fit --synthetic
+"""
+
+import time
+import argparse
+
+import numpy as np
+import scipy.sparse as sps
+
+from Recommenders.Recommender_utils import check_matrix
+from Recommenders.SLIM.SLIMElasticNetRecommender import SklearnElasticNetSolver, GramElasticNetSolver, select_topK
+from Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
+
+
+def load_URM_train_pow(train_percentage, seed):
+    from Data_Handler.DataReader import DataReader
+    from Data_manager.split_functions.split_train_validation_random_holdout import split_train_in_two_percentage_global_sample
+
+    dataReader = DataReader()
+    URM = dataReader.load_augmented_binary_urm()
+    URM_aug, ICM = dataReader.pad_with_zeros_ICMandURM(URM)
+    URM_train_aug, _ = split_train_in_two_percentage_global_sample(URM_aug, train_percentage=train_percentage, seed=seed)
+
+    return dataReader.stackMatrixes(URM_train_aug)
+
+
+def build_synthetic_URM_train_pow(n_users, n_items, n_features, interactions_per_user, alpha, seed):
+    """Binary URM with long tail item popularity, one feature per item stacked below it as stackMatrixes does"""
+    rng = np.random.default_rng(seed)
+
+    popularity = rng.pareto(1.0, n_items) + 1
+    popularity /= popularity.sum()
+
+    user_ids = np.repeat(np.arange(n_users), interactions_per_user)
+    item_ids = rng.choice(n_items, size=len(user_ids), p=popularity)
+    URM = sps.csr_matrix((np.ones(len(user_ids)), (user_ids, item_ids)), shape=(n_users, n_items))
+    URM.data[:] = 1.0
+
+    feature_ids = rng.integers(0, n_features, n_items)
+    ICM_T = sps.csr_matrix((np.ones(n_items), (feature_ids, np.arange(n_items))), shape=(n_features, n_items))
+
+    return sps.vstack([URM * alpha, ICM_T * (1 - alpha)], format="csr")
+
+
+def time_solver(elastic_net_solver, items, topK):
+    coefficients = []
+    start_time = time.time()
+    for item in items:
+        coefficients.append(select_topK(*elastic_net_solver.solve(item), topK))
+    return time.time() - start_time, coefficients
+
+
+def format_time(seconds):
+    value, unit = seconds_to_biggest_unit(seconds)
+    return "{:.2f} {}".format(value, unit)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_items_timed", type=int, default=200)
+    parser.add_argument("--l1_ratio", type=float, default=0.007467817120176792)
+    parser.add_argument("--alpha", type=float, default=0.0016779515713674044)
+    parser.add_argument("--topK", type=int, default=723)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--synthetic", action="store_true")
+    parser.add_argument("--n_users", type=int, default=41629)
+    parser.add_argument("--n_items", type=int, default=27968)
+    parser.add_argument("--n_features", type=int, default=8)
+    parser.add_argument("--interactions_per_user", type=int, default=40)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        URM_train_pow = build_synthetic_URM_train_pow(args.n_users, args.n_items, args.n_features,
+                                                      args.interactions_per_user, 0.825, args.seed)
+    else:
+        URM_train_pow = load_URM_train_pow(0.9, args.seed)
+
+    URM_train_pow = check_matrix(URM_train_pow, 'csc', dtype=np.float32)
+    n_items = URM_train_pow.shape[1]
+    print("URM_train_pow: shape {}, nnz {}".format(URM_train_pow.shape, URM_train_pow.nnz))
+
+    items = np.random.default_rng(args.seed).choice(n_items, size=min(args.n_items_timed, n_items), replace=False)
+
+    sklearn_solver = SklearnElasticNetSolver(URM_train_pow.copy(), alpha=args.alpha, l1_ratio=args.l1_ratio)
+    sklearn_time, sklearn_coefficients = time_solver(sklearn_solver, items, args.topK)
+
+    start_time = time.time()
+    gram_solver = GramElasticNetSolver(URM_train_pow.copy(), alpha=args.alpha, l1_ratio=args.l1_ratio)
+    gram_setup_time = time.time() - start_time
+    gram_time, gram_coefficients = time_solver(gram_solver, items, args.topK)
+
+    max_difference = 0.0
+    for (sklearn_indices, sklearn_values), (gram_indices, gram_values) in zip(sklearn_coefficients, gram_coefficients):
+        sklearn_column = np.zeros(n_items)
+        sklearn_column[sklearn_indices] = sklearn_values
+        gram_column = np.zeros(n_items)
+        gram_column[gram_indices] = gram_values
+        max_difference = max(max_difference, np.abs(sklearn_column - gram_column).max())
+
+    sklearn_full_time = sklearn_time / len(items) * n_items
+    gram_full_time = gram_setup_time + gram_time / len(items) * n_items
+
+    print("sklearn: {} for {} items, full fit ~{}".format(format_time(sklearn_time), len(items), format_time(sklearn_full_time)))
+    print("gram:    {} for {} items + {} Gram matrix, full fit ~{}".format(format_time(gram_time), len(items),
+                                                                          format_time(gram_setup_time), format_time(gram_full_time)))
+    print("Speedup {:.1f}x, Gram matrix nnz {}, dense rows {}".format(sklearn_full_time / max(gram_full_time, 1e-9),
+                                                                   gram_solver.gram.nnz, gram_solver.URM_dense_rows.shape[0]))
+    print("Largest coefficient difference: {:.2e}".format(max_difference))
@@ -0,0 +1,192 @@
+import os
+import json
+import shutil
+import hashlib
+import inspect
+from functools import wraps
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sps
+
+
+class DataCache(object):
+    """
+    On-disk cache for the objects built by the DataReader loaders.
+
+    Each entry is a folder named after a hash of the loader name, the code of its module, its arguments and the path, size and
+    modification time of every source file the loader reads, so editing the loader or editing or replacing a csv
+    invalidates the entries built from it.
+    CSR matrices are stored as uncompressed indptr/indices/data .npy arrays and dataframes as one .npy file per column,
+    so a warm load is a handful of np.load calls instead of a csv parse.
+    """
+
+    _INDEX_FILE_NAME = "__index__"
+
+    def __init__(self, folder_path=None):
+        if folder_path is None:
+            folder_path = os.getenv('DATA_CACHE_PATH', '.data_cache/')
+
+        self.folder_path = folder_path if folder_path[-1] == "/" else folder_path + "/"
+
+    def get_key(self, loader_name, arguments, source_paths, loader_code_hash=None):
+        """Hash of the loader name, its arguments, the state of the source files and the hash of the loader code
+
+        Args:
+            loader_name (str): name of the loader
+            arguments (dict): arguments the loader has been called with, defaults included
+            source_paths (list): paths of the files read by the loader
+            loader_code_hash (str): hash of the code the loader can reach, see get_loader_code_hash
+
+        Returns:
+            str: key of the cache entry
+        """
+        sources = []
+        for path in source_paths:
+            if path is not None and os.path.exists(path):
+                stat = os.stat(path)
+                sources.append([os.path.abspath(path), stat.st_size, stat.st_mtime_ns])
+            else:
+                sources.append([path, None, None])
+
+        description = json.dumps({"loader": loader_name,
+                                  "loader_code": loader_code_hash,
+                                  "arguments": {name: repr(value) for name, value in arguments.items()},
+                                  "sources": sources},
+                                 sort_keys=True)
+
+        return "{}_{}".format(loader_name, hashlib.sha1(description.encode("utf-8")).hexdigest()[:16])
+
+    def is_cacheable(self, data):
+        return isinstance(data, (sps.spmatrix, pd.DataFrame, np.ndarray))
+
+    def load(self, key):
+        """Return the object stored under key, or None if there is no such entry"""
+        entry_path = self.folder_path + key + "/"
+
+        if not os.path.exists(entry_path + "meta.json"):
+            return None
+
+        with open(entry_path + "meta.json", "r") as meta_file:
+            meta = json.load(meta_file)
+
+        if meta["type"] == "csr":
+            return sps.csr_matrix((np.load(entry_path + "data.npy"),
+                                   np.load(entry_path + "indices.npy"),
+                                   np.load(entry_path + "indptr.npy")),
+                                  shape=tuple(meta["shape"]))
+
+        elif meta["type"] == "dataframe":
+            index = np.load(entry_path + self._INDEX_FILE_NAME + ".npy", allow_pickle=True)
+            columns = {}
+            for column_position, column_name in enumerate(meta["columns"]):
+                columns[column_name] = np.load(entry_path + "column_{}.npy".format(column_position), allow_pickle=True)
+
+            return pd.DataFrame(columns, index=index, columns=meta["columns"])
+
+        elif meta["type"] == "ndarray":
+            return np.load(entry_path + "array.npy", allow_pickle=True)
+
+        return None
+
+    def save(self, key, data):
+        """Store data under key. Objects of unsupported types are silently not cached"""
+        if not self.is_cacheable(data):
+            return
+
+        if not os.path.exists(self.folder_path):
+            os.makedirs(self.folder_path, exist_ok=True)
+
+        # Write in a private folder and rename it only once complete, so a crash or a concurrent writer never leaves a partial entry
+        temp_path = "{}.temp_{}_{}/".format(self.folder_path, os.getpid(), key)
+        shutil.rmtree(temp_path, ignore_errors=True)
+        os.makedirs(temp_path)
+
+        try:
+            if sps.issparse(data):
+                data = sps.csr_matrix(data)
+                meta = {"type": "csr", "shape": list(data.shape)}
+                np.save(temp_path + "data.npy", data.data, allow_pickle=False)
+                np.save(temp_path + "indices.npy", data.indices, allow_pickle=False)
+                np.save(temp_path + "indptr.npy", data.indptr, allow_pickle=False)
+
+            elif isinstance(data, pd.DataFrame):
+                meta = {"type": "dataframe", "columns": list(data.columns)}
+                np.save(temp_path + self._INDEX_FILE_NAME + ".npy", data.index.values, allow_pickle=True)
+                for column_position, column_name in enumerate(data.columns):
+                    column = data[column_name].values
+                    np.save(temp_path + "column_{}.npy".format(column_position), column, allow_pickle=column.dtype == object)
+
+            else:
+                meta = {"type": "ndarray"}
+                np.save(temp_path + "array.npy", data, allow_pickle=data.dtype == object)
+
+            with open(temp_path + "meta.json", "w") as meta_file:
+                json.dump(meta, meta_file)
+
+            try:
+                os.rename(temp_path, self.folder_path + key)
+            except OSError:
+                # Another process stored the same entry in the meantime
+                shutil.rmtree(temp_path, ignore_errors=True)
+
+        except Exception as exception:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            raise exception
+
+    def clear(self):
+        """Remove every entry of the cache"""
+        shutil.rmtree(self.folder_path, ignore_errors=True)
+
+
+def get_loader_code_hash(loader):
+    """
+    Hash of the whole source of the module of the loader and of this module. Loaders call other loaders and helpers
+    of their module, e.g. load_augmented_binary_urm builds on load_augmented_binary_urm_df and dataframe_to_csr, so
+    an edit to any of them must change the key of every loader. Falls back on the bytecode of the loader when the
+    source is not available.
+    """
+    sha1 = hashlib.sha1()
+
+    for module_file_path in [inspect.getsourcefile(loader), __file__]:
+        if module_file_path is not None and os.path.exists(module_file_path):
+            with open(module_file_path, "rb") as module_file:
+                sha1.update(module_file.read())
+        else:
+            sha1.update(loader.__code__.co_code)
+
+    return sha1.hexdigest()
+
+
+def cached_loader(*source_env_vars):
+    """
+    Decorator for DataReader loaders. The loaded object is stored in the DataReader's DataCache, keyed on
+    the loader code and arguments and on the files pointed by the given environment variables.
+    """
+    def decorator(loader):
+        signature = inspect.signature(loader)
+        loader_code_hash = get_loader_code_hash(loader)
+
+        @wraps(loader)
+        def wrapper(self, *args, **kwargs):
+            if self.data_cache is None:
+                return loader(self, *args, **kwargs)
+
+            arguments = signature.bind(self, *args, **kwargs)
+            arguments.apply_defaults()
+            arguments = dict(arguments.arguments)
+            del arguments["self"]
+
+            key = self.data_cache.get_key(loader.__name__, arguments, [os.getenv(env_var) for env_var in source_env_vars],
+                                          loader_code_hash=loader_code_hash)
+
+            data = self.data_cache.load(key)
+            if data is None:
+                data = loader(self, *args, **kwargs)
+                self.data_cache.save(key, data)
+
+            return data
+
+        return wrapper
+
+    return decorator
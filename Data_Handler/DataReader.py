@@ -3,15 +3,30 @@ import pandas as pd
 import numpy as np
 from pandas.api.types import CategoricalDtype
 import scipy.sparse as sps
-from collections import Counter
 
 # imports for .env usage
 import os
 from dotenv import load_dotenv
 load_dotenv()
 
+from Data_Handler.DataCache import DataCache, cached_loader
+from Data_Handler.StackedMatrix import StackedMatrix
+
 class DataReader(object):
 
+    def __init__(self, use_cache=True, cache_folder_path=None):
+        """
+        Args:
+            use_cache (bool): if True, loaders store their output in a DataCache and read it back on the next calls
+                instead of parsing the csv files again
+            cache_folder_path (str): folder of the cache, by default the DATA_CACHE_PATH env variable or '.data_cache/'
+        """
+        self.data_cache = DataCache(cache_folder_path) if use_cache else None
+
+        # ItemID of each item index of the matrices aligned by the pad_with_zeros methods, built by the first of them
+        # and shared by all of them
+        self.item_id_mapping = None
+
     '''
     def csr_to_dataframe(self,csr):
         coo=csr.tocoo(copy=False)
@@ -53,18 +68,28 @@ class DataReader(object):
         csr = coo.tocsr()
         return csr
 
+    @cached_loader('INTERACTIONS_AND_IMPRESSIONS_PATH')
+    def _load_interactions_and_impressions_df(self):
+        """Load the interactions and impressions file as it is. Every loader based on it shares the same parsed copy
+
+        Returns:
+            dataframe: columns are UserID, ItemID, Impressions, Data
+        """
+        return pd.read_csv(filepath_or_buffer=os.getenv('INTERACTIONS_AND_IMPRESSIONS_PATH'),
+                           sep=',',
+                           names=[
+                               'UserID', 'ItemID', 'Impressions', 'Data'],
+                           header=0,
+                           dtype={'UserID': np.int32, 'ItemID': np.int32, 'Impressions': object, 'Data': np.int32})
+
+    @cached_loader('INTERACTIONS_AND_IMPRESSIONS_PATH')
     def load_binary_urm(self):
         """Load urm in which pairs (user,item) are '1' iff user has watched item
 
         Returns:
             csr: the urm as csr object
         """
-        interactions_and_impressions = pd.read_csv(filepath_or_buffer=os.getenv('INTERACTIONS_AND_IMPRESSIONS_PATH'),
-                                                   sep=',',
-                                                   names=[
-                                                       'UserID', 'ItemID', 'Impressions', 'Data'],
-                                                   header=0,
-                                                   dtype={'UserID': np.int32, 'ItemID': np.int32, 'Impressions': np.object0, 'Data': np.int32})
+        interactions_and_impressions = self._load_interactions_and_impressions_df()
         urm = interactions_and_impressions.drop(['Impressions'], axis=1)
         # removing duplicated (user_id,item_id) pairs
         urm = urm.drop_duplicates(keep='first')
@@ -74,36 +99,28 @@ class DataReader(object):
         watchers_urm = watchers_urm.replace({'Data': {0: 1}})
         return self.dataframe_to_csr(watchers_urm, 'UserID', 'ItemID', 'Data')
 
+    @cached_loader('INTERACTIONS_AND_IMPRESSIONS_PATH')
     def load_augmented_binary_urm_df(self):
         """Load urm in which pairs (user,item) are '1' iff user has either watched item or opened item's details page
 
         Returns:
             df: urm as dataframe object
         """
-        interactions_and_impressions = pd.read_csv(filepath_or_buffer=os.getenv('INTERACTIONS_AND_IMPRESSIONS_PATH'),
-                                                   sep=',',
-                                                   names=[
-            'UserID', 'ItemID', 'Impressions', 'Data'],
-            header=0,
-            dtype={'UserID': np.int32, 'ItemID': np.int32, 'Impressions': np.object0, 'Data': np.int32})
+        interactions_and_impressions = self._load_interactions_and_impressions_df()
         interactions = interactions_and_impressions.drop(
             ['Impressions'], axis=1)
         df = interactions.replace({'Data': {0: 1}})
         df = df.drop_duplicates(keep='first')
         return df
 
+    @cached_loader('INTERACTIONS_AND_IMPRESSIONS_PATH', 'DATA_ICM_TYPE_PATH')
     def load_augmented_binary_urm_less_items_df(self):
         """Load urm in which pairs (user,item) are '1' iff user has either watched item or opened item's details page
             removing those elements without informations
         Returns:
             df: urm as dataframe object
         """
-        interactions_and_impressions = pd.read_csv(filepath_or_buffer=os.getenv('INTERACTIONS_AND_IMPRESSIONS_PATH'),
-                                                   sep=',',
-                                                   names=[
-            'UserID', 'ItemID', 'Impressions', 'Data'],
-            header=0,
-            dtype={'UserID': np.int32, 'ItemID': np.int32, 'Impressions': np.object0, 'Data': np.int32})
+        interactions_and_impressions = self._load_interactions_and_impressions_df()
         interactions = interactions_and_impressions.drop(
             ['Impressions'], axis=1)
         interactions = interactions.replace({'Data': {0: 1}})
@@ -115,13 +132,9 @@ class DataReader(object):
         df.reset_index(drop=True, inplace=True)
         return df
 
+    @cached_loader('INTERACTIONS_AND_IMPRESSIONS_PATH', 'DATA_ICM_TYPE_PATH')
     def load_augmented_binary_icm_less_items_df(self):
-        interactions_and_impressions = pd.read_csv(filepath_or_buffer=os.getenv('INTERACTIONS_AND_IMPRESSIONS_PATH'),
-                                                   sep=',',
-                                                   names=[
-            'UserID', 'ItemID', 'Impressions', 'Data'],
-            header=0,
-            dtype={'UserID': np.int32, 'ItemID': np.int32, 'Impressions': np.object0, 'Data': np.int32})
+        interactions_and_impressions = self._load_interactions_and_impressions_df()
         interactions = interactions_and_impressions.drop(
             ['Impressions'], axis=1)
         interactions = interactions.replace({'Data': {0: 1}})
@@ -133,6 +146,7 @@ class DataReader(object):
         df.reset_index(drop=True, inplace=True)
         return df
 
+    @cached_loader('INTERACTIONS_AND_IMPRESSIONS_PATH', 'DATA_ICM_TYPE_PATH')
     def load_augmented_binary_icm_less_items(self):
 
         data_icm_type = self.load_augmented_binary_icm_less_items_df()
@@ -153,6 +167,7 @@ class DataReader(object):
         csr = coo.tocsr()
         return csr
 
+    @cached_loader('INTERACTIONS_AND_IMPRESSIONS_PATH', 'DATA_ICM_TYPE_PATH')
     def load_augmented_binary_urm_less_items(self):
         """Load urm in which pairs (user,item) are '1' iff user has either watched item or opened item's details page
 
@@ -162,6 +177,7 @@ class DataReader(object):
         urm = self.load_augmented_binary_urm_less_items_df()
         return self.dataframe_to_csr(urm, 'UserID', 'ItemID', 'Data')
 
+    @cached_loader('INTERACTIONS_AND_IMPRESSIONS_PATH')
     def load_augmented_binary_urm(self):
         """Load urm in which pairs (user,item) are '1' iff user has either watched item or opened item's details page
 
@@ -171,6 +187,7 @@ class DataReader(object):
         urm = self.load_augmented_binary_urm_df()
         return self.dataframe_to_csr(urm, 'UserID', 'ItemID', 'Data')
 
+    @cached_loader('INTERACTIONS_AND_IMPRESSIONS_PATH', 'ICM_LENGTH_PATH')
     def load_weighted_urm(self):
         """
         Load urm in which pairs (user,item) are non-binary values (0<=data<=1)
@@ -179,12 +196,7 @@ class DataReader(object):
         Returns:
             csr: urm as csr object
         """
-        interactions_and_impressions = pd.read_csv(filepath_or_buffer=os.getenv('INTERACTIONS_AND_IMPRESSIONS_PATH'),
-                                                   sep=',',
-                                                   names=[
-            'UserID', 'ItemID', 'Impressions', 'Data'],
-            header=0,
-            dtype={'UserID': np.int32, 'ItemID': np.int32, 'Impressions': np.object0, 'Data': np.int32})
+        interactions_and_impressions = self._load_interactions_and_impressions_df()
         df = interactions_and_impressions.drop(['Impressions'], axis=1)
         # for each pair (user,item), count the number interactions with data set to '0'
         # filter out rows with data set to '1'
@@ -217,6 +229,7 @@ class DataReader(object):
         urm = df.rename({'A': 'Data'}, axis=1)
         return self.dataframe_to_csr(urm, 'UserID', 'ItemID', 'Data')
 
+    @cached_loader('TARGET_PATH')
     def load_target(self):
         """Load target that is the set of users to which recommend items
 
@@ -233,6 +246,7 @@ class DataReader(object):
         #print(">>> number of target users: {}".format(len(user_id_list)))
         return user_id_unique
 
+    @cached_loader('TARGET_PATH')
     def load_target_df(self):
         """Load target that is the set of users to which recommend items
 
@@ -245,6 +259,7 @@ class DataReader(object):
                              dtype={'user_id': np.int32})
         return target
 
+    @cached_loader('DATA_ICM_TYPE_PATH')
     def load_icm(self):
         """Load icm
 
@@ -274,6 +289,7 @@ class DataReader(object):
         csr = coo.tocsr()
         return csr
 
+    @cached_loader('DATA_ICM_TYPE_PATH')
     def load_icm_df(self):
         """Load icm
 
@@ -289,6 +305,7 @@ class DataReader(object):
 
         return data_icm_type
 
+    @cached_loader('INTERACTIONS_AND_IMPRESSIONS_PATH', 'DATA_ICM_TYPE_PATH')
     def load_powerful_binary_urm_df(self, mult_param_urm=0.825, mult_param_icm=0.175):
         """
         Load urm by stacking augmented urm and transposed icm.
@@ -298,12 +315,7 @@ class DataReader(object):
         Returns:
             dataframe: urm as dataframe object
         """
-        data_icm_type = pd.read_csv(filepath_or_buffer=os.getenv('DATA_ICM_TYPE_PATH'),
-                                    sep=',',
-                                    names=[
-            'item_id', 'feature_id', 'data'],
-            header=0,
-            dtype={'item_id': np.int32, 'feature_id': np.int32, 'data': np.int32})
+        data_icm_type = self.load_icm_df()
         # Swap the columns from (item_id, feature_id, data) to (feature_id, item_id, data)
         swap_list = ["feature_id", "item_id", "data"]
         f = data_icm_type.reindex(columns=swap_list)
@@ -323,6 +335,7 @@ class DataReader(object):
             [urm, f], ignore_index=True).sort_values(['UserID', 'ItemID'])
         return powerful_urm
 
+    @cached_loader('INTERACTIONS_AND_IMPRESSIONS_PATH', 'DATA_ICM_TYPE_PATH')
     def load_powerful_binary_urm(self, mult_param_urm=0.825, mult_param_icm=0.175):
         """
         Load urm by stacking augmented urm and transposed icm.
@@ -338,12 +351,7 @@ class DataReader(object):
 
     # NEW
     def load_powerful_binary_urm_df_given_URM_train_df(self, URM_train_df):
-        data_icm_type = pd.read_csv(filepath_or_buffer=os.getenv('DATA_ICM_TYPE_PATH'),
-                                    sep=',',
-                                    names=[
-            'item_id', 'feature_id', 'data'],
-            header=0,
-            dtype={'item_id': np.int32, 'feature_id': np.int32, 'data': np.int32})
+        data_icm_type = self.load_icm_df()
         # Swap the columns from (item_id, feature_id, data) to (feature_id, item_id, data)
         swap_list = ["feature_id", "item_id", "data"]
         f = data_icm_type.reindex(columns=swap_list)
@@ -381,6 +389,52 @@ class DataReader(object):
         items = np.unique(item_id_list)
         return items
 
+    @cached_loader('INTERACTIONS_AND_IMPRESSIONS_PATH')
+    def load_impressions_count_urm(self):
+        """Return a sparse matrix counting how many times each ItemID has been presented to each UserID.
+        All impression strings are parsed in one pass into integer arrays, duplicates are summed by the sparse constructor.
+
+        Returns:
+            csr_matrix: shape (n_users, n_items), the cell (user, item) is the number of presentations of item to user
+        """
+        df = self._load_interactions_and_impressions_df()
+        impressions_df = df[['UserID', 'Impressions']].dropna()
+
+        impressions = impressions_df['Impressions'].values.astype(str)
+        # number of items in each impression list, i.e. number of commas + 1
+        n_items_per_list = impressions_df['Impressions'].str.count(',').values + 1
+
+        item_id_array = np.fromstring(",".join(impressions), dtype=np.int32, sep=",")
+        user_id_array = np.repeat(impressions_df['UserID'].values, n_items_per_list)
+
+        assert len(item_id_array) == len(user_id_array), "DataReader: malformed impression lists, parsed {} items but expected {}".format(
+            len(item_id_array), len(user_id_array))
+
+        n_users = int(df['UserID'].max()) + 1
+        n_items = int(max(df['ItemID'].max(), item_id_array.max(initial=-1))) + 1
+
+        impressions_count_urm = sps.csr_matrix((np.ones(len(item_id_array), dtype=np.int32), (user_id_array, item_id_array)),
+                                               shape=(n_users, n_items))
+        impressions_count_urm.sum_duplicates()
+        return impressions_count_urm
+
+    def _get_impressions_count_array(self, impressions_count_urm, user, items):
+        # Slice of the user row, the column indices are sorted so the lookup is a searchsorted over the row
+        items = np.asarray(items, dtype=np.int64)
+        if user >= impressions_count_urm.shape[0]:
+            return np.zeros(len(items), dtype=np.int32)
+
+        start_pos, end_pos = impressions_count_urm.indptr[user], impressions_count_urm.indptr[user + 1]
+        row_items = impressions_count_urm.indices[start_pos:end_pos]
+        row_counts = impressions_count_urm.data[start_pos:end_pos]
+
+        counts = np.zeros(len(items), dtype=np.int32)
+        if len(row_items) > 0:
+            position = np.minimum(np.searchsorted(row_items, items), len(row_items) - 1)
+            found = row_items[position] == items
+            counts[found] = row_counts[position[found]]
+        return counts
+
     def get_impressions_count(self, target, items):
         """
         Return a dictionary of dictionaries. For each UserID there is a dictionary of ItemIDs as keys and a number, corresponding to 
@@ -392,102 +446,67 @@ class DataReader(object):
         Returns:
             dict: dictionary of dictionaries, for instance { user0:{item0:2, item1:23}, user1:{item2:11, item4:3} }
         """
-
-        df = pd.read_csv(filepath_or_buffer=os.getenv('INTERACTIONS_AND_IMPRESSIONS_PATH'),
-                         sep=',',
-                         names=[
-            'UserID', 'ItemID', 'Impressions', 'Data'],
-            header=0,
-            dtype={'UserID': np.int32, 'ItemID': np.int32, 'Impressions': np.object0, 'Data': np.int32})
-        df = df.drop(['ItemID'], axis=1)
-        df = df.drop(['Data'], axis=1)
-        df = df.dropna()
-        # add a comma at the end of each impression string in order to concat properly then
-        df['Impressions'] = df['Impressions'].apply(lambda x: str(x)+',')
-        df = df.groupby(['UserID'], as_index=False)
-        # to concat impressions of each user
-        impressions_per_user = df['Impressions'].apply(sum)
+        impressions_count_urm = self.load_impressions_count_urm()
+        item_list = [int(item) for item in items]
 
         presentations_per_user = {}
         for user in target:
-            impressions = impressions_per_user[impressions_per_user['UserID']
-                                               == user]['Impressions']
-            impressions = impressions.iloc[0].split(",")
-            # remove last element which is a '' due to last ','
-            impressions = np.delete(impressions, -1)
-
-            counts = Counter(impressions)
-            presentations = {}
-            for item in items:
-                presentations[item] = counts[item]
-            presentations_per_user[user] = presentations
+            counts = self._get_impressions_count_array(impressions_count_urm, user, items)
+            presentations_per_user[user] = dict(zip(item_list, counts.tolist()))
         return presentations_per_user
 
     def save_impressions(self):
-        df = pd.read_csv(filepath_or_buffer=os.getenv('INTERACTIONS_AND_IMPRESSIONS_PATH'),
-                         sep=',',
-                         names=[
-            'UserID', 'ItemID', 'Impressions', 'Data'],
-            header=0,
-            dtype={'UserID': np.int32, 'ItemID': np.int32, 'Impressions': np.object0, 'Data': np.int32})
-        df = df.drop(['ItemID'], axis=1)
-        df = df.drop(['Data'], axis=1)
-        df = df.dropna()
-        # add a comma at the end of each impression string in order to concat properly then
-        df['Impressions'] = df['Impressions'].apply(lambda x: str(x)+',')
-        df = df.groupby(['UserID'], as_index=False)
-        # to concat impressions of each user
-        impressions_per_user = df['Impressions'].apply(sum)
-        self.impressions_per_user = impressions_per_user
+        self.impressions_count_urm = self.load_impressions_count_urm()
 
     def get_impressions_count_given_user(self, items, user):
+        """Return how many times each of the given ItemIDs has been presented to user, requires save_impressions to be called first
 
-        # ------ separeted, it was a for
-        impressions = self.impressions_per_user[self.impressions_per_user['UserID']
-                                                == user]['Impressions']
-
-        if(impressions.empty == False):
-            impressions = impressions.iloc[0].split(",")
-            # remove last element which is a '' due to last ','
-            impressions = np.delete(impressions, -1)
+        Args:
+            items (list): ItemIDs on which count presentations occurences
+            user (int): UserID
 
-            counts = Counter(impressions)
-            presentations = {}
-            for item in items:
-                presentations[int(item)] = counts[str(item)]
-            return presentations
-        else:
+        Returns:
+            dict: ItemIDs as keys and number of presentations as values, empty if the user has no impressions at all
+        """
+        impressions_count_urm = self.impressions_count_urm
+        if user >= impressions_count_urm.shape[0] or impressions_count_urm.indptr[user] == impressions_count_urm.indptr[user + 1]:
             return {}
 
-    def stackMatrixes(self, URM_train, alpha=0.825):
-        # Vertical stack so ItemIDs cardinality must coincide.
+        counts = self._get_impressions_count_array(impressions_count_urm, user, items)
+        return {int(item): int(count) for item, count in zip(items, counts)}
 
-        urm = self.csr_to_dataframe(URM_train, 'UserID', 'ItemID', 'Data')
-        f = self.load_icm_df()
-        swap_list = ["feature_id", "item_id", "data"]
-        f = f.reindex(columns=swap_list)
-        f = f.rename(
-            {'feature_id': 'UserID', 'item_id': 'ItemID', 'data': 'Data'}, axis=1)
+    def _load_icm_by_item_id(self):
+        """Load the icm keeping the ItemIDs and FeatureIDs of the csv as row and column indices
 
-        urm['Data'] = alpha * urm['Data']
-        # f times (1-aplha)
-        f['Data'] = (1-alpha) * f['Data']
-        # Change UserIDs of f matrix in order to make recommender work
-        f['UserID'] = 41634 + f['UserID']
+        Returns:
+            csr: items on rows and features on columns
+        """
+        icm = self.load_icm_df()
+        icm_csr = sps.csr_matrix((icm['data'].values, (icm['item_id'].values, icm['feature_id'].values)))
+        icm_csr.sum_duplicates()
+        return icm_csr
 
-        powerful_urm = pd.concat(
-            [urm, f], ignore_index=True).sort_values(['UserID', 'ItemID'])
-        return self.dataframe_to_csr(powerful_urm, 'UserID', 'ItemID', 'Data')
+    def get_stacked_URM(self, URM_train):
+        """Return the StackedMatrix of URM_train with the transposed icm below it, see stackMatrixes"""
+        return StackedMatrix([URM_train, self._load_icm_by_item_id().T])
+
+    def stackMatrixes(self, URM_train, alpha=0.825):
+        """Stack the transposed icm below URM_train, the features become users after the last one of URM_train
+
+        Args:
+            URM_train (csr): user rating matrix
+            alpha (float): weight of the URM, the icm is weighted (1-alpha)
+
+        Returns:
+            csr: stacked matrix
+        """
+        # Vertical stack so ItemIDs cardinality must coincide.
+        return self.get_stacked_URM(URM_train).get_matrix([alpha, 1 - alpha])
 
     def print_statistics(self):
         """ Print statistics about dataset """
         target = self.load_target()
-        interactions_and_impressions = pd.read_csv(filepath_or_buffer=os.getenv('INTERACTIONS_AND_IMPRESSIONS_PATH'),
-                                                   sep=',',
-                                                   names=[
-                                                       'UserID', 'ItemID', 'Impressions', 'Data'],
-                                                   header=0,
-                                                   dtype={'UserID': np.int32, 'ItemID': np.int32, 'Impressions': np.object0, 'Data': np.int32})
+        interactions_and_impressions = self._load_interactions_and_impressions_df()
         urm = interactions_and_impressions.drop(['Impressions'], axis=1)
         # removing duplicated (user_id,item_id) pairs
         urm = urm.drop_duplicates(keep='first')
@@ -507,10 +526,78 @@ class DataReader(object):
         print('>>> number of unique users in interactions_and_impressions that are not in "list of users that have watched at least a movie": {}'.format(
             len(np.setdiff1d(urm['UserID'].unique(), watchers_urm['UserID'].unique()))))
 
+    def build_item_id_mapping(self, URM, ICM):
+        """Set item_id_mapping to the ItemIDs with at least an entry in the columns of URM or in the rows of ICM.
+        The mapping is built by the first call only and then frozen, so that the matrices aligned by earlier calls keep
+        their item indices, later calls check that all their ItemIDs are already in it.
+
+        Args:
+            URM (csr): ItemIDs on columns
+            ICM (csr): ItemIDs on rows
+
+        Returns:
+            numpy.array: sorted ItemIDs, the position of an ItemID is its index in the aligned matrices
+        """
+        ICM = sps.csr_matrix(ICM)
+        item_ids = np.union1d(np.unique(URM.indices), np.flatnonzero(np.ediff1d(ICM.indptr)))
+
+        if self.item_id_mapping is None:
+            self.item_id_mapping = item_ids
+        else:
+            assert np.isin(item_ids, self.item_id_mapping).all(), \
+                "DataReader: ItemIDs {} are not in the item_id_mapping built by the first pad call".format(
+                    np.setdiff1d(item_ids, self.item_id_mapping))
+
+        return self.item_id_mapping
+
+    def is_item_id_mapped(self, URM, ICM):
+        """True if URM and ICM already have the len(item_id_mapping) items of the aligned matrices, e.g. the output of
+        an earlier pad call or a matrix built from it, so that their indices are positions in item_id_mapping rather
+        than ItemIDs"""
+        if self.item_id_mapping is None:
+            return False
+
+        n_items = len(self.item_id_mapping)
+        return URM.shape[1] == n_items and ICM.shape[0] == n_items
+
+    def map_item_ids(self, matrix, items_on_rows=False):
+        """Reindex the item axis of matrix, whose indices are ItemIDs, on item_id_mapping
+
+        Args:
+            matrix (csr): matrix with ItemIDs as row or column indices, all of them in item_id_mapping
+            items_on_rows (bool): True if items are on rows, as in an ICM, False if on columns, as in a URM
+
+        Returns:
+            csr: matrix with len(item_id_mapping) items, the ones without entries are empty
+        """
+        item_id_mapping = self.item_id_mapping
+        n_items = len(item_id_mapping)
+        matrix = sps.csr_matrix(matrix)
+
+        # ItemIDs already contiguous, only the shape changes
+        if item_id_mapping[-1] == n_items - 1:
+            matrix = matrix.copy()
+            matrix.resize((n_items, matrix.shape[1]) if items_on_rows else (matrix.shape[0], n_items))
+            return matrix
+
+        if items_on_rows:
+            matrix = matrix.copy()
+            matrix.resize((max(matrix.shape[0], item_id_mapping[-1] + 1), matrix.shape[1]))
+            return matrix[item_id_mapping]
+
+        # The mapping is increasing, so the remapped indices of each row stay sorted
+        return sps.csr_matrix((matrix.data.copy(), np.searchsorted(item_id_mapping, matrix.indices), matrix.indptr.copy()),
+                              shape=(matrix.shape[0], n_items))
+
+    def _drop_empty_columns(self, matrix):
+        matrix = sps.csc_matrix(matrix)
+        return sps.csr_matrix(matrix[:, np.flatnonzero(np.ediff1d(matrix.indptr))])
+
     def pad_with_zeros_ICMandURM(self, URM):
         """
         Add items present in ICM to URM and vice versa.
-        To do so, we calculate the difference between URM_train items and ICM items and add the missing items in each matrix respectively.
+        The item spaces are aligned on item_id_mapping, the union of the items of both built by the first call, by resizing
+        and reindexing the matrices. Matrices already aligned are returned as they are.
 
         Args:
             URM (csr): user rating matrix
@@ -520,30 +607,13 @@ class DataReader(object):
             ICM (csr): ICM filled with missing items present in URM but not in ICM
         """
         #print("Making augmented URM and ICM of the same shape...")
-        urm = self.csr_to_dataframe(URM, 'UserID', 'ItemID', 'Data')
-        icm = self.load_icm_df()
-        DiffURM_ICM = np.setdiff1d(
-            urm['ItemID'].unique(), icm['item_id'].unique())
-        DiffICM_URM = np.setdiff1d(
-            icm['item_id'].unique(), urm['ItemID'].unique())
-
-        for id in DiffURM_ICM:
-            icm.loc[len(icm.index)] = [id, 1, 0]
-        sorted_icm = icm.sort_values('item_id').reset_index(drop=True)
-
-        for id in DiffICM_URM:
-            urm.loc[len(urm.index)] = [1, id, 0]
-
-        sorted_urm = urm.sort_values('UserID').reset_index(drop=True)
-        URM = self.dataframe_to_csr(sorted_urm, 'UserID', 'ItemID', 'Data')
-        ICM = self.dataframe_to_csr(
-            sorted_icm, 'item_id', 'feature_id', 'data')
-        return URM, ICM
+        return self.pad_with_zeros_given_ICMandURM(self._drop_empty_columns(self._load_icm_by_item_id()), URM)
 
     def pad_with_zeros_given_ICMandURM(self, ICM, URM):
         """
         Add items present in ICM to URM and vice versa.
-        To do so, we calculate the difference between URM_train items and ICM items and add the missing items in each matrix respectively.
+        The item spaces are aligned on item_id_mapping, the union of the items of both built by the first call, by resizing
+        and reindexing the matrices. Matrices already aligned are returned as they are.
 
         Args:
             URM (csr): user rating matrix
@@ -553,27 +623,16 @@ class DataReader(object):
             ICM (csr): ICM filled with missing items present in URM but not in ICM
         """
         #print("Making augmented URM and ICM of the same shape...")
-        urm = self.csr_to_dataframe(URM, 'UserID', 'ItemID', 'Data')
-        icm = self.csr_to_dataframe(ICM, 'ItemID', 'FeatureID', 'Data')
+        URM = sps.csr_matrix(URM)
+        ICM = sps.csr_matrix(ICM)
 
-        DiffURM_ICM = np.setdiff1d(
-            urm['ItemID'].unique(), icm['ItemID'].unique())
-        DiffICM_URM = np.setdiff1d(
-            icm['ItemID'].unique(), urm['ItemID'].unique())
-
-        for id in DiffURM_ICM:
-            icm.loc[len(icm.index)] = [id, 1, 0]
-        sorted_icm = icm.sort_values('ItemID').reset_index(drop=True)
-
-        for id in DiffICM_URM:
-            urm.loc[len(urm.index)] = [1, id, 0]
-        sorted_urm = urm.sort_values('UserID').reset_index(drop=True)
-
-        URM = self.dataframe_to_csr(sorted_urm, 'UserID', 'ItemID', 'Data')
-        ICM = self.dataframe_to_csr(sorted_icm, 'ItemID', 'FeatureID', 'Data')
-        return URM, ICM
+        # Already aligned, remapping would read the positions in item_id_mapping as ItemIDs
+        if self.is_item_id_mapped(URM, ICM):
+            return URM.copy(), ICM.copy()
 
+        self.build_item_id_mapping(URM, ICM)
 
+        return self.map_item_ids(URM), self.map_item_ids(ICM, items_on_rows=True)
 
     def pad_with_zeros_given_ICM_df_and_URM_df(self, icm, urm):
         """
@@ -592,17 +651,18 @@ class DataReader(object):
         DiffICM_URM = np.setdiff1d(
             icm['ItemID'].unique(), urm['ItemID'].unique())
 
-        for id in DiffURM_ICM:
-            icm.loc[len(icm.index)] = [id, 1, 0]
-        sorted_icm = icm.sort_values('ItemID').reset_index(drop=True)
+        # Missing items are appended in bulk, as a zero entry on FeatureID 1 and on UserID 1
+        icm_padding = pd.DataFrame({icm.columns[0]: DiffURM_ICM, icm.columns[1]: 1, icm.columns[2]: 0})
+        sorted_icm = pd.concat([icm, icm_padding.astype(icm.dtypes.to_dict())], ignore_index=True)
+        sorted_icm = sorted_icm.sort_values('ItemID', kind='stable').reset_index(drop=True)
 
-        for id in DiffICM_URM:
-            urm.loc[len(urm.index)] = [1, id, 0]
-        sorted_urm = urm.sort_values('UserID').reset_index(drop=True)
+        urm_padding = pd.DataFrame({urm.columns[0]: 1, urm.columns[1]: DiffICM_URM, urm.columns[2]: 0})
+        sorted_urm = pd.concat([urm, urm_padding.astype(urm.dtypes.to_dict())], ignore_index=True)
+        sorted_urm = sorted_urm.sort_values('UserID', kind='stable').reset_index(drop=True)
 
         return sorted_urm, sorted_icm
 
-
+    @cached_loader('DATA_AUG_UCM')
     def load_aug_ucm(self):
         """Load the UCM created using URM aug and ICM
 
@@ -622,6 +682,7 @@ class DataReader(object):
     #######################################################################################################################
     #################### NEW ICM WITH IMPRESSIONS METHODS #################################################################
 
+    @cached_loader('WEIGHTED_IMPRESSIONS_ICM')
     def load_weighted_impressions_ICM(self):
         data_icm_type = pd.read_csv(filepath_or_buffer=os.getenv('WEIGHTED_IMPRESSIONS_ICM'),
                                     sep=',',
@@ -632,6 +693,7 @@ class DataReader(object):
 
         return self.dataframe_to_csr(data_icm_type, 'ItemID', 'FeatureID', 'Data')
 
+    @cached_loader('BINARY_IMPRESSIONS_ICM')
     def load_binary_impressions_ICM(self):
         data_icm_type = pd.read_csv(filepath_or_buffer=os.getenv('BINARY_IMPRESSIONS_ICM'),
                                     sep=',',
@@ -642,6 +704,7 @@ class DataReader(object):
 
         return self.dataframe_to_csr(data_icm_type, 'ItemID', 'FeatureID', 'Data')
 
+    @cached_loader('BINARY_IMPRESSIONS_ICM', 'DATA_ICM_TYPE_PATH')
     def load_ICM_stacked_with_binary_impressions(self, icm_weigth=0.7):
         # Vertical stack so ItemIDs cardinality must coincide.
         binary_impressions_icm = self.csr_to_dataframe(
@@ -673,6 +736,7 @@ class DataReader(object):
                 binary_impressions_icm['FeatureID']
             return self.dataframe_to_csr(binary_impressions_icm, 'ItemID', 'FeatureID', 'Data')
 
+    @cached_loader('WEIGHTED_IMPRESSIONS_ICM', 'DATA_ICM_TYPE_PATH')
     def load_ICM_stacked_with_weighted_impressions(self, icm_weight=0.8):
         # Vertical stack so ItemIDs cardinality must coincide.
 
@@ -695,6 +759,7 @@ class DataReader(object):
                                      ignore_index=True).sort_values(['ItemID', 'FeatureID'])
         return self.dataframe_to_csr(stacked_matrixes, 'ItemID', 'FeatureID', 'Data')
 
+    @cached_loader('WEIGHTED_IMPRESSIONS_ICM', 'DATA_ICM_TYPE_PATH')
     def load_ICM_stacked_with_weighted_impressions_df(self, icm_weight=0.8):
         # Vertical stack so ItemIDs cardinality must coincide.
 
@@ -722,42 +787,7 @@ class DataReader(object):
             Given URM_train_aug, returns super_powerful_urm that stack URM and ICM_stacked_with_binary_impressions.T
         """
         # Vertical stack so ItemIDs cardinality must coincide.
-
-        urm = self.csr_to_dataframe(URM_train, 'UserID', 'ItemID', 'Data')
-        ICM_stacked_with_binary_impressions = self.csr_to_dataframe(
-            ICM, 'ItemID', 'FeatureID', 'Data')
-
-        # Transpose ICM
-        swap_list = ["FeatureID", "ItemID", "Data"]
-        ICM_stacked_with_binary_impressions = ICM_stacked_with_binary_impressions.reindex(
-            columns=swap_list)
-        ICM_stacked_with_binary_impressions = ICM_stacked_with_binary_impressions.rename(
-            {'FeatureID': 'UserID', 'ItemID': 'ItemID', 'Data': 'Data'}, axis=1)
-
-        # Adjust URM and ICM weights
-        urm['Data'] = alpha * urm['Data']
-        # f times (1-aplha)
-        ICM_stacked_with_binary_impressions['Data'] = (
-            1-alpha) * ICM_stacked_with_binary_impressions['Data']
-        # Change UserIDs of f matrix in order to make recommender work
-        ICM_stacked_with_binary_impressions['UserID'] = 41634 + \
-            ICM_stacked_with_binary_impressions['UserID']
-        '''
-        impressionURM = pd.read_csv(filepath_or_buffer=os.getenv('IMPRESSIONS_URM'),
-                                                    sep=',',
-                                                    names=[
-                                                        'UserID', 'ItemID', 'Data'],
-                                                    header=0,
-                                                    dtype={'UserID': np.int32, 'ItemID': np.int32, 'Data': np.int32})
-        # removing duplicated (user_id,item_id) pairs
-        impressionURM = impressionURM.drop_duplicates(keep='first')
-
-        impressionURM['Data']= 0.15 * impressionURM['Data']
-        '''
-        super_powerful_urm = pd.concat(
-            [urm, ICM_stacked_with_binary_impressions], ignore_index=True).sort_values(['UserID', 'ItemID'])
-
-        return self.dataframe_to_csr(super_powerful_urm, 'UserID', 'ItemID', 'Data')
+        return StackedMatrix([URM_train, ICM.T]).get_matrix([alpha, 1 - alpha])
 
     def load_super_powerful_URM_df(self, urm, ICM_stacked_with_weighted_impressions, alpha=0.825):
         """
@@ -786,9 +816,15 @@ class DataReader(object):
 
         return super_powerful_urm
 
-    def load_URM_super_pow_and_ICM_stacked_with_weighted_impressions(self, URM_train,icm_weight_in_impressions,urm_weight):
-        URM_train_df = self.csr_to_dataframe(URM_train,'UserID','ItemID','Data')
-        ICM_stacked_with_weighted_impressions_df = self.load_ICM_stacked_with_weighted_impressions_df(icm_weight_in_impressions)
-        URM_train_df_padded, ICM_stacked_with_weighted_impressions_df_padded = self.pad_with_zeros_given_ICM_df_and_URM_df(ICM_stacked_with_weighted_impressions_df,URM_train_df)
-        URM_super_pow_df = self.load_super_powerful_URM_df(URM_train_df_padded,ICM_stacked_with_weighted_impressions_df_padded,urm_weight)
-        return self.dataframe_to_csr(URM_super_pow_df,'UserID','ItemID','Data')
\ No newline at end of file
+    def get_URM_super_pow_stack(self, URM_train):
+        """Return the StackedMatrix of URM_train with the transposed icm and weighted impressions icm below it,
+        to be weighted with get_URM_super_pow_weights"""
+        return StackedMatrix([URM_train, self._load_icm_by_item_id().T, self.load_weighted_impressions_ICM().T])
+
+    @staticmethod
+    def get_URM_super_pow_weights(icm_weight_in_impressions, urm_weight):
+        """Weights of the blocks of get_URM_super_pow_stack, as in load_ICM_stacked_with_weighted_impressions and load_super_powerful_URM"""
+        return [urm_weight, (1 - urm_weight) * icm_weight_in_impressions, (1 - urm_weight) * (1 - icm_weight_in_impressions)]
+
+    def load_URM_super_pow_and_ICM_stacked_with_weighted_impressions(self, URM_train, icm_weight_in_impressions, urm_weight):
+        return self.get_URM_super_pow_stack(URM_train).get_matrix(self.get_URM_super_pow_weights(icm_weight_in_impressions, urm_weight))
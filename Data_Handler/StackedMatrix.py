@@ -0,0 +1,59 @@
+import numpy as np
+import scipy.sparse as sps
+
+
+class StackedMatrix(object):
+    """
+    Vertical stack of sparse blocks sharing the same item columns, for instance a URM with the transposed ICM below it.
+
+    The structure is built once with scipy.sparse.vstack from the unweighted blocks, get_matrix then returns
+    the stack with each block multiplied by its own weight by rescaling a copy of the data array only.
+    The first row of each block is given by row_offsets, so the rows of the blocks below the URM start right
+    after its last user whatever the shape of the URM.
+    """
+
+    def __init__(self, blocks, dtype=np.float64):
+        """
+        Args:
+            blocks (list): sparse matrices with items on columns, from the top to the bottom of the stack.
+                Blocks with fewer columns are padded with empty items on the right
+            dtype (numpy dtype): dtype of the data of the stacked matrix
+        """
+        n_items = max(block.shape[1] for block in blocks)
+
+        csr_blocks = []
+        for block in blocks:
+            block = sps.csr_matrix(block, dtype=dtype, copy=True)
+            block.sum_duplicates()
+            block.resize((block.shape[0], n_items))
+            csr_blocks.append(block)
+
+        self.n_blocks = len(csr_blocks)
+        self.row_offsets = np.cumsum([0] + [block.shape[0] for block in csr_blocks])
+
+        stacked = sps.vstack(csr_blocks, format="csr", dtype=dtype)
+
+        self.shape = stacked.shape
+        self.indices = stacked.indices
+        self.indptr = stacked.indptr
+        self.unweighted_data = stacked.data
+
+        # The blocks occupy contiguous rows, hence contiguous slices of the data array
+        self.block_nnz = np.diff(self.indptr[self.row_offsets])
+
+    def get_matrix(self, weights):
+        """Return the stacked matrix with the data of each block multiplied by its weight
+
+        Args:
+            weights (list): one weight per block
+
+        Returns:
+            csr: stacked matrix
+        """
+        if len(weights) != self.n_blocks:
+            raise ValueError("Expected {} weights, one per block, got {}".format(self.n_blocks, len(weights)))
+
+        data = self.unweighted_data * np.repeat(np.asarray(weights, dtype=self.unweighted_data.dtype), self.block_nnz)
+
+        # The structure is copied so that in place changes of the returned matrix do not alter the stack
+        return sps.csr_matrix((data, self.indices.copy(), self.indptr.copy()), shape=self.shape)
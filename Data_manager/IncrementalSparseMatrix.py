@@ -7,6 +7,8 @@ Created on 09/09/2018
 """
 
 
+import numpy as np
+import pandas as pd
 import scipy.sparse as sps
 
 class IncrementalSparseMatrix_ListBased(object):
@@ -36,13 +38,11 @@ class IncrementalSparseMatrix_ListBased(object):
         assert len(row_list_to_add) == len(col_list_to_add) and len(row_list_to_add) == len(data_list_to_add),\
             "IncrementalSparseMatrix: element lists must have different length"
 
+        row_index_array, col_index_array, data_array = self._map_data_lists(row_list_to_add, col_list_to_add, data_list_to_add)
 
-        col_list_index = [self._get_column_index(column_id) for column_id in col_list_to_add]
-        row_list_index = [self._get_row_index(row_id) for row_id in row_list_to_add]
-
-        self._row_list.extend(row_list_index)
-        self._col_list.extend(col_list_index)
-        self._data_list.extend(data_list_to_add)
+        self._row_list.extend(row_index_array.tolist())
+        self._col_list.extend(col_index_array.tolist())
+        self._data_list.extend(data_array.tolist())
 
 
 
@@ -51,12 +51,43 @@ class IncrementalSparseMatrix_ListBased(object):
 
         n_elements = len(col_list)
 
-        col_list_index = [self._get_column_index(column_id) for column_id in col_list]
-        row_index = self._get_row_index(row_id)
+        self.add_data_lists([row_id] * n_elements, col_list, [data] * n_elements)
+
+
+
+    def _get_index_array(self, id_list, auto_create_mapper, get_index):
+        """
+        Maps a list of IDs to indices in bulk, calling get_index once per distinct ID in order of first appearance,
+        so new IDs receive the same indices they would receive one element at a time. IDs get_index maps to None are -1
+        """
+
+        if not auto_create_mapper:
+            return np.asarray(id_list, dtype=np.int64)
 
-        self._row_list.extend([row_index] * n_elements)
-        self._col_list.extend(col_list_index)
-        self._data_list.extend([data] * n_elements)
+        codes, unique_ids = pd.factorize(np.asarray(id_list))
+
+        unique_index = [get_index(unique_id) for unique_id in unique_ids.tolist()]
+        unique_index = np.array([-1 if index is None else index for index in unique_index], dtype=np.int64)
+
+        return unique_index[codes]
+
+
+
+    def _map_data_lists(self, row_list_to_add, col_list_to_add, data_list_to_add):
+        """
+        Returns the row and column indices and the data of the elements to add, without those whose row or column is ignored
+        """
+
+        row_index_array = self._get_index_array(row_list_to_add, self._auto_create_row_mapper, self._get_row_index)
+        col_index_array = self._get_index_array(col_list_to_add, self._auto_create_column_mapper, self._get_column_index)
+        data_array = np.asarray(data_list_to_add)
+
+        valid_mask = (row_index_array >= 0) & (col_index_array >= 0)
+
+        if not valid_mask.all():
+            return row_index_array[valid_mask], col_index_array[valid_mask], data_array[valid_mask]
+
+        return row_index_array, col_index_array, data_array
 
 
 
@@ -151,86 +182,118 @@ class IncrementalSparseMatrix_ListBased(object):
 
 
 
-import numpy as np
-
-
-
 class IncrementalSparseMatrix(IncrementalSparseMatrix_ListBased):
+    """
+    Stores the elements in typed numpy buffers that double their size when full, so adding n elements costs
+    amortized O(n) and the buffers never hold more than twice the elements added, plus the initial block.
+    IDs are mapped in bulk, once per distinct ID of each call.
+    """
 
-    def __init__(self, auto_create_col_mapper = False, auto_create_row_mapper = False, n_rows = None, n_cols = None, dtype = np.float64):
+    def __init__(self, auto_create_col_mapper = False, auto_create_row_mapper = False, n_rows = None, n_cols = None, dtype = np.float64,
+                 initial_data_block = 100000):
 
         super(IncrementalSparseMatrix, self).__init__(auto_create_col_mapper = auto_create_col_mapper,
                                                              auto_create_row_mapper = auto_create_row_mapper,
                                                              n_rows = n_rows,
                                                              n_cols = n_cols)
 
-        self._dataBlock = 10000000
         self._next_cell_pointer = 0
 
         self._dtype_data = dtype
-        self._dtype_coordinates = np.uint32
+        self._dtype_coordinates = np.int32
         self._max_value_of_coordinate_dtype = np.iinfo(self._dtype_coordinates).max
 
-        self._row_array = np.zeros(self._dataBlock, dtype=self._dtype_coordinates)
-        self._col_array = np.zeros(self._dataBlock, dtype=self._dtype_coordinates)
-        self._data_array = np.zeros(self._dataBlock, dtype=self._dtype_data)
+        self._row_array = np.zeros(initial_data_block, dtype=self._dtype_coordinates)
+        self._col_array = np.zeros(initial_data_block, dtype=self._dtype_coordinates)
+        self._data_array = np.zeros(initial_data_block, dtype=self._dtype_data)
 
 
     def get_nnz(self):
         return self._next_cell_pointer
 
 
-    def add_data_lists(self, row_list_to_add, col_list_to_add, data_list_to_add):
+    def _ensure_capacity(self, n_elements_to_add):
 
-        assert len(row_list_to_add) == len(col_list_to_add) and len(row_list_to_add) == len(data_list_to_add),\
-            "IncrementalSparseMatrix: element lists must have the same length"
+        required_size = self._next_cell_pointer + n_elements_to_add
 
-        for data_point_index in range(len(row_list_to_add)):
+        if required_size <= len(self._row_array):
+            return
 
-            if self._next_cell_pointer == len(self._row_array):
-                self._row_array = np.concatenate((self._row_array, np.zeros(self._dataBlock, dtype=self._dtype_coordinates)))
-                self._col_array = np.concatenate((self._col_array, np.zeros(self._dataBlock, dtype=self._dtype_coordinates)))
-                self._data_array = np.concatenate((self._data_array, np.zeros(self._dataBlock, dtype=self._dtype_data)))
+        new_size = max(required_size, 2*len(self._row_array))
 
+        for array_name in ["_row_array", "_col_array", "_data_array"]:
+            old_array = getattr(self, array_name)
+            new_array = np.zeros(new_size, dtype=old_array.dtype)
+            new_array[:self._next_cell_pointer] = old_array[:self._next_cell_pointer]
+            setattr(self, array_name, new_array)
 
-            row_index = self._get_row_index(row_list_to_add[data_point_index])
-            col_index = self._get_column_index(col_list_to_add[data_point_index])
 
-            self._row_array[self._next_cell_pointer] = row_index
-            self._col_array[self._next_cell_pointer] = col_index
-            self._data_array[self._next_cell_pointer] = data_list_to_add[data_point_index]
+    def _append_arrays(self, row_index_array, col_index_array, data_array):
 
-            self._next_cell_pointer += 1
+        n_elements = len(row_index_array)
 
+        if n_elements == 0:
+            return
 
+        max_coordinate = max(row_index_array.max(), col_index_array.max())
 
+        if max_coordinate > self._max_value_of_coordinate_dtype:
+            # Only for matrices with more than 2^31 rows or columns
+            self._dtype_coordinates = np.int64
+            self._max_value_of_coordinate_dtype = np.iinfo(self._dtype_coordinates).max
+            self._row_array = self._row_array.astype(self._dtype_coordinates)
+            self._col_array = self._col_array.astype(self._dtype_coordinates)
 
-    def add_single_row(self, row_index, col_list, data = 1.0):
+        self._ensure_capacity(n_elements)
 
-        n_elements = len(col_list)
+        end_pointer = self._next_cell_pointer + n_elements
 
-        self.add_data_lists([row_index] * n_elements,
-                            col_list,
-                            [data] * n_elements)
+        self._row_array[self._next_cell_pointer:end_pointer] = row_index_array
+        self._col_array[self._next_cell_pointer:end_pointer] = col_index_array
+        self._data_array[self._next_cell_pointer:end_pointer] = data_array
 
+        self._next_cell_pointer = end_pointer
 
 
+    def add_data_lists(self, row_list_to_add, col_list_to_add, data_list_to_add):
+
+        assert len(row_list_to_add) == len(col_list_to_add) and len(row_list_to_add) == len(data_list_to_add),\
+            "IncrementalSparseMatrix: element lists must have the same length"
+
+        self._append_arrays(*self._map_data_lists(row_list_to_add, col_list_to_add, data_list_to_add))
+
+
+    def add_single_row(self, row_id, col_list, data = 1.0):
+
+        row_index = self._get_index_array([row_id], self._auto_create_row_mapper, self._get_row_index)[0]
+        col_index_array = self._get_index_array(col_list, self._auto_create_column_mapper, self._get_column_index)
+
+        if row_index < 0:
+            return
+
+        col_index_array = col_index_array[col_index_array >= 0]
+
+        self._append_arrays(np.full(len(col_index_array), row_index, dtype=np.int64),
+                            col_index_array,
+                            np.full(len(col_index_array), data, dtype=self._dtype_data))
 
 
     def get_SparseMatrix(self):
 
+        row_array = self._row_array[:self._next_cell_pointer]
+        col_array = self._col_array[:self._next_cell_pointer]
+        data_array = self._data_array[:self._next_cell_pointer]
+
         if self._n_rows is None:
-            self._n_rows = self._row_array.max() + 1
+            self._n_rows = row_array.max() + 1 if self._next_cell_pointer > 0 else 0
 
         if self._n_cols is None:
-            self._n_cols = self._col_array.max() + 1
+            self._n_cols = col_array.max() + 1 if self._next_cell_pointer > 0 else 0
 
         shape = (self._n_rows, self._n_cols)
 
-        sparseMatrix = sps.csr_matrix((self._data_array[:self._next_cell_pointer],
-                                       (self._row_array[:self._next_cell_pointer], self._col_array[:self._next_cell_pointer])),
-                                      shape=shape,
-                                      dtype=self._dtype_data)
+        # The buffers are already of an index dtype scipy accepts, so the only conversion is the one to CSR
+        sparseMatrix = sps.coo_matrix((data_array, (row_array, col_array)), shape=shape).tocsr()
 
         sparseMatrix.eliminate_zeros()
 
@@ -340,34 +403,6 @@ class IncrementalSparseMatrix_FilterIDs(IncrementalSparseMatrix):
 
 
 
-    def add_data_lists(self, row_list_to_add, col_list_to_add, data_list_to_add):
-
-        assert len(row_list_to_add) == len(col_list_to_add) and len(row_list_to_add) == len(data_list_to_add),\
-            "IncrementalSparseMatrix: element lists must have different length"
-
-
-        for data_point_index in range(len(row_list_to_add)):
-
-            if self._next_cell_pointer == len(self._row_array):
-                self._row_array = np.concatenate((self._row_array, np.zeros(self._dataBlock, dtype=self._dtype_coordinates)))
-                self._col_array = np.concatenate((self._col_array, np.zeros(self._dataBlock, dtype=self._dtype_coordinates)))
-                self._data_array = np.concatenate((self._data_array, np.zeros(self._dataBlock, dtype=self._dtype_data)))
-
-
-            row_index = self._get_row_index(row_list_to_add[data_point_index])
-            col_index = self._get_column_index(col_list_to_add[data_point_index])
-
-
-            if row_index is not None and col_index is not None:
-
-                self._row_array[self._next_cell_pointer] = row_index
-                self._col_array[self._next_cell_pointer] = col_index
-                self._data_array[self._next_cell_pointer] = data_list_to_add[data_point_index]
-
-                self._next_cell_pointer += 1
-
-
-
     def get_SparseMatrix(self):
 
         # Set fixed dimension len to ensure that the matrix is not smaller than the number of entries in the dictionary
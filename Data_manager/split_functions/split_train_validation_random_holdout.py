@@ -8,78 +8,105 @@ Created on 23/04/2019
 
 import numpy as np
 import scipy.sparse as sps
-from Data_manager.IncrementalSparseMatrix import IncrementalSparseMatrix
 
 
-def split_train_in_two_percentage_user_wise(URM_train, train_percentage = 0.1, verbose = False):
+def _select_interactions(URM, mask):
     """
-    The function splits an URM in two matrices selecting the number of interactions one user at a time
-    :param URM_train:
-    :param train_percentage:
-    :param verbose:
+    Returns the csr matrix with the interactions of URM, a canonical csr matrix, whose mask is True
+    :param URM:
+    :param mask: boolean array aligned with URM.data
     :return:
     """
 
-    assert train_percentage >= 0.0 and train_percentage<=1.0, "train_percentage must be a value between 0.0 and 1.0, provided was '{}'".format(train_percentage)
+    n_rows, n_cols = URM.shape
+    rows = np.repeat(np.arange(n_rows), np.ediff1d(URM.indptr))
 
-    from Data_manager.IncrementalSparseMatrix import IncrementalSparseMatrix
+    indptr = np.zeros(n_rows + 1, dtype=URM.indptr.dtype)
+    np.cumsum(np.bincount(rows[mask], minlength=n_rows), out=indptr[1:])
 
-    # ensure to use csr matrix or we get big problem
-    URM_train = URM_train.tocsr()
+    selected = sps.csr_matrix((URM.data[mask].astype(np.float64), URM.indices[mask], indptr), shape=(n_rows, n_cols))
+    selected.eliminate_zeros()
 
+    return selected
 
-    num_users, num_items = URM_train.shape
 
-    URM_train_builder = IncrementalSparseMatrix(n_rows=num_users, n_cols=num_items, auto_create_col_mapper=False, auto_create_row_mapper=False)
-    URM_validation_builder = IncrementalSparseMatrix(n_rows=num_users, n_cols=num_items, auto_create_col_mapper=False, auto_create_row_mapper=False)
+def _rank_within_rows(URM, sort_keys, unit_interval_keys = False):
+    """
+    Returns for each interaction its position in its row when the row is sorted by ascending sort_keys
+    :param URM: canonical csr matrix
+    :param sort_keys: array aligned with URM.data
+    :param unit_interval_keys: True if sort_keys are already in [0, 1), as random keys, which saves a sort
+    :return:
+    """
 
-    user_no_item_train = 0
-    user_no_item_validation = 0
+    profile_length = np.ediff1d(URM.indptr)
+    rows = np.repeat(np.arange(URM.shape[0]), profile_length)
 
-    for user_id in range(URM_train.shape[0]):
+    # Replacing the keys by their global rank scaled in [0, 1) and adding the row makes a single argsort
+    # order the interactions of each row by key while keeping the rows contiguous, much faster than a lexsort
+    if unit_interval_keys:
+        scaled_key_rank = sort_keys
+    else:
+        scaled_key_rank = np.empty(URM.nnz, dtype=np.float64)
+        scaled_key_rank[np.argsort(sort_keys, kind="stable")] = np.arange(URM.nnz) / max(URM.nnz, 1)
 
-        start_pos = URM_train.indptr[user_id]
-        end_pos = URM_train.indptr[user_id+1]
+    order = np.argsort(rows + scaled_key_rank)
 
+    rank = np.empty(URM.nnz, dtype=np.int64)
+    rank[order] = np.arange(URM.nnz) - np.repeat(URM.indptr[:-1], profile_length)
 
-        user_profile_items = URM_train.indices[start_pos:end_pos]
-        user_profile_ratings = URM_train.data[start_pos:end_pos]
-        user_profile_length = len(user_profile_items)
+    return rank
 
-        n_train_items = round(user_profile_length*train_percentage)
 
-        if n_train_items == len(user_profile_items) and n_train_items > 1:
-            n_train_items -= 1
+def split_train_in_two_percentage_user_wise(URM_train, train_percentage = 0.1, verbose = False, seed = None):
+    """
+    The function splits an URM in two matrices selecting the number of interactions one user at a time
+    :param URM_train:
+    :param train_percentage:
+    :param verbose:
+    :param seed: if not None the split is drawn from its own RandomState and is reproducible, otherwise from the global numpy one
+    :return:
+    """
 
-        indices_for_sampling = np.arange(0, user_profile_length, dtype=np.int)
-        np.random.shuffle(indices_for_sampling)
+    assert train_percentage >= 0.0 and train_percentage<=1.0, "train_percentage must be a value between 0.0 and 1.0, provided was '{}'".format(train_percentage)
 
-        train_items = user_profile_items[indices_for_sampling[0:n_train_items]]
-        train_ratings = user_profile_ratings[indices_for_sampling[0:n_train_items]]
+    # ensure to use csr matrix or we get big problem
+    URM_train = sps.csr_matrix(URM_train)
+    if not URM_train.has_canonical_format:
+        URM_train = URM_train.copy()
+        URM_train.sum_duplicates()
 
-        validation_items = user_profile_items[indices_for_sampling[n_train_items:]]
-        validation_ratings = user_profile_ratings[indices_for_sampling[n_train_items:]]
+    num_users, num_items = URM_train.shape
 
-        if len(train_items) == 0:
-            if verbose: print("User {} has 0 train items".format(user_id))
-            user_no_item_train += 1
+    random_state = np.random if seed is None else np.random.RandomState(seed)
 
-        if len(validation_items) == 0:
-            if verbose: print("User {} has 0 validation items".format(user_id))
-            user_no_item_validation += 1
+    # Shuffling each profile is equivalent to ranking its interactions by a random key
+    rank = _rank_within_rows(URM_train, random_state.random_sample(URM_train.nnz), unit_interval_keys = True)
 
+    user_profile_length = np.ediff1d(URM_train.indptr)
+    n_train_items = np.round(user_profile_length*train_percentage).astype(np.int64)
+    n_train_items[(n_train_items == user_profile_length) & (n_train_items > 1)] -= 1
 
-        URM_train_builder.add_data_lists([user_id]*len(train_items), train_items, train_ratings)
-        URM_validation_builder.add_data_lists([user_id]*len(validation_items), validation_items, validation_ratings)
+    train_mask = rank < np.repeat(n_train_items, user_profile_length)
+
+    no_item_train = n_train_items == 0
+    no_item_validation = n_train_items == user_profile_length
+
+    if verbose:
+        for user_id in np.flatnonzero(no_item_train):
+            print("User {} has 0 train items".format(user_id))
+        for user_id in np.flatnonzero(no_item_validation):
+            print("User {} has 0 validation items".format(user_id))
+
+    user_no_item_train = no_item_train.sum()
+    user_no_item_validation = no_item_validation.sum()
 
     if user_no_item_train != 0:
         print("Warning: {} ({:.2f} %) of {} users have no train items".format(user_no_item_train, user_no_item_train/num_users*100, num_users))
     if user_no_item_validation != 0:
         print("Warning: {} ({:.2f} %) of {} users have no sampled items".format(user_no_item_validation, user_no_item_validation/num_users*100, num_users))
 
-    URM_train = URM_train_builder.get_SparseMatrix()
-    URM_validation = URM_validation_builder.get_SparseMatrix()
-
+    URM_train, URM_validation = _select_interactions(URM_train, train_mask), _select_interactions(URM_train, ~train_mask)
 
     return URM_train, URM_validation
 
@@ -87,52 +114,33 @@ def split_train_in_two_percentage_user_wise(URM_train, train_percentage = 0.1, v
 
 
 
-
-def split_train_in_two_percentage_global_sample(URM_all, train_percentage = 0.1):
+def split_train_in_two_percentage_global_sample(URM_all, train_percentage = 0.1, seed = None):
     """
     The function splits an URM in two matrices selecting the number of interactions globally
     :param URM_all:
     :param train_percentage:
-    :param verbose:
+    :param seed: if not None the split is drawn from its own RandomState and is reproducible, otherwise from the global numpy one
     :return:
     """
 
     assert train_percentage >= 0.0 and train_percentage<=1.0, "train_percentage must be a value between 0.0 and 1.0, provided was '{}'".format(train_percentage)
 
-
-    from Data_manager.IncrementalSparseMatrix import IncrementalSparseMatrix
+    URM_all = sps.csr_matrix(URM_all)
+    if not URM_all.has_canonical_format:
+        URM_all = URM_all.copy()
+        URM_all.sum_duplicates()
 
     num_users, num_items = URM_all.shape
 
-    URM_train_builder = IncrementalSparseMatrix(n_rows=num_users, n_cols=num_items, auto_create_col_mapper=False, auto_create_row_mapper=False)
-    URM_validation_builder = IncrementalSparseMatrix(n_rows=num_users, n_cols=num_items, auto_create_col_mapper=False, auto_create_row_mapper=False)
-
-
-    URM_train = sps.coo_matrix(URM_all)
-
-    indices_for_sampling = np.arange(0, URM_all.nnz, dtype=np.int)
-    np.random.shuffle(indices_for_sampling)
+    random_state = np.random if seed is None else np.random.RandomState(seed)
 
     n_train_interactions = round(URM_all.nnz * train_percentage)
 
-    indices_for_train = indices_for_sampling[indices_for_sampling[0:n_train_interactions]]
-    indices_for_validation = indices_for_sampling[indices_for_sampling[n_train_interactions:]]
+    train_mask = np.zeros(URM_all.nnz, dtype=bool)
+    train_mask[random_state.permutation(URM_all.nnz)[:n_train_interactions]] = True
 
-
-    URM_train_builder.add_data_lists(URM_train.row[indices_for_train],
-                                     URM_train.col[indices_for_train],
-                                     URM_train.data[indices_for_train])
-
-    URM_validation_builder.add_data_lists(URM_train.row[indices_for_validation],
-                                          URM_train.col[indices_for_validation],
-                                          URM_train.data[indices_for_validation])
-
-
-    URM_train = URM_train_builder.get_SparseMatrix()
-    URM_validation = URM_validation_builder.get_SparseMatrix()
-
-    URM_train = sps.csr_matrix(URM_train)
-    URM_validation = sps.csr_matrix(URM_validation)
+    URM_train = _select_interactions(URM_all, train_mask)
+    URM_validation = _select_interactions(URM_all, ~train_mask)
 
     user_no_item_train = np.sum(np.ediff1d(URM_train.indptr) == 0)
     user_no_item_validation = np.sum(np.ediff1d(URM_validation.indptr) == 0)
@@ -144,7 +152,3 @@ def split_train_in_two_percentage_global_sample(URM_all, train_percentage = 0.1)
 
 
     return URM_train, URM_validation
-
-
-
-
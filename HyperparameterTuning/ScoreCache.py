@@ -0,0 +1,140 @@
+"""
+Disk cache of score blocks, used to tune the weights of hybrids built on frozen recommenders.
+
+During a weight search every trial asks the base recommenders for the scores of the same validation users,
+in the same blocks, while only the mixing weights change. ScoreCache stores each block the first time it is
+computed as a .npy file and returns it memory-mapped on the following trials, so a trial costs a weighted sum
+plus the top-k selection of the evaluator.
+
+It can be given as score_cache to LinearHybrid, which then caches the normalized scores of each recommender,
+or it can back a CachedScoreRecommender that wraps a single base recommender of any other hybrid.
+"""
+
+import os
+import shutil
+import hashlib
+
+import numpy as np
+
+
+class ScoreCache(object):
+    """
+    Dict-like cache of score blocks of shape (n_users, n_items), stored in folder_path.
+
+    Blocks are stored either in full, with the given dtype (float16 halves the disk and page cache footprint),
+    or, if top_n is given, as the top_n highest scores of each row and their item indices. In the latter case the
+    scores of the items outside the top_n of a row are returned as 0, which is an approximation that makes
+    the cache size independent of the number of items.
+
+    The entries are not invalidated when the recommenders change, use a new folder or call clear() after refitting them,
+    except for those of LinearHybrid, whose keys include a fingerprint of each model.
+    """
+
+    def __init__(self, folder_path, dtype=np.float32, top_n=None):
+        self.folder_path = folder_path if folder_path[-1] == "/" else folder_path + "/"
+        self.dtype = np.dtype(dtype)
+        self.top_n = top_n
+
+        if not os.path.exists(self.folder_path):
+            os.makedirs(self.folder_path, exist_ok=True)
+
+    def _get_file_name_root(self, key):
+        return self.folder_path + hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+    def __contains__(self, key):
+        return os.path.exists(self._get_file_name_root(key) + "_scores.npy")
+
+    def get(self, key, default=None):
+        """Return the block stored under key, memory-mapped and read-only if stored in full, or default if missing"""
+
+        file_name_root = self._get_file_name_root(key)
+
+        if not os.path.exists(file_name_root + "_scores.npy"):
+            return default
+
+        scores = np.load(file_name_root + "_scores.npy", mmap_mode="r")
+
+        if not os.path.exists(file_name_root + "_items.npy"):
+            return scores
+
+        # Top-n block, scatter it back into a dense one
+        items = np.load(file_name_root + "_items.npy")
+        n_items = int(np.load(file_name_root + "_shape.npy")[1])
+
+        item_scores = np.zeros((items.shape[0], n_items), dtype=np.float32)
+        np.put_along_axis(item_scores, items, scores, axis=1)
+        return item_scores
+
+    def __getitem__(self, key):
+        item_scores = self.get(key)
+        if item_scores is None:
+            raise KeyError(key)
+        return item_scores
+
+    def __setitem__(self, key, item_scores):
+
+        item_scores = np.asarray(item_scores)
+        file_name_root = self._get_file_name_root(key)
+        temp_file_name_root = "{}_temp_{}".format(file_name_root, os.getpid())
+
+        if self.top_n is None or self.top_n >= item_scores.shape[1]:
+            np.save(temp_file_name_root + "_scores.npy", item_scores.astype(self.dtype, copy=False))
+
+        else:
+            items = np.argpartition(-item_scores, self.top_n - 1, axis=1)[:, :self.top_n].astype(np.int32)
+            np.save(temp_file_name_root + "_items.npy", items)
+            np.save(temp_file_name_root + "_shape.npy", np.array(item_scores.shape, dtype=np.int64))
+            np.save(temp_file_name_root + "_scores.npy", np.take_along_axis(item_scores, items, axis=1).astype(self.dtype, copy=False))
+            os.replace(temp_file_name_root + "_items.npy", file_name_root + "_items.npy")
+            os.replace(temp_file_name_root + "_shape.npy", file_name_root + "_shape.npy")
+
+        # The scores file is the one checked by get, it is moved last so that a block is never read half written
+        os.replace(temp_file_name_root + "_scores.npy", file_name_root + "_scores.npy")
+
+    def clear(self):
+        """Remove every block of the cache"""
+        shutil.rmtree(self.folder_path, ignore_errors=True)
+        os.makedirs(self.folder_path, exist_ok=True)
+
+
+class CachedScoreRecommender(object):
+    """
+    Wraps a fitted recommender so that the scores it computes without items_to_compute are stored in a ScoreCache
+    and read back when the same users are requested again. Every other attribute is the one of the wrapped recommender,
+    so it can replace it as a base model of any hybrid.
+
+    The name identifies the recommender in the cache and must differ among the recommenders sharing the same cache,
+    by default it is the RECOMMENDER_NAME.
+    """
+
+    def __init__(self, recommender, score_cache, name=None):
+        self.recommender = recommender
+        self.score_cache = score_cache
+        self.name = recommender.RECOMMENDER_NAME if name is None else name
+
+    def __getattr__(self, attribute_name):
+        # Only called for attributes not found on the wrapper itself
+        if attribute_name == "recommender":
+            raise AttributeError(attribute_name)
+        return getattr(self.recommender, attribute_name)
+
+    def _compute_item_score(self, user_id_array, items_to_compute=None):
+
+        user_id_array = np.atleast_1d(user_id_array)
+
+        if items_to_compute is not None:
+            return self.recommender._compute_item_score(user_id_array, items_to_compute)
+
+        key = (self.name, hashlib.sha1(np.ascontiguousarray(user_id_array, dtype=np.int64).tobytes()).hexdigest())
+
+        item_scores = self.score_cache.get(key)
+
+        if item_scores is None:
+            item_scores = self.recommender._compute_item_score(user_id_array)
+            self.score_cache[key] = item_scores
+
+        # Always a private float32 copy, the hybrids normalize the scores in place
+        return np.array(item_scores, dtype=np.float32)
+
+    def _compute_item_score_per_user(self, user_id, items_to_compute=None):
+        return self._compute_item_score(np.atleast_1d(user_id), items_to_compute)
@@ -8,6 +8,7 @@
 import numpy as np
 from Recommenders.DataIO import DataIO
 from Recommenders.Recommender_utils import check_matrix
+from Data_Handler.DataReader import DataReader
 
 
 class CustomBaseRecommender(object):
@@ -21,6 +22,9 @@ class CustomBaseRecommender(object):
 
         self.URM_train = check_matrix(URM_train.copy(), 'csr', dtype=np.float32)
 
+        # Built from the URM given here on the first call of get_URM_super_pow, fit replaces URM_train with the stacked one
+        self.URM_super_pow_stack = None
+
         '''
 
         self.URM_train = check_matrix(URM_train.copy(), 'csr', dtype=np.float32)
@@ -91,6 +95,14 @@ class CustomBaseRecommender(object):
     def fit(self):
         pass
 
+    def get_URM_super_pow(self, icm_weight_in_impressions, urm_weight):
+        """Return the URM given to the constructor stacked with the icm and the weighted impressions icm,
+        the structure is built once and only reweighted on the following calls"""
+        if self.URM_super_pow_stack is None:
+            self.URM_super_pow_stack = DataReader().get_URM_super_pow_stack(self.URM_train)
+
+        return self.URM_super_pow_stack.get_matrix(DataReader.get_URM_super_pow_weights(icm_weight_in_impressions, urm_weight))
+
     def get_URM_train(self):
         return self.URM_train.copy()
 
@@ -14,7 +14,6 @@ import numpy as np
 
 from Recommenders.Similarity.Compute_Similarity import Compute_Similarity
 
-from Data_Handler.DataReader import DataReader
 
 class CustomItemKNNCFRecommender(CustomBaseItemSimilarityMatrixRecommender):
     """ ItemKNN recommender"""
@@ -35,7 +34,7 @@ class CustomItemKNNCFRecommender(CustomBaseItemSimilarityMatrixRecommender):
         alpha: represents the weight that is given to URM, while (1-alpha) is the weight for the ICM (plain ICM + impressions)
         '''
         ########## START OF MODIFIED CODE @engpap #################
-        URM_train_super_pow =  DataReader().load_URM_super_pow_and_ICM_stacked_with_weighted_impressions(self.URM_train, icm_weight_in_impressions, urm_weight)
+        URM_train_super_pow =  self.get_URM_super_pow(icm_weight_in_impressions, urm_weight)
         super(CustomItemKNNCFRecommender, self).post_init(URM_train_super_pow, verbose = True)
         ########## END OF MODIFIED CODE @engpap #################
 
@@ -15,7 +15,6 @@ from Recommenders.Custom.CustomBaseSimilarityMatrixRecommender import CustomBase
 from Recommenders.Similarity.Compute_Similarity_Python import Incremental_Similarity_Builder
 import time, sys
 
-from Data_Handler.DataReader import DataReader
 
 
 
@@ -36,7 +35,7 @@ class CustomP3alphaRecommender(CustomBaseItemSimilarityMatrixRecommender):
     def fit(self,icm_weight_in_impressions=0.8, urm_weight=0.825, topK=118, alpha=1.2848441164609243, min_rating=0, implicit=False, normalize_similarity=True):
 
         ########## START OF MODIFIED CODE @engpap #################
-        URM_train_super_pow =  DataReader().load_URM_super_pow_and_ICM_stacked_with_weighted_impressions(self.URM_train, icm_weight_in_impressions, urm_weight)
+        URM_train_super_pow =  self.get_URM_super_pow(icm_weight_in_impressions, urm_weight)
         super(CustomP3alphaRecommender, self).post_init(URM_train_super_pow, verbose = True)
         ########## END OF MODIFIED CODE @engpap #################
 
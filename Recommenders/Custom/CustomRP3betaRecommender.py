@@ -11,7 +11,6 @@ from sklearn.preprocessing import normalize
 from Recommenders.Recommender_utils import check_matrix, similarityMatrixTopK
 from Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
 
-from Data_Handler.DataReader import DataReader
 from Recommenders.Custom.CustomBaseSimilarityMatrixRecommender import CustomBaseItemSimilarityMatrixRecommender
 from Recommenders.Similarity.Compute_Similarity_Python import Incremental_Similarity_Builder
 import time, sys
@@ -34,7 +33,7 @@ class CustomRP3betaRecommender(CustomBaseItemSimilarityMatrixRecommender):
     def fit(self,icm_weight_in_impressions=0.8, urm_weight=0.825, topK=82, alpha=0.6951524535062256, beta=0.39985511876562174, min_rating=0,  implicit=False, normalize_similarity=True):
 
          ########## START OF MODIFIED CODE @engpap #################
-        URM_train_super_pow =  DataReader().load_URM_super_pow_and_ICM_stacked_with_weighted_impressions(self.URM_train, icm_weight_in_impressions, urm_weight)
+        URM_train_super_pow =  self.get_URM_super_pow(icm_weight_in_impressions, urm_weight)
         super(CustomRP3betaRecommender, self).post_init(URM_train_super_pow, verbose = True)
         ########## END OF MODIFIED CODE @engpap #################
 
@@ -17,7 +17,6 @@ from tqdm import tqdm
 from sklearn.utils._testing import ignore_warnings
 from sklearn.exceptions import ConvergenceWarning
 
-from Data_Handler.DataReader import DataReader
 
 # os.environ["PYTHONWARNINGS"] = ('ignore::exceptions.ConvergenceWarning:sklearn.linear_model')
 # os.environ["PYTHONWARNINGS"] = ('ignore:Objective did not converge:ConvergenceWarning:')
@@ -46,7 +45,7 @@ class CustomSLIMElasticNetRecommender(CustomBaseItemSimilarityMatrixRecommender)
     def fit(self, icm_weight_in_impressions=0.8, urm_weight=0.8,l1_ratio=0.007467817120176792, alpha = 0.0016779515713674044, positive_only=True, topK = 723):
         
         ########## START OF MODIFIED CODE @engpap #################
-        URM_train_super_pow =  DataReader().load_URM_super_pow_and_ICM_stacked_with_weighted_impressions(self.URM_train, icm_weight_in_impressions, urm_weight)
+        URM_train_super_pow =  self.get_URM_super_pow(icm_weight_in_impressions, urm_weight)
         super(CustomSLIMElasticNetRecommender, self).post_init(URM_train_super_pow, verbose = True)
         ########## END OF MODIFIED CODE @engpap #################
 
@@ -8,7 +8,6 @@ Created on 23/10/17
 
 from Recommenders.Recommender_utils import check_matrix
 from Recommenders.Custom.CustomBaseSimilarityMatrixRecommender import CustomBaseUserSimilarityMatrixRecommender
-from Data_Handler.DataReader import DataReader
 
 from Recommenders.IR_feature_weighting import okapi_BM_25, TF_IDF
 import numpy as np
@@ -31,7 +30,7 @@ class CustomUserKNNCFRecommender(CustomBaseUserSimilarityMatrixRecommender):
     def fit(self, icm_weight_in_impressions=0.8, urm_weight=0.825,topK=1214, shrink=938.0611833211633, similarity='cosine', normalize=True, feature_weighting = "TF-IDF", URM_bias = False, **similarity_args):
 
         ########## START OF MODIFIED CODE @engpap #################
-        URM_train_super_pow =  DataReader().load_URM_super_pow_and_ICM_stacked_with_weighted_impressions(self.URM_train, icm_weight_in_impressions, urm_weight)
+        URM_train_super_pow =  self.get_URM_super_pow(icm_weight_in_impressions, urm_weight)
         super(CustomUserKNNCFRecommender, self).post_init(URM_train_super_pow, verbose = True)
         ########## END OF MODIFIED CODE @engpap #################
 
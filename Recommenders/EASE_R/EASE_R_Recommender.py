@@ -9,11 +9,311 @@ Created on 23/10/17
 from Recommenders.BaseSimilarityMatrixRecommender import BaseItemSimilarityMatrixRecommender
 from Recommenders.Recommender_utils import similarityMatrixTopK, check_matrix
 from Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
+from Utils.get_peak_memory_MB import get_peak_memory_MB
 from sklearn.preprocessing import normalize
+from scipy.linalg import lapack, eigh
+from threadpoolctl import threadpool_limits
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import time
 import scipy.sparse as sps
 
+
+def _dense_gram_matrix(URM_train, block_size):
+    """Return the dense float32 X^t X computed one block of rows at a time, without the whole sparse product"""
+    URM_train = check_matrix(URM_train, format='csr', dtype=np.float32)
+    URM_train_T = check_matrix(URM_train.T, format='csr', dtype=np.float32)
+
+    n_items = URM_train.shape[1]
+    gram_matrix = np.empty((n_items, n_items), dtype=np.float32)
+
+    for start_row in range(0, n_items, block_size):
+        end_row = min(start_row + block_size, n_items)
+        gram_matrix[start_row:end_row] = URM_train_T[start_row:end_row].dot(URM_train).toarray()
+
+    return gram_matrix
+
+
+def _cholesky_inverse_inplace(matrix):
+    """
+    Invert a symmetric positive definite float32 matrix in its own memory with the LAPACK Cholesky factorization
+    and inversion, spotrf and spotri. The matrix is passed transposed, which is Fortran ordered and identical
+    since it is symmetric, so LAPACK does not copy it. Only the upper triangle of the result is valid.
+    """
+    cholesky_factor, info = lapack.spotrf(matrix.T, lower=1, overwrite_a=1, clean=0)
+
+    if info > 0:
+        raise np.linalg.LinAlgError("Gram matrix is not positive definite, leading minor of order {} is not, increase l2_norm".format(info))
+
+    inverse, info = lapack.spotri(cholesky_factor, lower=1, overwrite_c=1)
+
+    if info > 0:
+        raise np.linalg.LinAlgError("Gram matrix is singular, element {} of the Cholesky factor is zero".format(info))
+
+    assert np.shares_memory(inverse, matrix), "LAPACK copied the matrix, check it is a C contiguous float32 array"
+
+
+def _symmetrize_from_upper_inplace(matrix, block_size):
+    """Copy the upper triangle of a square matrix on the lower one, one block of rows at a time"""
+    n_rows = matrix.shape[0]
+
+    for start_row in range(0, n_rows, block_size):
+        end_row = min(start_row + block_size, n_rows)
+
+        matrix[start_row:end_row, :start_row] = matrix[:start_row, start_row:end_row].T
+
+        diagonal_block = matrix[start_row:end_row, start_row:end_row]
+        lower_indices = np.tril_indices(end_row - start_row, k=-1)
+        diagonal_block[lower_indices] = diagonal_block.T[lower_indices]
+
+
+def _EASE_weights_rows(P_rows, P_diagonal_rows, row_items):
+    """
+    Turn the rows row_items of the inverse P of the regularized Gram matrix into the same rows of the
+    transposed EASE weights B^t, in place. Since P is symmetric row j of B^t, column j of B = P / -diag(P),
+    is row j of P divided by -P[j, j], with zero on the diagonal.
+    """
+    P_rows /= -P_diagonal_rows[:, None]
+    P_rows[np.arange(P_rows.shape[0]), row_items] = 0.0
+
+    return P_rows
+
+
+def _top_k_rows_idx(B_rows, topK):
+    """Return the column indices of the topK values with the largest absolute value of each row, in no particular order"""
+    return np.argpartition(-np.abs(B_rows), topK-1, axis=1)[:, :topK]
+
+
+def _keep_top_k_rows_inplace(B_rows, topK):
+    """Set to zero all but the topK values with the largest absolute value of each row"""
+    top_k_idx = _top_k_rows_idx(B_rows, topK)
+    top_k_values = np.take_along_axis(B_rows, top_k_idx, axis=1)
+    B_rows[:] = 0.0
+    np.put_along_axis(B_rows, top_k_idx, top_k_values, axis=1)
+
+
+def _inverse_to_EASE_weights_inplace(P, topK, block_size):
+    """
+    Turn the inverse P of the regularized Gram matrix into the EASE weights, keeping only the topK values with the
+    largest absolute value of each column when topK is not None. Columns are processed in blocks so that only a
+    block of columns is copied.
+    """
+    n_items = P.shape[0]
+    P_diagonal = P.diagonal().copy()
+
+    for start_col in range(0, n_items, block_size):
+        end_col = min(start_col + block_size, n_items)
+
+        B_T_rows = _EASE_weights_rows(P[:, start_col:end_col].T.copy(), P_diagonal[start_col:end_col], np.arange(start_col, end_col))
+
+        if topK is not None and topK < n_items:
+            _keep_top_k_rows_inplace(B_T_rows, topK)
+
+        P[:, start_col:end_col] = B_T_rows.T
+
+
+def _inverse_to_EASE_weights_rows(P, columns, topK, block_size):
+    """
+    Yield the EASE weights of the given columns computed from the inverse P of the regularized Gram matrix, which
+    is left unchanged, as blocks of (block_columns, B^t rows of block_columns pruned to topK when it is not None).
+    P is symmetric, so the rows of B^t are computed from rows of P, which are contiguous.
+    """
+    n_items = P.shape[0]
+    P_diagonal = P.diagonal()
+
+    for start in range(0, len(columns), block_size):
+        block_columns = columns[start:start + block_size]
+        B_T_rows = _EASE_weights_rows(P[block_columns], P_diagonal[block_columns], block_columns)
+
+        if topK is not None and topK < n_items:
+            _keep_top_k_rows_inplace(B_T_rows, topK)
+
+        yield block_columns, B_T_rows
+
+
+def _woodbury_update_inplace(P, items, U, C, block_size):
+    """
+    Update in place the inverse P of the regularized Gram matrix G after G[items, items] += U C U^t, with the
+    Sherman-Morrison-Woodbury identity written so that C need not be invertible:
+        P' = P - Y^t (I + C U^t P_SS U)^-1 C Y        where Y = U^t P[items], P_SS = P[items, items]
+    U is None for the identity. The small system is solved in float64, P is updated in float32 one block of rows
+    at a time. This costs O(n_items^2 * rank) with rank the number of columns of U, instead of the O(n_items^3)
+    of a new inversion.
+
+    Returns:
+        array: the columns of P that changed, those with a nonzero value in the rows items
+    """
+    n_items = P.shape[0]
+
+    # P is symmetric, its rows are the transposed columns
+    P_S_T = P[items]
+    Y = P_S_T if U is None else U.T.astype(np.float32).dot(P_S_T)
+    Y_U = Y[:, items].astype(np.float64)
+    if U is not None:
+        Y_U = Y_U.dot(U)
+
+    M = np.linalg.solve(np.eye(len(C)) + C.dot(Y_U), C)
+    M_Y = M.astype(np.float32).dot(Y)
+
+    for start_row in range(0, n_items, block_size):
+        end_row = min(start_row + block_size, n_items)
+        P[start_row:end_row] -= Y[:, start_row:end_row].T.dot(M_Y)
+
+    return np.flatnonzero(np.any(P_S_T != 0, axis=0))
+
+
+def _eigen_to_EASE_weights(eigenvalues, eigenvectors, l2_norm, topK, block_size):
+    """
+    EASE weights of l2_norm from the eigendecomposition V diag(eigenvalues) V^t of the Gram matrix, whose
+    regularized inverse is P = V diag(1 / (eigenvalues + l2_norm)) V^t. P is computed one block of rows at a time.
+
+    Returns:
+        csr matrix, or a dense array when topK is None
+    """
+    n_items = eigenvectors.shape[0]
+    inverse_eigenvalues = (1.0 / (eigenvalues + l2_norm)).astype(eigenvectors.dtype)
+
+    W_dense = np.empty((n_items, n_items), dtype=np.float32) if topK is None else None
+    top_k_rows_idx, top_k_rows_values = [], []
+
+    for start_row in range(0, n_items, block_size):
+        end_row = min(start_row + block_size, n_items)
+
+        scaled_eigenvectors_rows = eigenvectors[start_row:end_row] * inverse_eigenvalues
+        P_diagonal_rows = np.einsum("ij,ij->i", scaled_eigenvectors_rows, eigenvectors[start_row:end_row])
+
+        B_T_rows = _EASE_weights_rows(scaled_eigenvectors_rows.dot(eigenvectors.T), P_diagonal_rows, np.arange(start_row, end_row))
+
+        if W_dense is not None:
+            W_dense[:, start_row:end_row] = B_T_rows.T
+        else:
+            top_k_idx = _top_k_rows_idx(B_T_rows, min(topK, n_items))
+            top_k_rows_idx.append(top_k_idx)
+            top_k_rows_values.append(np.take_along_axis(B_T_rows, top_k_idx, axis=1))
+
+    if W_dense is not None:
+        return W_dense
+
+    return _top_k_rows_to_EASE_weights(np.concatenate(top_k_rows_idx), np.concatenate(top_k_rows_values))
+
+
+def _top_k_rows_to_EASE_weights(top_k_idx, top_k_values):
+    """
+    csr EASE weights B from the n_items x topK arrays of row indices and values of each column of B, that is of
+    each row of B^t, without the zeros
+    """
+    n_items = top_k_idx.shape[0]
+    B_T = sps.csr_matrix((top_k_values.ravel(), top_k_idx.ravel(), np.arange(0, top_k_idx.size + 1, top_k_idx.shape[1])),
+                         shape=(n_items, n_items), dtype=np.float32)
+    B_T.eliminate_zeros()
+
+    return B_T.T.tocsr()
+
+
+def _select_columns_topK(W, topK, block_size):
+    """
+    Keep the topK values with the largest absolute value of each column of the EASE weights W of a larger topK,
+    csr or a dense array when that topK was None. The columns of a csr W have few values, they are laid as the rows
+    of a dense array as wide as the longest column and the topK of all of them are selected at once.
+
+    Returns:
+        csr matrix
+    """
+    n_items = W.shape[0]
+    topK = min(topK, n_items)
+
+    if not sps.issparse(W):
+        top_k_rows_idx, top_k_rows_values = [], []
+
+        for start_col in range(0, n_items, block_size):
+            B_T_rows = W[:, start_col:min(start_col + block_size, n_items)].T
+            top_k_idx = _top_k_rows_idx(B_T_rows, topK)
+            top_k_rows_idx.append(top_k_idx)
+            top_k_rows_values.append(np.take_along_axis(B_T_rows, top_k_idx, axis=1))
+
+        return _top_k_rows_to_EASE_weights(np.concatenate(top_k_rows_idx), np.concatenate(top_k_rows_values))
+
+    B_T = sps.csr_matrix(W.T)
+    column_nnz = np.diff(B_T.indptr)
+    longest_column = column_nnz.max(initial=0)
+
+    if longest_column <= topK:
+        return sps.csr_matrix(W, copy=True)
+
+    position_in_column = np.arange(B_T.nnz) - np.repeat(B_T.indptr[:-1], column_nnz)
+    B_T_rows = sps.csr_matrix((B_T.data, position_in_column, B_T.indptr), shape=(n_items, longest_column)).toarray()
+
+    top_k_positions = _top_k_rows_idx(B_T_rows, topK)
+    top_k_values = np.take_along_axis(B_T_rows, top_k_positions, axis=1)
+
+    # Positions past the end of a column hold padding zeros, which are removed, clip them to a valid index
+    top_k_idx = B_T.indices[np.minimum(B_T.indptr[:-1, None] + top_k_positions, max(B_T.nnz - 1, 0))]
+
+    return _top_k_rows_to_EASE_weights(top_k_idx, top_k_values)
+
+
+def compute_score_dense_tiles(user_profile_array, W_dense, items_to_compute=None, out=None, topK=None,
+                              tile_size=256, n_threads=1, blas_threads=1):
+    """
+    Scores user_profile_array.dot(W_dense) in float32 for tiles of tile_size users, so that only the product of one
+    tile per thread is held besides the output. The sparse-dense product releases the GIL, the tiles run on a pool of
+    n_threads threads while the BLAS pools are limited to blas_threads threads each, to avoid oversubscribing the cores.
+    Items not in items_to_compute get -inf.
+
+    Args:
+        user_profile_array (csr_matrix): profiles of the users to score
+        W_dense (np.ndarray): items x items float32 weights
+        out (np.ndarray): float32 users x items buffer the scores are written into, allocated if None
+        topK (int): if not None only the topK items of each user are returned, the full scores are never allocated
+
+    Returns:
+        out, or (item_ids, scores) of shape users x topK sorted by decreasing score when topK is given
+    """
+    user_profile_array = check_matrix(user_profile_array, format='csr', dtype=np.float32)
+    n_users, n_items = user_profile_array.shape[0], W_dense.shape[1]
+
+    if items_to_compute is not None:
+        items_not_computed = np.ones(n_items, dtype=bool)
+        items_not_computed[items_to_compute] = False
+
+    if topK is None:
+        if out is None:
+            out = np.empty((n_users, n_items), dtype=np.float32)
+
+        assert out.shape == (n_users, n_items) and out.dtype == np.float32 and out.flags.c_contiguous, \
+            "out must be a C contiguous float32 array of shape {}".format((n_users, n_items))
+    else:
+        topK = min(topK, n_items)
+        top_item_ids = np.empty((n_users, topK), dtype=np.int32)
+        top_scores = np.empty((n_users, topK), dtype=np.float32)
+
+    def score_tile(start_user):
+        end_user = min(start_user + tile_size, n_users)
+        tile_scores = user_profile_array[start_user:end_user].dot(W_dense)
+
+        if items_to_compute is not None:
+            tile_scores[:, items_not_computed] = -np.inf
+
+        if topK is None:
+            out[start_user:end_user] = tile_scores
+        else:
+            tile_item_ids = np.argpartition(-tile_scores, topK-1, axis=1)[:, :topK]
+            tile_top_scores = np.take_along_axis(tile_scores, tile_item_ids, axis=1)
+            ranking = np.argsort(-tile_top_scores, axis=1)
+            top_item_ids[start_user:end_user] = np.take_along_axis(tile_item_ids, ranking, axis=1)
+            top_scores[start_user:end_user] = np.take_along_axis(tile_top_scores, ranking, axis=1)
+
+    with threadpool_limits(limits=blas_threads, user_api="blas"):
+        if n_threads > 1 and n_users > tile_size:
+            with ThreadPoolExecutor(max_workers=n_threads) as executor:
+                list(executor.map(score_tile, range(0, n_users, tile_size)))
+        else:
+            for start_user in range(0, n_users, tile_size):
+                score_tile(start_user)
+
+    return out if topK is None else (top_item_ids, top_scores)
+
+
 class EASE_R_Recommender(BaseItemSimilarityMatrixRecommender):
     """ EASE_R_Recommender
 
@@ -49,9 +349,35 @@ class EASE_R_Recommender(BaseItemSimilarityMatrixRecommender):
     def __init__(self, URM_train, sparse_threshold_quota = None, verbose = True):
         super(EASE_R_Recommender, self).__init__(URM_train, verbose = verbose)
         self.sparse_threshold_quota = sparse_threshold_quota
-
-    def fit(self, topK=373, l2_norm = 111.12863230985445, normalize_matrix = False):
+        self.P = None
+        self._eigendecomposition = None
+        self.set_score_threads()
+
+    def set_score_threads(self, n_threads = 1, blas_threads = 1, tile_size = 256):
+        """Threads and tile size used to score a dense W_sparse, see compute_score_dense_tiles"""
+        self.score_n_threads = n_threads
+        self.score_blas_threads = blas_threads
+        self.score_tile_size = tile_size
+
+    def fit(self, topK=373, l2_norm = 111.12863230985445, normalize_matrix = False, solver = "cholesky", block_size = 1000,
+            keep_inverse = False):
+        """
+        The "cholesky" solver works in float32 and in place: the dense Gram matrix is factorized and inverted in
+        its own memory, then scaled and pruned to topK in blocks of block_size columns, so the peak memory is about
+        one dense items x items float32 matrix. The "inverse" solver is the float64 np.linalg.inv of the original
+        implementation, which holds several dense float64 copies.
+        With keep_inverse the inverse of the Gram matrix is kept in P for update, which needs a second dense
+        items x items float32 matrix.
+        """
 #with augmented: topk = 792 l2_norm =128
+        assert solver in ["cholesky", "inverse"], "{}: solver must be 'cholesky' or 'inverse', provided value was {}".format(self.RECOMMENDER_NAME, solver)
+        assert not keep_inverse or (solver == "cholesky" and not normalize_matrix), \
+            "{}: keep_inverse requires solver 'cholesky' and no normalize_matrix".format(self.RECOMMENDER_NAME)
+
+        self.topK = topK
+        self.block_size = block_size
+        self.P = None
+
         start_time = time.time()
         self._print("Fitting model... ")
 
@@ -61,36 +387,56 @@ class EASE_R_Recommender(BaseItemSimilarityMatrixRecommender):
             self.URM_train = normalize(self.URM_train, norm='l2', axis=0)
             self.URM_train = sps.csr_matrix(self.URM_train)
 
+        if solver == "cholesky":
+            # Grahm matrix is X^t X, compute dot product
+            B = _dense_gram_matrix(self.URM_train, block_size)
+
+            diag_indices = np.diag_indices(B.shape[0])
+            B[diag_indices] += l2_norm
+
+            _cholesky_inverse_inplace(B)
+            _symmetrize_from_upper_inplace(B, block_size)
+
+            if keep_inverse:
+                self.P = B
+                B = np.empty_like(self.P)
 
-        # Grahm matrix is X^t X, compute dot product
-        grahm_matrix = self.URM_train.T.dot(self.URM_train).toarray()
+                for block_columns, B_T_rows in _inverse_to_EASE_weights_rows(self.P, np.arange(B.shape[0]), topK, block_size):
+                    B[:, block_columns] = B_T_rows.T
+            else:
+                _inverse_to_EASE_weights_inplace(B, topK, block_size)
 
-        diag_indices = np.diag_indices(grahm_matrix.shape[0])
-        grahm_matrix[diag_indices] += l2_norm
+        else:
+            # Grahm matrix is X^t X, compute dot product
+            grahm_matrix = self.URM_train.T.dot(self.URM_train).toarray()
+
+            diag_indices = np.diag_indices(grahm_matrix.shape[0])
+            grahm_matrix[diag_indices] += l2_norm
+
+            P = np.linalg.inv(grahm_matrix)
 
-        P = np.linalg.inv(grahm_matrix)
+            B = P / (-np.diag(P))
 
-        B = P / (-np.diag(P))
+            B[diag_indices] = 0.0
 
-        B[diag_indices] = 0.0
+            # B contains positive and negative values, so topK is selected based on the *absolute* value to preserve strong negatives
+            if topK is not None:
+                B = similarityMatrixTopK(B, k = topK, use_absolute_values = True, verbose = False)
 
 
         new_time_value, new_time_unit = seconds_to_biggest_unit(time.time()-start_time)
-        self._print("Fitting model... done in {:.2f} {}".format( new_time_value, new_time_unit))
+        peak_memory = get_peak_memory_MB()
+        self._print("Fitting model... done in {:.2f} {}, peak memory {}".format(new_time_value, new_time_unit,
+                    "{:.0f} MB".format(peak_memory) if peak_memory is not None else "not available"))
 
         # Check if the matrix should be saved in a sparse or dense format
         # The matrix is sparse, regardless of the presence of the topK, if nonzero cells are less than sparse_threshold_quota %
-        # B contains positive and negative values, so topK is selected based on the *absolute* value to preserve strong negatives
-        if topK is not None:
-            B = similarityMatrixTopK(B, k = topK, use_absolute_values = True, verbose = False)
-
-
         if self._is_content_sparse_check(B):
             self._print("Detected model matrix to be sparse, changing format.")
-            self.W_sparse = check_matrix(B, format='csr', dtype=np.float32)
+            self.W_sparse = check_matrix(sps.csr_matrix(B), format='csr', dtype=np.float32)
 
         else:
-            self.W_sparse = check_matrix(B, format='npy', dtype=np.float32)
+            self.W_sparse = B if isinstance(B, np.ndarray) and B.dtype == np.float32 else check_matrix(B, format='npy', dtype=np.float32)
             self._W_sparse_format_checked = True
             self._compute_item_score = self._compute_score_W_dense
         #
@@ -105,6 +451,165 @@ class EASE_R_Recommender(BaseItemSimilarityMatrixRecommender):
         #     self.W_sparse = sps.csr_matrix(self.W_sparse)
 
 
+    def update(self, URM_delta):
+        """
+        Add URM_delta to URM_train and update the model fitted with keep_inverse without refitting it.
+        The Gram matrix changes only among the items S of the users U whose rows changed, by
+        X'_U[:, S]^t X'_U[:, S] - X_U[:, S]^t X_U[:, S], the inverse P is updated with the Woodbury identity,
+        see _woodbury_update_inplace, and the weights are computed again only for the columns of P that changed.
+        The update has rank r = min(2 |U|, |S|) and costs O(n_items^2 * r) plus the weights of the changed columns,
+        which are usually most of them since P is dense. When r approaches n_items a new fit is cheaper.
+
+        Args:
+            URM_delta (sparse matrix): interactions to add, same shape as URM_train
+        """
+        assert self.P is not None, "{}: update requires a model fitted with keep_inverse".format(self.RECOMMENDER_NAME)
+        assert URM_delta.shape == self.URM_train.shape, "{}: URM_delta has shape {}, URM_train has shape {}".format(
+            self.RECOMMENDER_NAME, URM_delta.shape, self.URM_train.shape)
+
+        start_time = time.time()
+
+        URM_delta = check_matrix(URM_delta, format='csr', dtype=np.float32)
+        URM_train = check_matrix(self.URM_train, format='csr', dtype=np.float32)
+        URM_train_new = check_matrix(URM_train + URM_delta, format='csr', dtype=np.float32)
+
+        changed_users = np.flatnonzero(np.ediff1d(URM_delta.indptr))
+        URM_users_old = URM_train[changed_users]
+        URM_users_new = URM_train_new[changed_users]
+        items = np.union1d(URM_users_old.indices, URM_users_new.indices)
+
+        self.URM_train = URM_train_new
+        self._URM_train_format_checked = False
+
+        if len(items) == 0:
+            return
+
+        URM_users_old = URM_users_old[:, items].toarray().astype(np.float64)
+        URM_users_new = URM_users_new[:, items].toarray().astype(np.float64)
+
+        # The change of the Gram matrix is X'_U^t X'_U - X_U^t X_U, of rank at most twice the changed users
+        if 2*len(changed_users) < len(items):
+            U = np.vstack([URM_users_new, URM_users_old]).T
+            C = np.diag(np.concatenate([np.ones(len(changed_users)), -np.ones(len(changed_users))]))
+        else:
+            U = None
+            C = URM_users_new.T.dot(URM_users_new) - URM_users_old.T.dot(URM_users_old)
+
+        changed_columns = _woodbury_update_inplace(self.P, items, U, C, self.block_size)
+
+        if sps.issparse(self.W_sparse):
+            W_sparse = self.W_sparse.tocoo()
+            is_kept = ~np.isin(W_sparse.col, changed_columns)
+            rows, cols, values = [W_sparse.row[is_kept]], [W_sparse.col[is_kept]], [W_sparse.data[is_kept]]
+
+            for block_columns, B_T_rows in _inverse_to_EASE_weights_rows(self.P, changed_columns, self.topK, self.block_size):
+                block_rows, block_items = np.nonzero(B_T_rows)
+                rows.append(block_items)
+                cols.append(block_columns[block_rows])
+                values.append(B_T_rows[block_rows, block_items])
+
+            self.W_sparse = sps.csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+                                           shape=self.W_sparse.shape, dtype=np.float32)
+
+        else:
+            for block_columns, B_T_rows in _inverse_to_EASE_weights_rows(self.P, changed_columns, self.topK, self.block_size):
+                self.W_sparse[:, block_columns] = B_T_rows.T
+
+        new_time_value, new_time_unit = seconds_to_biggest_unit(time.time()-start_time)
+        self._print("Updated {} users, {} items, {} weight columns in {:.2f} {}".format(
+            len(changed_users), len(items), len(changed_columns), new_time_value, new_time_unit))
+
+
+    def _get_gram_eigendecomposition(self, normalize_matrix, block_size, keep_eigendecomposition):
+        """
+        Eigenvalues and eigenvectors of the Gram matrix of URM_train, normalized if normalize_matrix. With
+        keep_eigendecomposition they are kept on the recommender and returned by the next calls on the same
+        URM_train and normalize_matrix, which skip the O(n_items^3) eigh, fit with normalize_matrix and update
+        replace URM_train.
+        """
+        if self._eigendecomposition is not None:
+            URM_train, eigen_normalize_matrix, eigenvalues, eigenvectors = self._eigendecomposition
+
+            if URM_train is self.URM_train and eigen_normalize_matrix == normalize_matrix:
+                self._print("Eigendecomposition of the Gram matrix already available")
+                return eigenvalues, eigenvectors
+
+        # Release the previous eigenvectors before computing the new ones
+        self._eigendecomposition = None
+
+        start_time = time.time()
+        URM_train = self.URM_train
+
+        if normalize_matrix:
+            # Normalize rows and then columns
+            URM_train = normalize(URM_train, norm='l2', axis=1)
+            URM_train = normalize(URM_train, norm='l2', axis=0)
+            URM_train = sps.csr_matrix(URM_train)
+
+        gram_matrix = _dense_gram_matrix(URM_train, block_size)
+        eigenvalues, eigenvectors = eigh(gram_matrix, overwrite_a=True, check_finite=False, driver="evd")
+        del gram_matrix
+
+        # The Gram matrix is positive semidefinite, negative eigenvalues are rounding errors
+        eigenvalues = np.maximum(eigenvalues, 0.0)
+
+        if keep_eigendecomposition:
+            self._eigendecomposition = (self.URM_train, normalize_matrix, eigenvalues, eigenvectors)
+
+        new_time_value, new_time_unit = seconds_to_biggest_unit(time.time()-start_time)
+        self._print("Eigendecomposition done in {:.2f} {}".format(new_time_value, new_time_unit))
+
+        return eigenvalues, eigenvectors
+
+
+    def fit_l2_sweep(self, l2_norms, topK=373, normalize_matrix = False, block_size = 1000, topKs = None,
+                     keep_eigendecomposition = True):
+        """
+        Fit the models of several l2_norm values from a single eigendecomposition of the Gram matrix, see
+        _eigen_to_EASE_weights. Each model then costs a product with the eigenvectors instead of a Gram product
+        and an inversion, and it is pruned to topK one block of columns at a time.
+        The eigenvectors are a dense items x items float32 matrix, with keep_eigendecomposition they stay on the
+        recommender so that the next calls, e.g. the steps of a search over l2_norm, skip the eigendecomposition.
+        With topKs the models of the largest topK are computed from the eigenvectors and those of the smaller ones
+        are selected from them, see _select_columns_topK.
+        The recommender is left unchanged, to evaluate one of the models assign it to W_sparse.
+
+        Args:
+            l2_norms (list): values of l2_norm sharing topK
+            topKs (list): values of topK, used instead of topK
+
+        Returns:
+            dict: W_sparse of each l2_norm, or of each (l2_norm, topK) with topKs, csr or a dense array when topK is None
+        """
+
+        start_time = time.time()
+        self._print("Fitting {} models... ".format(len(l2_norms) * (1 if topKs is None else len(topKs))))
+
+        eigenvalues, eigenvectors = self._get_gram_eigendecomposition(normalize_matrix, block_size, keep_eigendecomposition)
+
+        # None keeps all the values, so it is the largest topK
+        largest_topK = topK if topKs is None else None if None in topKs else max(topKs)
+
+        W_sparse_dict = {}
+
+        for l2_norm in l2_norms:
+            W_sparse = _eigen_to_EASE_weights(eigenvalues, eigenvectors, l2_norm, largest_topK, block_size)
+
+            if topKs is None:
+                W_sparse_dict[l2_norm] = W_sparse
+                continue
+
+            for topK in topKs:
+                W_sparse_dict[(l2_norm, topK)] = W_sparse if topK == largest_topK else _select_columns_topK(W_sparse, topK, block_size)
+
+        new_time_value, new_time_unit = seconds_to_biggest_unit(time.time()-start_time)
+        peak_memory = get_peak_memory_MB()
+        self._print("Fitting {} models... done in {:.2f} {}, peak memory {}".format(len(W_sparse_dict), new_time_value, new_time_unit,
+                    "{:.0f} MB".format(peak_memory) if peak_memory is not None else "not available"))
+
+        return W_sparse_dict
+
+
     def _is_content_sparse_check(self, matrix):
 
         if self.sparse_threshold_quota is None:
@@ -119,26 +624,22 @@ class EASE_R_Recommender(BaseItemSimilarityMatrixRecommender):
 
 
 
-    def _compute_score_W_dense(self, user_id_array, items_to_compute = None):
+    def _compute_score_W_dense(self, user_id_array, items_to_compute = None, out = None, topK = None):
         """
-        URM_train and W_sparse must have the same format, CSR
+        Scores of a dense W_sparse computed by tiles of users, see compute_score_dense_tiles
         :param user_id_array:
         :param items_to_compute:
+        :param out: float32 users x items buffer the scores are written into, allocated if None
+        :param topK: if not None return (item_ids, scores) of the topK items of each user instead
         :return:
         """
 
         self._check_format()
 
-        user_profile_array = self.URM_train[user_id_array]
-
-        if items_to_compute is not None:
-            item_scores = - np.ones((len(user_id_array), self.URM_train.shape[1]), dtype=np.float32)*np.inf
-            item_scores_all = user_profile_array.dot(self.W_sparse)#.toarray()
-            item_scores[:, items_to_compute] = item_scores_all[:, items_to_compute]
-        else:
-            item_scores = user_profile_array.dot(self.W_sparse)#.toarray()
-
-        return item_scores
+        return compute_score_dense_tiles(self.URM_train[user_id_array], self.W_sparse,
+                                         items_to_compute = items_to_compute, out = out, topK = topK,
+                                         tile_size = self.score_tile_size, n_threads = self.score_n_threads,
+                                         blas_threads = self.score_blas_threads)
 
 
 
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import numpy as np
+import scipy.sparse as sps
+
+from Recommenders.EASE_R.EASE_R_Recommender import EASE_R_Recommender
+
+
+def get_random_URM(n_users=300, n_items=120, density=0.05, seed=42):
+
+    rng = np.random.default_rng(seed)
+
+    URM = sps.csr_matrix(rng.random((n_users, n_items)) < density, dtype=np.float32)
+    URM.data[:] = 1.0
+
+    return URM
+
+
+def to_dense(W_sparse):
+    return W_sparse.toarray() if sps.issparse(W_sparse) else np.asarray(W_sparse)
+
+
+class MyTestCase(unittest.TestCase):
+
+    def assertWeightsClose(self, W_control, W_local, topK, message):
+
+        W_control = to_dense(W_control)
+        W_local = to_dense(W_local)
+
+        if topK is None:
+            self.assertTrue(np.allclose(W_control, W_local, atol=1e-5), message)
+
+        else:
+            self.assertTrue(np.all(np.count_nonzero(W_local, axis=0) <= topK), message)
+
+            # Values almost equal to the K-th one of their column may be swapped by rounding
+            common_support = (W_control != 0) & (W_local != 0)
+            self.assertTrue(np.allclose(W_control[common_support], W_local[common_support], atol=1e-5), message)
+            self.assertLessEqual(np.count_nonzero((W_control != 0) != (W_local != 0)), 0.01 * np.count_nonzero(W_control), message)
+
+
+    def test_cholesky_matches_inverse(self):
+
+        URM = get_random_URM()
+
+        for topK in [None, 30]:
+            recommender_inverse = EASE_R_Recommender(URM, verbose=False)
+            recommender_inverse.fit(topK=topK, l2_norm=10.0, solver="inverse")
+
+            recommender_cholesky = EASE_R_Recommender(URM, verbose=False)
+            recommender_cholesky.fit(topK=topK, l2_norm=10.0, solver="cholesky", block_size=17)
+
+            self.assertEqual(recommender_cholesky.W_sparse.dtype, np.float32)
+            self.assertWeightsClose(recommender_inverse.W_sparse, recommender_cholesky.W_sparse, topK,
+                                    "topK {}: cholesky weights not matching inverse".format(topK))
+
+
+    def test_l2_sweep_matches_fit(self):
+
+        URM = get_random_URM()
+        l2_norms = [1.0, 10.0, 111.0]
+
+        for topK in [None, 30]:
+            sweep_recommender = EASE_R_Recommender(URM, verbose=False)
+            W_sparse_dict = sweep_recommender.fit_l2_sweep(l2_norms, topK=topK, block_size=17)
+
+            self.assertEqual(set(W_sparse_dict.keys()), set(l2_norms))
+
+            for l2_norm in l2_norms:
+                recommender = EASE_R_Recommender(URM, verbose=False)
+                recommender.fit(topK=topK, l2_norm=l2_norm)
+
+                self.assertWeightsClose(recommender.W_sparse, W_sparse_dict[l2_norm], topK,
+                                        "topK {}, l2_norm {}: sweep weights not matching fit".format(topK, l2_norm))
+
+    def test_l2_topK_sweep_matches_fit(self):
+
+        URM = get_random_URM()
+        l2_norms, topKs = [1.0, 10.0], [None, 30, 5]
+
+        sweep_recommender = EASE_R_Recommender(URM, verbose=False)
+        W_sparse_dict = sweep_recommender.fit_l2_sweep(l2_norms[:1], topKs=topKs, block_size=17)
+        eigenvectors = sweep_recommender._eigendecomposition[3]
+
+        # The next calls on the same URM_train reuse the eigendecomposition, without None the smaller topK are
+        # selected from the csr weights of the largest
+        W_sparse_dict.update(sweep_recommender.fit_l2_sweep(l2_norms[1:], topKs=topKs[1:], block_size=17))
+        self.assertIs(sweep_recommender._eigendecomposition[3], eigenvectors)
+
+        self.assertEqual(set(W_sparse_dict.keys()), {(l2_norms[0], topK) for topK in topKs} | {(l2_norms[1], topK) for topK in topKs[1:]})
+
+        for l2_norm, topK in W_sparse_dict.keys():
+            recommender = EASE_R_Recommender(URM, verbose=False)
+            recommender.fit(topK=topK, l2_norm=l2_norm)
+
+            self.assertWeightsClose(recommender.W_sparse, W_sparse_dict[(l2_norm, topK)], topK,
+                                    "topK {}, l2_norm {}: sweep weights not matching fit".format(topK, l2_norm))
+
+    def test_dense_score_tiles_match_dot(self):
+
+        URM = get_random_URM()
+        user_id_array = np.arange(URM.shape[0])
+
+        recommender = EASE_R_Recommender(URM, verbose=False)
+        recommender.fit(topK=None)
+        recommender.set_score_threads(n_threads=3, tile_size=7)
+
+        scores_control = URM.dot(recommender.W_sparse.astype(np.float64))
+
+        out = np.empty(URM.shape, dtype=np.float32)
+        self.assertIs(recommender._compute_item_score(user_id_array, out=out), out)
+        self.assertTrue(np.allclose(scores_control, out, atol=1e-5), "tiled scores not matching dot")
+
+        items_to_compute = np.arange(0, URM.shape[1], 3)
+        item_scores = recommender._compute_item_score(user_id_array, items_to_compute=items_to_compute)
+        self.assertTrue(np.allclose(scores_control[:, items_to_compute], item_scores[:, items_to_compute], atol=1e-5))
+        self.assertTrue(np.all(np.isneginf(np.delete(item_scores, items_to_compute, axis=1))))
+
+        top_item_ids, top_scores = recommender._compute_item_score(user_id_array, topK=10)
+        self.assertTrue(np.allclose(-np.sort(-scores_control, axis=1)[:, :10], top_scores, atol=1e-5))
+        self.assertTrue(np.allclose(np.take_along_axis(scores_control, top_item_ids, axis=1), top_scores, atol=1e-5))
+
+    def test_update_matches_fit(self):
+
+        URM = get_random_URM()
+        rng = np.random.default_rng(0)
+
+        # A few users with new items, the update has the rank of the users, then many users on a few items,
+        # the update has the rank of the items
+        URM_delta_few_users = sps.csr_matrix((np.ones(6, dtype=np.float32), ([1, 1, 5, 7, 7, 7], [3, 50, 8, 90, 91, 92])), shape=URM.shape)
+        URM_delta_few_items = sps.csr_matrix((np.ones(70, dtype=np.float32), (rng.choice(URM.shape[0], 70, replace=False),
+                                              rng.choice(4, 70))), shape=URM.shape)
+
+        for topK, sparse_threshold_quota in [(None, None), (30, None), (30, 1.0)]:
+            recommender = EASE_R_Recommender(URM, sparse_threshold_quota=sparse_threshold_quota, verbose=False)
+            recommender.fit(topK=topK, l2_norm=10.0, keep_inverse=True)
+            URM_updated = URM
+
+            for URM_delta in [URM_delta_few_users, URM_delta_few_items]:
+                recommender.update(URM_delta)
+                URM_updated = URM_updated + URM_delta
+
+                recommender_refit = EASE_R_Recommender(URM_updated, sparse_threshold_quota=sparse_threshold_quota, verbose=False)
+                recommender_refit.fit(topK=topK, l2_norm=10.0)
+
+                self.assertEqual(sps.issparse(recommender.W_sparse), sps.issparse(recommender_refit.W_sparse))
+                self.assertTrue(np.allclose(to_dense(recommender.URM_train), to_dense(URM_updated)))
+                self.assertWeightsClose(recommender_refit.W_sparse, recommender.W_sparse, topK,
+                                        "topK {}: updated weights not matching fit".format(topK))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
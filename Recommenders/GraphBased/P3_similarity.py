@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Similarity kernel shared by P3alphaRecommender and RP3betaRecommender.
+"""
+
+import numpy as np
+import scipy.sparse as sps
+import time, sys
+
+from concurrent.futures import ThreadPoolExecutor
+from Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
+
+
+def _row_positions(indptr):
+    """Position of each nonzero of a CSR matrix within its row"""
+    row_nnz = np.diff(indptr)
+    return (np.arange(indptr[-1]) - np.repeat(indptr[:-1], row_nnz)).astype(np.int32)
+
+
+def _top_k_rows_to_csr(top_k_idx, top_k_values):
+    """CSR matrix of the n_rows x topK arrays of column indices and values of each row, without the zeros"""
+    n_items = top_k_idx.shape[0]
+
+    # Rows are stored one after the other, masking the zeros keeps them in row order
+    is_nonzero = top_k_values != 0.0
+    indptr = np.zeros(n_items + 1, dtype=np.int64)
+    np.cumsum(is_nonzero.sum(axis=1), out=indptr[1:])
+
+    W_sparse = sps.csr_matrix((top_k_values[is_nonzero], top_k_idx[is_nonzero], indptr), shape=(n_items, n_items))
+    W_sparse.sort_indices()
+
+    return W_sparse
+
+
+def select_rows_topK(W_sparse, topK):
+    """
+    Keep the topK largest values of each row of a CSR matrix with few values per row, e.g. one built by
+    compute_P3_similarity_topK with a larger topK. The rows are laid in a dense n_rows x longest row array and the
+    topK of all of them are selected at once with argpartition along axis 1.
+    """
+    W_sparse = W_sparse.tocsr()
+    longest_row = np.diff(W_sparse.indptr).max(initial=0)
+
+    if longest_row <= topK:
+        return W_sparse.copy()
+
+    negative_values = sps.csr_matrix((-W_sparse.data, _row_positions(W_sparse.indptr), W_sparse.indptr),
+                                     shape=(W_sparse.shape[0], longest_row)).toarray()
+
+    top_k_positions = np.argpartition(negative_values, topK-1, axis=1)[:, :topK]
+    top_k_values = -np.take_along_axis(negative_values, top_k_positions, axis=1)
+
+    # Positions past the end of a row hold padding zeros, which are removed, clip them to a valid index
+    top_k_data = np.minimum(W_sparse.indptr[:-1, None] + top_k_positions, max(W_sparse.nnz - 1, 0))
+
+    return _top_k_rows_to_csr(W_sparse.indices[top_k_data], top_k_values)
+
+
+def compute_P3_similarity_topK(Piu, Pui, topK, degree=None, block_size=200, chunk_size=8, n_threads=1, print_function=print):
+    """
+    Compute the rows of Piu * Pui one block of block_size rows at a time, multiplied column-wise by degree if given,
+    and keep the topK values of each row, without the diagonal and the zeros.
+    See compute_P3_similarity_topK_degrees, which computes the similarities of several degrees from the same product.
+
+    Returns:
+        csr_matrix: items x items float32 similarity with at most topK values per row
+    """
+    degrees = [np.ones(Pui.shape[1], dtype=np.float32) if degree is None else degree]
+
+    return compute_P3_similarity_topK_degrees(Piu, Pui, topK, degrees, block_size=block_size, chunk_size=chunk_size,
+                                              n_threads=n_threads, print_function=print_function)[0]
+
+
+def compute_P3_similarity_topK_degrees(Piu, Pui, topK, degrees, block_size=200, chunk_size=8, n_threads=1, print_function=print):
+    """
+    Compute the rows of Piu * Pui one block of block_size rows at a time and, for each degree of degrees, keep the
+    topK values of each row multiplied column-wise by degree, without the diagonal and the zeros. The product is
+    computed once for all the degrees.
+
+    The nonzeros of chunk_size rows of the block are laid in a dense chunk as wide as the longest row, the topK of
+    all the rows of a chunk are selected at once with argpartition along axis 1 and written in the n_items x topK
+    arrays preallocated for the result, which become the data and indices of the CSR matrix.
+    Blocks are computed by a pool of n_threads threads, the sparse product and argpartition release the GIL.
+
+    Args:
+        Piu (csr_matrix): items x users transition probabilities
+        Pui (csr_matrix): users x items transition probabilities
+        degrees (list): weight of each column, e.g. the popularity penalization of RP3beta, one array per similarity
+        print_function: called with the progress messages, every 300 seconds and at the end
+
+    Returns:
+        list: items x items float32 csr similarity of each degree, with at most topK values per row
+    """
+    n_items = Pui.shape[1]
+    topK = min(topK, n_items)
+
+    # Each row has at most topK values, zeros are removed once all blocks are done
+    top_k_idx = [np.zeros((n_items, topK), dtype=np.int32) for _ in degrees]
+    top_k_values = [np.zeros((n_items, topK), dtype=np.float32) for _ in degrees]
+
+    # The block is negated while it is scaled, so that argpartition selects the largest values without a copy
+    negative_degrees = [-np.asarray(degree, dtype=np.float32) for degree in degrees]
+
+    def compute_block(start_row):
+        end_row = min(start_row + block_size, n_items)
+
+        similarity_block = Piu[start_row:end_row] * Pui
+        indptr, indices = similarity_block.indptr, similarity_block.indices
+        row_nnz = np.diff(indptr)
+
+        # Scale the values and remove the diagonal on the nonzeros of the whole block, then lay each row at the
+        # beginning of a dense row, so that the topK are selected among the nonzeros only
+        is_diagonal = indices == np.repeat(np.arange(start_row, end_row), row_nnz)
+        position_in_row = _row_positions(indptr)
+
+        for degree_index, negative_degree in enumerate(negative_degrees):
+            values = similarity_block.data * negative_degree[indices]
+            values[is_diagonal] = 0.0
+
+            # A chunk of rows at a time, padded with zeros to its longest row, small enough to stay in cache
+            for start_chunk in range(0, end_row - start_row, chunk_size):
+                end_chunk = min(start_chunk + chunk_size, end_row - start_row)
+                start_data, end_data = indptr[start_chunk], indptr[end_chunk]
+                chunk_indptr = indptr[start_chunk:end_chunk + 1] - start_data
+
+                # The preallocated arrays are already zero
+                if end_data == start_data:
+                    continue
+
+                chunk_width = max(row_nnz[start_chunk:end_chunk].max(initial=0), topK)
+                chunk_values = sps.csr_matrix((values[start_data:end_data], position_in_row[start_data:end_data], chunk_indptr),
+                                              shape=(end_chunk - start_chunk, chunk_width)).toarray()
+
+                chunk_top_k_positions = np.argpartition(chunk_values, topK-1, axis=1)[:, :topK]
+                top_k_values[degree_index][start_row + start_chunk:start_row + end_chunk] = np.take_along_axis(chunk_values, chunk_top_k_positions, axis=1)
+
+                # Positions past the end of a row hold padding zeros, which are removed, clip them to a valid index
+                chunk_top_k_data = np.minimum(chunk_indptr[:-1, None] + chunk_top_k_positions, end_data - start_data - 1)
+                top_k_idx[degree_index][start_row + start_chunk:start_row + end_chunk] = indices[start_data:end_data][chunk_top_k_data]
+
+        return end_row - start_row
+
+    start_time = time.time()
+    start_time_printBatch = start_time
+    n_done_rows = 0
+
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        for n_block_rows in executor.map(compute_block, range(0, n_items, block_size)):
+            n_done_rows += n_block_rows
+
+            if time.time() - start_time_printBatch > 300 or n_done_rows == n_items:
+                new_time_value, new_time_unit = seconds_to_biggest_unit(time.time() - start_time)
+
+                print_function("Similarity column {} ({:4.1f}%), {:.2f} column/sec. Elapsed time {:.2f} {}".format(
+                    n_done_rows,
+                    100.0 * float(n_done_rows) / n_items,
+                    float(n_done_rows) / (time.time() - start_time),
+                    new_time_value, new_time_unit))
+
+                sys.stdout.flush()
+                sys.stderr.flush()
+
+                start_time_printBatch = time.time()
+
+    W_sparse_list = []
+
+    for degree_index in range(len(degrees)):
+        np.negative(top_k_values[degree_index], out=top_k_values[degree_index])
+        W_sparse_list.append(_top_k_rows_to_csr(top_k_idx[degree_index], top_k_values[degree_index]))
+
+    return W_sparse_list
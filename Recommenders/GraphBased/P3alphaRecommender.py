@@ -9,11 +9,9 @@ import scipy.sparse as sps
 
 from sklearn.preprocessing import normalize
 from Recommenders.Recommender_utils import check_matrix, similarityMatrixTopK
-from Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
 
 from Recommenders.BaseSimilarityMatrixRecommender import BaseItemSimilarityMatrixRecommender
-from Recommenders.Similarity.Compute_Similarity_Python import Incremental_Similarity_Builder
-import time, sys
+from Recommenders.GraphBased.P3_similarity import compute_P3_similarity_topK
 
 
 
@@ -32,7 +30,8 @@ class P3alphaRecommender(BaseItemSimilarityMatrixRecommender):
                                                                             self.min_rating, self.topK, self.implicit,
                                                                             self.normalize_similarity)
 
-    def fit(self, topK=150, alpha=1.2040177868858861, min_rating=0, implicit=False, normalize_similarity=True):
+    def fit(self, topK=150, alpha=1.2040177868858861, min_rating=0, implicit=False, normalize_similarity=True,
+            block_size=200, n_threads=1):
 
         self.topK = topK
         self.alpha = alpha
@@ -68,56 +67,8 @@ class P3alphaRecommender(BaseItemSimilarityMatrixRecommender):
 
         # Final matrix is computed as Pui * Piu * Pui
         # Multiplication unpacked for memory usage reasons
-        block_dim = 200
-        d_t = Piu
-
-        similarity_builder = Incremental_Similarity_Builder(Pui.shape[1], initial_data_block=Pui.shape[1]*self.topK, dtype = np.float32)
-
-        start_time = time.time()
-        start_time_printBatch = start_time
-
-        for current_block_start_row in range(0, Pui.shape[1], block_dim):
-
-            if current_block_start_row + block_dim > Pui.shape[1]:
-                block_dim = Pui.shape[1] - current_block_start_row
-
-            similarity_block = d_t[current_block_start_row:current_block_start_row + block_dim, :] * Pui
-            similarity_block = similarity_block.toarray()
-
-            for row_in_block in range(block_dim):
-                row_data = similarity_block[row_in_block, :]
-                row_data[current_block_start_row + row_in_block] = 0
-
-                relevant_items_partition = np.argpartition(-row_data, self.topK-1, axis=0)[:self.topK]
-                row_data = row_data[relevant_items_partition]
-
-                # Incrementally build sparse matrix, do not add zeros
-                if np.any(row_data == 0.0):
-                    non_zero_mask = row_data != 0.0
-                    relevant_items_partition = relevant_items_partition[non_zero_mask]
-                    row_data = row_data[non_zero_mask]
-
-                similarity_builder.add_data_lists(row_list_to_add=np.ones(len(row_data), dtype = np.int) * (current_block_start_row + row_in_block),
-                                                  col_list_to_add=relevant_items_partition,
-                                                  data_list_to_add=row_data)
-
-
-            if time.time() - start_time_printBatch > 300 or current_block_start_row + block_dim == Pui.shape[1]:
-                new_time_value, new_time_unit = seconds_to_biggest_unit(time.time() - start_time)
-
-                self._print("Similarity column {} ({:4.1f}%), {:.2f} column/sec. Elapsed time {:.2f} {}".format(
-                     current_block_start_row + block_dim,
-                    100.0 * float( current_block_start_row + block_dim) / Pui.shape[1],
-                    float( current_block_start_row + block_dim) / (time.time() - start_time),
-                    new_time_value, new_time_unit))
-
-                sys.stdout.flush()
-                sys.stderr.flush()
-
-                start_time_printBatch = time.time()
-
-
-        self.W_sparse = similarity_builder.get_SparseMatrix()
+        self.W_sparse = compute_P3_similarity_topK(Piu, Pui, self.topK, block_size = block_size,
+                                                   n_threads = n_threads, print_function = self._print)
 
 
         if self.normalize_similarity:
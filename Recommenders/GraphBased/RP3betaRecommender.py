@@ -9,11 +9,11 @@ import scipy.sparse as sps
 
 from sklearn.preprocessing import normalize
 from Recommenders.Recommender_utils import check_matrix, similarityMatrixTopK
-from Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
 
 from Recommenders.BaseSimilarityMatrixRecommender import BaseItemSimilarityMatrixRecommender
-from Recommenders.Similarity.Compute_Similarity_Python import Incremental_Similarity_Builder
-import time, sys
+from Recommenders.GraphBased.P3_similarity import compute_P3_similarity_topK, compute_P3_similarity_topK_degrees, select_rows_topK
+from Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
+import time
 
 class RP3betaRecommender(BaseItemSimilarityMatrixRecommender):
     """ RP3beta recommender """
@@ -29,7 +29,8 @@ class RP3betaRecommender(BaseItemSimilarityMatrixRecommender):
                                                                                         self.beta, self.min_rating, self.topK,
                                                                                         self.implicit, self.normalize_similarity)
 
-    def fit(self,topK=89, alpha=0.6951524535062256, beta=0.39985511876562174, min_rating=0,  implicit=False, normalize_similarity=True):
+    def fit(self,topK=89, alpha=0.6951524535062256, beta=0.39985511876562174, min_rating=0,  implicit=False, normalize_similarity=True,
+            block_size=200, n_threads=1):
 
         self.topK = topK
         self.alpha = alpha
@@ -48,91 +49,95 @@ class RP3betaRecommender(BaseItemSimilarityMatrixRecommender):
             if self.implicit:
                 self.URM_train.data = np.ones(self.URM_train.data.size, dtype=np.float32)
 
-        #Pui is the row-normalized urm
-        Pui = normalize(self.URM_train, norm='l1', axis=1)
+        Pui, Piu, item_popularity = self._get_random_walk(self.alpha)
+        degree = self._get_degree(item_popularity, self.beta)
 
-        #Piu is the column-normalized, "boolean" urm transposed
-        X_bool = self.URM_train.transpose(copy=True)
-        X_bool.data = np.ones(X_bool.data.size, np.float32)
+        # Final matrix is computed as Pui * Piu * Pui
+        # Multiplication unpacked for memory usage reasons
+        W_sparse = compute_P3_similarity_topK(Piu, Pui, self.topK, degree = degree, block_size = block_size,
+                                              n_threads = n_threads, print_function = self._print)
 
-        # Taking the degree of each item to penalize top popular
-        # Some rows might be zero, make sure their degree remains zero
-        X_bool_sum = np.array(X_bool.sum(axis=1)).ravel()
+        self.W_sparse = self._get_pruned_similarity(W_sparse, self.topK, self.normalize_similarity)
 
-        degree = np.zeros(self.URM_train.shape[1])
 
-        nonZeroMask = X_bool_sum!=0.0
+    def fit_sweep(self, alphas, betas, topKs, normalize_similarity=True, block_size=200, n_threads=1):
+        """
+        Fit the models of all the combinations of alphas, betas and topKs. beta only scales the columns of the
+        random walk product by the degree and topK only truncates it, so the product is computed once per alpha and
+        the topK of every beta are selected from it, see compute_P3_similarity_topK_degrees. The smaller topKs are
+        then selected among the largest one of each row, which are held for all the betas of an alpha.
+        The recommender is left unchanged, to evaluate one of the models assign it to W_sparse.
 
-        degree[nonZeroMask] = np.power(X_bool_sum[nonZeroMask], -self.beta)
+        Returns:
+            dict: W_sparse of each (alpha, beta, topK)
+        """
 
-        #ATTENTION: axis is still 1 because i transposed before the normalization
-        Piu = normalize(X_bool, norm='l1', axis=1)
-        del(X_bool)
+        start_time = time.time()
+        max_topK = max(topKs)
+        W_sparse_dict = {}
 
-        # Alfa power
-        if self.alpha != 1.:
-            Pui = Pui.power(self.alpha)
-            Piu = Piu.power(self.alpha)
+        for alpha in alphas:
+            Pui, Piu, item_popularity = self._get_random_walk(alpha)
+            degrees = [self._get_degree(item_popularity, beta) for beta in betas]
 
-        # Final matrix is computed as Pui * Piu * Pui
-        # Multiplication unpacked for memory usage reasons
-        block_dim = 200
-        d_t = Piu
+            W_sparse_max_topK_list = compute_P3_similarity_topK_degrees(Piu, Pui, max_topK, degrees, block_size = block_size,
+                                                                        n_threads = n_threads, print_function = self._print)
 
-        similarity_builder = Incremental_Similarity_Builder(Pui.shape[1], initial_data_block=Pui.shape[1]*self.topK, dtype = np.float32)
+            for beta, W_sparse_max_topK in zip(betas, W_sparse_max_topK_list):
+                for topK in topKs:
+                    W_sparse = select_rows_topK(W_sparse_max_topK, topK)
+                    W_sparse_dict[(alpha, beta, topK)] = self._get_pruned_similarity(W_sparse, topK, normalize_similarity)
 
+        new_time_value, new_time_unit = seconds_to_biggest_unit(time.time() - start_time)
+        self._print("Fitted {} models in {:.2f} {}".format(len(W_sparse_dict), new_time_value, new_time_unit))
 
-        start_time = time.time()
-        start_time_printBatch = start_time
+        return W_sparse_dict
 
-        for current_block_start_row in range(0, Pui.shape[1], block_dim):
 
-            if current_block_start_row + block_dim > Pui.shape[1]:
-                block_dim = Pui.shape[1] - current_block_start_row
+    def _get_random_walk(self, alpha):
+        """Return the transition probabilities Pui and Piu raised to alpha and the number of users of each item"""
+
+        #Pui is the row-normalized urm
+        Pui = normalize(self.URM_train, norm='l1', axis=1)
+
+        #Piu is the column-normalized, "boolean" urm transposed
+        X_bool = self.URM_train.transpose(copy=True)
+        X_bool.data = np.ones(X_bool.data.size, np.float32)
 
-            similarity_block = d_t[current_block_start_row:current_block_start_row + block_dim, :] * Pui
-            similarity_block = similarity_block.toarray()
+        # Taking the degree of each item to penalize top popular
+        X_bool_sum = np.array(X_bool.sum(axis=1)).ravel()
 
-            for row_in_block in range(block_dim):
-                row_data = np.multiply(similarity_block[row_in_block, :], degree)
-                row_data[current_block_start_row + row_in_block] = 0
+        #ATTENTION: axis is still 1 because i transposed before the normalization
+        Piu = normalize(X_bool, norm='l1', axis=1)
+        del(X_bool)
 
-                relevant_items_partition = np.argpartition(-row_data, self.topK-1, axis=0)[:self.topK]
-                row_data = row_data[relevant_items_partition]
+        # Alfa power
+        if alpha != 1.:
+            Pui = Pui.power(alpha)
+            Piu = Piu.power(alpha)
 
-                # Incrementally build sparse matrix, do not add zeros
-                if np.any(row_data == 0.0):
-                    non_zero_mask = row_data != 0.0
-                    relevant_items_partition = relevant_items_partition[non_zero_mask]
-                    row_data = row_data[non_zero_mask]
+        return Pui, Piu, X_bool_sum
 
-                similarity_builder.add_data_lists(row_list_to_add=np.ones(len(row_data), dtype = np.int) * (current_block_start_row + row_in_block),
-                                                  col_list_to_add=relevant_items_partition,
-                                                  data_list_to_add=row_data)
 
+    def _get_degree(self, item_popularity, beta):
 
-            if time.time() - start_time_printBatch > 300 or current_block_start_row + block_dim == Pui.shape[1]:
-                new_time_value, new_time_unit = seconds_to_biggest_unit(time.time() - start_time)
+        # Some rows might be zero, make sure their degree remains zero
+        degree = np.zeros(self.URM_train.shape[1])
 
-                self._print("Similarity column {} ({:4.1f}%), {:.2f} column/sec. Elapsed time {:.2f} {}".format(
-                     current_block_start_row + block_dim,
-                    100.0 * float( current_block_start_row + block_dim) / Pui.shape[1],
-                    float( current_block_start_row + block_dim) / (time.time() - start_time),
-                    new_time_value, new_time_unit))
+        nonZeroMask = item_popularity!=0.0
 
-                sys.stdout.flush()
-                sys.stderr.flush()
+        degree[nonZeroMask] = np.power(item_popularity[nonZeroMask], -beta)
 
-                start_time_printBatch = time.time()
+        return degree
 
-        self.W_sparse = similarity_builder.get_SparseMatrix()
 
+    def _get_pruned_similarity(self, W_sparse, topK, normalize_similarity):
 
-        if self.normalize_similarity:
-            self.W_sparse = normalize(self.W_sparse, norm='l1', axis=1)
+        if normalize_similarity:
+            W_sparse = normalize(W_sparse, norm='l1', axis=1)
 
 
-        if self.topK != False:
-            self.W_sparse = similarityMatrixTopK(self.W_sparse, k=self.topK)
+        if topK != False:
+            W_sparse = similarityMatrixTopK(W_sparse, k=topK)
 
-        self.W_sparse = check_matrix(self.W_sparse, format='csr')
+        return check_matrix(W_sparse, format='csr')
@@ -0,0 +1,143 @@
+import os
+import time
+import shutil
+import hashlib
+
+import numpy as np
+import scipy.sparse as sps
+
+from Recommenders.DataIO import DataIO
+
+
+def get_URM_fingerprint(URM_train):
+    """Json serializable identifier of the data of a sparse URM, to be added to the fit_params of a checkpoint"""
+    sha1 = hashlib.sha1()
+
+    for array in [URM_train.indptr, URM_train.indices, URM_train.data]:
+        sha1.update(np.ascontiguousarray(array).tobytes())
+
+    return {"format": URM_train.getformat(), "shape": list(URM_train.shape), "nnz": int(URM_train.nnz), "sha1": sha1.hexdigest()}
+
+
+class SLIMCheckpoint(object):
+    """
+    Checkpoint of the W_sparse columns of a SLIM fit, so that an interrupted fit can be resumed.
+
+    The columns fitted since the last flush are written as a new shard of the checkpoint folder, together with the
+    items they belong to, every checkpoint_every_n_items items or checkpoint_every_seconds seconds. Items may be added
+    in any order, hence the chunks returned by imap_unordered are recorded as they arrive. Loading the checkpoint
+    marks the items of every shard as done, the fit then only needs the remaining ones.
+    The fit parameters are stored with the shards, a checkpoint written with different ones is not resumed. They should
+    include the get_URM_fingerprint of the training data, so that a checkpoint of another split is not resumed either.
+    """
+
+    def __init__(self, folder_path, n_items, fit_params, checkpoint_every_n_items=1000, checkpoint_every_seconds=300):
+        """
+        Args:
+            folder_path (str): folder of the shards, one per fit
+            n_items (int): number of items of the URM, hence of columns of W_sparse
+            fit_params (dict): json serializable parameters of the fit
+            checkpoint_every_n_items (int): flush after this many items
+            checkpoint_every_seconds (float): flush after this many seconds
+        """
+        self.folder_path = folder_path if folder_path[-1] == "/" else folder_path + "/"
+        self.n_items = n_items
+        self.fit_params = dict(fit_params, n_items=n_items)
+        self.checkpoint_every_n_items = checkpoint_every_n_items
+        self.checkpoint_every_seconds = checkpoint_every_seconds
+
+        self.dataIO = DataIO(folder_path=self.folder_path)
+
+        self.done_items = np.zeros(n_items, dtype=bool)
+        self.n_shards = 0
+        self.rows, self.cols, self.values = [], [], []
+
+        self._reset_pending()
+
+    def _reset_pending(self):
+        self.pending_items, self.pending_rows, self.pending_cols, self.pending_values = [], [], [], []
+        self.n_pending_items = 0
+        self.last_flush_time = time.time()
+
+    def _get_shard_file_names(self):
+        shard_file_names = [file_name for file_name in os.listdir(self.folder_path) if file_name.startswith("shard_") and file_name.endswith(".zip")]
+        return sorted(shard_file_names, key=lambda file_name: int(file_name[len("shard_"):-len(".zip")]))
+
+    def load(self):
+        """Restore the shards of a previous fit with the same parameters
+
+        Returns:
+            int: number of items already done
+        """
+        if not os.path.exists(self.folder_path + "fit_params.zip"):
+            os.makedirs(self.folder_path, exist_ok=True)
+            self.dataIO.save_data(file_name="fit_params", data_dict_to_save={"fit_params": self.fit_params})
+            return 0
+
+        stored_fit_params = self.dataIO.load_data(file_name="fit_params")["fit_params"]
+
+        if stored_fit_params != self.fit_params:
+            raise ValueError("SLIMCheckpoint: checkpoint in '{}' was written with parameters {}, the current ones are {}. "
+                             "Remove it or use another folder.".format(self.folder_path, stored_fit_params, self.fit_params))
+
+        for shard_file_name in self._get_shard_file_names():
+            shard = self.dataIO.load_data(file_name=shard_file_name)
+
+            self.done_items[shard["items"]] = True
+            self.rows.append(shard["rows"])
+            self.cols.append(shard["cols"])
+            self.values.append(shard["values"])
+            self.n_shards += 1
+
+        return int(self.done_items.sum())
+
+    def get_items_to_fit(self):
+        return np.flatnonzero(~self.done_items)
+
+    def add(self, items, rows, cols, values):
+        """Record the coefficients of the given items, flushing them if enough items or time passed since the last flush"""
+        items = np.asarray(items, dtype=np.int64)
+
+        self.done_items[items] = True
+        self.pending_items.append(items)
+        self.pending_rows.append(np.asarray(rows, dtype=np.int32))
+        self.pending_cols.append(np.asarray(cols, dtype=np.int32))
+        self.pending_values.append(np.asarray(values, dtype=np.float32))
+        self.n_pending_items += len(items)
+
+        if self.n_pending_items >= self.checkpoint_every_n_items or time.time() - self.last_flush_time > self.checkpoint_every_seconds:
+            self.flush()
+
+    def flush(self):
+        """Write the items added since the last flush as a new shard"""
+        if self.n_pending_items == 0:
+            return
+
+        shard = {
+            "items": np.concatenate(self.pending_items),
+            "rows": np.concatenate(self.pending_rows),
+            "cols": np.concatenate(self.pending_cols),
+            "values": np.concatenate(self.pending_values),
+        }
+
+        # The archive replaces its file only once complete, a shard is either written whole or missing
+        self.dataIO.save_data(file_name="shard_{}".format(self.n_shards), data_dict_to_save=shard)
+        self.n_shards += 1
+
+        self.rows.append(shard["rows"])
+        self.cols.append(shard["cols"])
+        self.values.append(shard["values"])
+
+        self._reset_pending()
+
+    def get_W_sparse(self):
+        """Return W_sparse built from all the items recorded, flushed or not"""
+        rows = np.concatenate(self.rows + self.pending_rows + [np.zeros(0, dtype=np.int32)])
+        cols = np.concatenate(self.cols + self.pending_cols + [np.zeros(0, dtype=np.int32)])
+        values = np.concatenate(self.values + self.pending_values + [np.zeros(0, dtype=np.float32)])
+
+        return sps.csr_matrix((values, (rows, cols)), shape=(self.n_items, self.n_items), dtype=np.float32)
+
+    def clear(self):
+        """Remove the checkpoint folder, once the fit is complete"""
+        shutil.rmtree(self.folder_path, ignore_errors=True)
@@ -9,8 +9,11 @@ import numpy as np
 import scipy.sparse as sps
 from Recommenders.Recommender_utils import check_matrix
 from sklearn.linear_model import ElasticNet
+from sklearn.linear_model._cd_fast import enet_coordinate_descent_gram
+from sklearn.utils import check_random_state
 from Recommenders.BaseSimilarityMatrixRecommender import BaseItemSimilarityMatrixRecommender
 from Recommenders.Similarity.Compute_Similarity_Python import Incremental_Similarity_Builder
+from Recommenders.SLIM.SLIMCheckpoint import SLIMCheckpoint, get_URM_fingerprint
 from Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
 import time, sys
 from tqdm import tqdm
@@ -20,12 +23,269 @@ from sklearn.exceptions import ConvergenceWarning
 # os.environ["PYTHONWARNINGS"] = ('ignore::exceptions.ConvergenceWarning:sklearn.linear_model')
 # os.environ["PYTHONWARNINGS"] = ('ignore:Objective did not converge:ConvergenceWarning:')
 
+def select_topK(indices, values, topK):
+    """Keep the topK coefficients with the largest absolute value, in no particular order"""
+
+    # Check if there are more data points than topK, if so, extract the set of K best values
+    if len(values) > topK:
+        # Partition the data because this operation does not require to fully sort the data
+        relevant_items_partition = np.argpartition(-np.abs(values), topK-1, axis=0)[0:topK]
+        indices = indices[relevant_items_partition]
+        values = values[relevant_items_partition]
+
+    return indices, values
+
+
+class SklearnElasticNetSolver(object):
+    """
+    Fits the ElasticNet of one item at a time with scikit-learn on the sparse URM, whose target column is
+    zeroed during the fit and restored afterwards.
+    """
+
+    def __init__(self, URM_train, alpha, l1_ratio, positive_only=True, max_iter=100, tol=1e-4):
+        """
+        Args:
+            URM_train (csc): float32 matrix with items on columns, its data is modified during each solve and restored
+        """
+        self.URM_train = URM_train
+
+        self.model = ElasticNet(alpha=alpha,
+                                l1_ratio=l1_ratio,
+                                positive=positive_only,
+                                fit_intercept=False,
+                                copy_X=False,
+                                precompute=True,
+                                selection='random',
+                                max_iter=max_iter,
+                                tol=tol)
+
+    @ignore_warnings(category=ConvergenceWarning)
+    def solve(self, item):
+        """Return the indices and values of the nonzero coefficients of the model of item"""
+        URM_train = self.URM_train
+
+        # get the target column
+        y = URM_train[:, item].toarray()
+
+        # set the j-th column of X to zero
+        start_pos = URM_train.indptr[item]
+        end_pos = URM_train.indptr[item + 1]
+
+        current_item_data_backup = URM_train.data[start_pos: end_pos].copy()
+        URM_train.data[start_pos: end_pos] = 0.0
+
+        # fit one ElasticNet model per column
+        self.model.fit(URM_train, y)
+
+        # finally, replace the original values of the j-th column
+        URM_train.data[start_pos:end_pos] = current_item_data_backup
+
+        # self.model.coef_ contains the coefficient of the ElasticNet model
+        # let's keep only the non-zero values
+        return self.model.sparse_coef_.indices.copy(), self.model.sparse_coef_.data.copy()
+
+
+class GramElasticNetSolver(object):
+    """
+    Fits the ElasticNet of one item at a time against the item Gram matrix G = X^T X, computed once.
+
+    The objective is the one of scikit-learn multiplied by n_samples:
+        1/2 w^T G w - G[:, j]^T w + l1_reg ||w||_1 + l2_reg/2 ||w||^2
+    with l1_reg = alpha * l1_ratio * n_samples and l2_reg = alpha * (1 - l1_ratio) * n_samples, the target item j
+    being excluded from the features instead of zeroing its column.
+
+    A coefficient k can only become nonzero if its gradient |G[k, j] - (G w)_k| exceeds l1_reg, therefore coordinate
+    descent runs on a small dense working set, starting from the items with G[k, j] > l1_reg. After each solve the
+    gradient of the excluded items is checked and the violating ones are added to the working set, until none is left.
+    With a nonnegative URM and positive_only the initial working set is already the final one.
+
+    Rows of X with a large share of the items, as the ICM features stacked below the URM in URM_train_pow, would fill
+    most of G. They are kept apart as a small dense matrix D and G = G_sparse + D^T D, with G_sparse the Gram matrix
+    of the other rows.
+    """
+
+    def __init__(self, URM_train, alpha, l1_ratio, positive_only=True, max_iter=100, tol=1e-4,
+                 working_set_size=4000, dense_row_density=0.05, random_state=None):
+        """
+        Args:
+            URM_train (csc): float32 matrix with items on columns
+            working_set_size (int): maximum number of items added to the working set at each round
+            dense_row_density (float): rows with more than this fraction of the items are kept in D
+            random_state (int): seed of the random coordinate selection, as the scikit-learn selection='random'
+        """
+        n_samples, n_items = URM_train.shape
+
+        self.n_samples = n_samples
+        self.l1_ratio = l1_ratio
+        self.l1_reg, self.l2_reg = self._get_regularization(alpha)
+        self.positive_only = positive_only
+        self.max_iter = max_iter
+        self.tol = tol
+        self.working_set_size = working_set_size
+        self.random_state = check_random_state(random_state)
+
+        URM_train = sps.csr_matrix(URM_train)
+        dense_rows_mask = np.ediff1d(URM_train.indptr) > dense_row_density * n_items
+
+        self.URM_dense_rows = URM_train[dense_rows_mask].toarray()
+        URM_sparse_rows = URM_train[~dense_rows_mask]
+
+        self.gram = check_matrix(URM_sparse_rows.T.dot(URM_sparse_rows), 'csc', dtype=URM_train.dtype)
+        self.gram.sort_indices()
+        self.gram_diagonal = self.gram.diagonal() + np.square(self.URM_dense_rows).sum(axis=0)
+
+    def _get_gram_columns(self, items):
+        """Return G[:, items] as a dense array"""
+        URM_dense_rows_items = self.URM_dense_rows[:, items]
+        return self.gram[:, items].toarray() + self.URM_dense_rows.T.dot(URM_dense_rows_items)
+
+    def _get_gram_block(self, row_items, col_items):
+        """Return G[row_items, :][:, col_items] as a dense array"""
+        gram_block = self.gram[:, col_items][row_items, :].toarray()
+        gram_block += self.URM_dense_rows[:, row_items].T.dot(self.URM_dense_rows[:, col_items])
+        return gram_block
+
+    def _extend_gram_block(self, gram_block, working_set, new_items):
+        """Return G restricted to working_set followed by new_items, given gram_block for working_set alone"""
+        n_old = len(working_set)
+        working_set = np.concatenate((working_set, new_items))
+
+        # G is symmetric, only the columns of the new items are needed
+        new_columns = self._get_gram_block(working_set, new_items)
+
+        extended_gram_block = np.empty((len(working_set), len(working_set)), dtype=self.gram.dtype)
+        extended_gram_block[:n_old, :n_old] = gram_block
+        extended_gram_block[:, n_old:] = new_columns
+        extended_gram_block[n_old:, :n_old] = new_columns[:n_old].T
+
+        return extended_gram_block
+
+    def _get_gram_dot(self, items, coef):
+        """Return G[:, items].dot(coef)"""
+        return self.gram[:, items].dot(coef) + self.URM_dense_rows.T.dot(self.URM_dense_rows[:, items].dot(coef))
+
+    def _get_regularization(self, alpha):
+        return alpha * self.l1_ratio * self.n_samples, alpha * (1 - self.l1_ratio) * self.n_samples
+
+    def _get_violations(self, gradient):
+        return gradient if self.positive_only else np.abs(gradient)
+
+    def _select_new_items(self, violations, excluded_mask, l1_reg):
+        """Return the items outside the working set violating the optimality conditions, the largest first"""
+        violations = violations.copy()
+        violations[excluded_mask] = 0.0
+
+        new_items = np.flatnonzero(violations > l1_reg)
+        new_items = new_items[np.argsort(-violations[new_items], kind="stable")]
+
+        return new_items[:self.working_set_size]
+
+    def _get_target(self, item):
+        # G[:, j] is X^T y
+        q = self._get_gram_columns([item]).ravel()
+        q[item] = 0.0
+
+        # Only y^T y is needed to scale the tolerance of the duality gap
+        y = np.array([np.sqrt(self.gram_diagonal[item])], dtype=self.gram.dtype)
+
+        return q, y
+
+    def _get_cold_start(self, q):
+        """Return an empty working set, its coefficients and Gram block, and the gradient at w = 0"""
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=self.gram.dtype), np.zeros((0, 0), dtype=self.gram.dtype), q
+
+    def _solve(self, item, q, y, l1_reg, l2_reg, working_set, coef, gram_block, gradient):
+        """Coordinate descent from coef on working_set, extended until no item outside it violates the optimality conditions
+
+        Returns:
+            tuple: final working_set, its coefficients and gram_block, and the gradient G[:, j] - G w,
+                used to warm start another solve of the same item
+        """
+        dtype = self.gram.dtype
+
+        excluded_mask = np.zeros(len(q), dtype=bool)
+        excluded_mask[item] = True
+        excluded_mask[working_set] = True
+
+        new_items = self._select_new_items(self._get_violations(gradient), excluded_mask, l1_reg)
+
+        while True:
+            excluded_mask[new_items] = True
+            gram_block = self._extend_gram_block(gram_block, working_set, new_items)
+            working_set = np.concatenate((working_set, new_items))
+            coef = np.concatenate((coef, np.zeros(len(new_items), dtype=dtype)))
+
+            if len(working_set) == 0:
+                break
+
+            coef = enet_coordinate_descent_gram(coef, dtype.type(l1_reg), dtype.type(l2_reg),
+                                                gram_block, np.ascontiguousarray(q[working_set]),
+                                                y, self.max_iter, dtype.type(self.tol), self.random_state,
+                                                True, self.positive_only)[0]
+            coef = np.asarray(coef)
+
+            nonzero_mask = coef != 0.0
+            gradient = q - self._get_gram_dot(working_set[nonzero_mask], coef[nonzero_mask])
+            new_items = self._select_new_items(self._get_violations(gradient), excluded_mask, l1_reg)
+
+            if len(new_items) == 0:
+                break
+
+        return working_set, coef, gram_block, gradient
+
+    @ignore_warnings(category=ConvergenceWarning)
+    def solve(self, item):
+        """Return the indices and values of the nonzero coefficients of the model of item"""
+        q, y = self._get_target(item)
+
+        working_set, coef, _, _ = self._solve(item, q, y, self.l1_reg, self.l2_reg, *self._get_cold_start(q))
+
+        nonzero_mask = coef != 0.0
+        return working_set[nonzero_mask], coef[nonzero_mask]
+
+    @ignore_warnings(category=ConvergenceWarning)
+    def solve_path(self, item, alphas):
+        """Return the indices and values of the nonzero coefficients of the model of item for each alpha
+
+        The alphas are solved from the largest to the smallest, each warm started from the solution of the previous
+        one. Its working set and Gram block are reused, since lowering alpha mostly adds coefficients.
+        The l1_ratio, hence the ratio between the two penalties, is the one of the solver.
+
+        Returns:
+            list: (indices, values) tuples in the same order as alphas
+        """
+        q, y = self._get_target(item)
+
+        warm_start = self._get_cold_start(q)
+
+        path = [None] * len(alphas)
+
+        for alpha_index in np.argsort(-np.asarray(alphas), kind="stable"):
+            l1_reg, l2_reg = self._get_regularization(alphas[alpha_index])
+            warm_start = self._solve(item, q, y, l1_reg, l2_reg, *warm_start)
+
+            working_set, coef = warm_start[:2]
+            nonzero_mask = coef != 0.0
+            path[alpha_index] = (working_set[nonzero_mask], coef[nonzero_mask])
+
+        return path
+
+
+ELASTIC_NET_SOLVERS = {
+    "sklearn": SklearnElasticNetSolver,
+    "gram": GramElasticNetSolver,
+}
+
+
 class SLIMElasticNetRecommender(BaseItemSimilarityMatrixRecommender):
     """
     Train a Sparse Linear Methods (SLIM) item similarity model.
     NOTE: ElasticNet solver is parallel, a single intance of SLIM_ElasticNet will
           make use of half the cores available
 
+    The "gram" solver computes the item Gram matrix once and fits every item against it, see GramElasticNetSolver,
+    the "sklearn" solver fits scikit-learn's ElasticNet on the whole URM for every item.
+
     See:
         Efficient Top-N Recommendation by Linear Regression,
         M. Levy and K. Jack, LSRS workshop at RecSys 2013.
@@ -40,90 +300,142 @@ class SLIMElasticNetRecommender(BaseItemSimilarityMatrixRecommender):
     def __init__(self, URM_train, verbose = True):
         super(SLIMElasticNetRecommender, self).__init__(URM_train, verbose = verbose)
 
-    @ignore_warnings(category=ConvergenceWarning)
-    def fit(self, l1_ratio=0.007467817120176792, alpha = 0.0016779515713674044, positive_only=True, topK = 723):
+    def fit(self, l1_ratio=0.007467817120176792, alpha = 0.0016779515713674044, positive_only=True, topK = 723, solver = "gram",
+            checkpoint_folder_path = None, checkpoint_every_n_items = 1000, checkpoint_every_seconds = 300):
+        """
+        If checkpoint_folder_path is given the fitted columns are flushed there as the fit proceeds, see SLIMCheckpoint,
+        and a fit with the same parameters and folder resumes from the items not done yet. The folder is removed once
+        the fit is complete.
+        """
 
         assert l1_ratio>= 0 and l1_ratio<=1, "{}: l1_ratio must be between 0 and 1, provided value was {}".format(self.RECOMMENDER_NAME, l1_ratio)
+        assert solver in ELASTIC_NET_SOLVERS, "{}: solver must be one of {}, provided value was {}".format(self.RECOMMENDER_NAME, list(ELASTIC_NET_SOLVERS.keys()), solver)
 
         self.l1_ratio = l1_ratio
         self.positive_only = positive_only
         self.topK = topK
 
-
-        # initialize the ElasticNet model
-        self.model = ElasticNet(alpha=alpha,
-                                l1_ratio=self.l1_ratio,
-                                positive=self.positive_only,
-                                fit_intercept=False,
-                                copy_X=False,
-                                precompute=True,
-                                selection='random',
-                                max_iter=100,
-                                tol=1e-4)
-
         URM_train = check_matrix(self.URM_train, 'csc', dtype=np.float32)
 
         n_items = URM_train.shape[1]
 
+        checkpoint = None
+        items_to_fit = np.arange(n_items)
+
+        if checkpoint_folder_path is not None:
+            checkpoint = SLIMCheckpoint(checkpoint_folder_path, n_items,
+                                        {"l1_ratio": l1_ratio, "alpha": alpha, "positive_only": positive_only, "topK": topK, "solver": solver,
+                                         "URM_train": get_URM_fingerprint(URM_train)},
+                                        checkpoint_every_n_items=checkpoint_every_n_items, checkpoint_every_seconds=checkpoint_every_seconds)
+            n_items_done = checkpoint.load()
+            items_to_fit = checkpoint.get_items_to_fit()
+
+            if n_items_done > 0:
+                self._print("Resuming from checkpoint, {} of {} items already fitted".format(n_items_done, n_items))
+
+        elastic_net_solver = ELASTIC_NET_SOLVERS[solver](URM_train, alpha=alpha, l1_ratio=self.l1_ratio, positive_only=self.positive_only)
+
         similarity_builder = Incremental_Similarity_Builder(self.n_items, initial_data_block=self.n_items*self.topK, dtype = np.float32)
 
         start_time = time.time()
         start_time_printBatch = start_time
 
         # fit each item's factors sequentially (not in parallel)
-        for currentItem in range(n_items):
+        for n_fitted, currentItem in enumerate(items_to_fit, start=1):
+
+            nonzero_model_coef_index, nonzero_model_coef_value = select_topK(*elastic_net_solver.solve(currentItem), self.topK)
+            nonzero_model_coef_col = np.full(len(nonzero_model_coef_index), currentItem)
+
+            if checkpoint is not None:
+                checkpoint.add([currentItem], nonzero_model_coef_index, nonzero_model_coef_col, nonzero_model_coef_value)
+            else:
+                similarity_builder.add_data_lists(row_list_to_add=nonzero_model_coef_index,
+                                                  col_list_to_add=nonzero_model_coef_col,
+                                                  data_list_to_add=nonzero_model_coef_value)
+
+            elapsed_time = time.time() - start_time
+            new_time_value, new_time_unit = seconds_to_biggest_unit(elapsed_time)
+
+
+            if time.time() - start_time_printBatch > 300 or n_fitted == len(items_to_fit):
+                self._print("Processed {} ({:4.1f}%) in {:.2f} {}. Items per second: {:.2f}".format(
+                    n_fitted,
+                    100.0* float(n_fitted)/len(items_to_fit),
+                    new_time_value,
+                    new_time_unit,
+                    float(n_fitted)/elapsed_time))
 
-            # get the target column
-            y = URM_train[:, currentItem].toarray()
+                sys.stdout.flush()
+                sys.stderr.flush()
+
+                start_time_printBatch = time.time()
+
+        if checkpoint is not None:
+            checkpoint.flush()
+            self.W_sparse = checkpoint.get_W_sparse()
+            checkpoint.clear()
+        else:
+            self.W_sparse = similarity_builder.get_SparseMatrix()
+
+
+
+    def fit_path(self, alphas, l1_ratio=0.007467817120176792, positive_only=True, topK = 723):
+        """
+        Fit the models of several alpha values in a single pass over the items, warm starting each alpha from the
+        solution of the previous larger one, see GramElasticNetSolver.solve_path.
+        The recommender is left unchanged, to evaluate one of the models assign it to W_sparse.
+
+        Args:
+            alphas (list): values of alpha sharing l1_ratio, positive_only and topK
+
+        Returns:
+            dict: W_sparse of each alpha
+        """
 
-            # set the j-th column of X to zero
-            start_pos = URM_train.indptr[currentItem]
-            end_pos = URM_train.indptr[currentItem + 1]
+        assert l1_ratio>= 0 and l1_ratio<=1, "{}: l1_ratio must be between 0 and 1, provided value was {}".format(self.RECOMMENDER_NAME, l1_ratio)
+        assert len(alphas) > 0, "{}: alphas must not be empty".format(self.RECOMMENDER_NAME)
+
+        URM_train = check_matrix(self.URM_train, 'csc', dtype=np.float32)
+
+        n_items = URM_train.shape[1]
 
-            current_item_data_backup = URM_train.data[start_pos: end_pos].copy()
-            URM_train.data[start_pos: end_pos] = 0.0
+        elastic_net_solver = GramElasticNetSolver(URM_train, alpha=max(alphas), l1_ratio=l1_ratio, positive_only=positive_only)
 
-            # fit one ElasticNet model per column
-            self.model.fit(URM_train, y)
+        similarity_builders = [Incremental_Similarity_Builder(self.n_items, initial_data_block=self.n_items*min(topK, 100), dtype = np.float32)
+                               for _ in alphas]
 
-            # self.model.coef_ contains the coefficient of the ElasticNet model
-            # let's keep only the non-zero values
-            nonzero_model_coef_index = self.model.sparse_coef_.indices
-            nonzero_model_coef_value = self.model.sparse_coef_.data
+        start_time = time.time()
+        start_time_printBatch = start_time
 
-            # Check if there are more data points than topK, if so, extract the set of K best values
-            if len(nonzero_model_coef_value) > self.topK:
-                # Partition the data because this operation does not require to fully sort the data
-                relevant_items_partition = np.argpartition(-np.abs(nonzero_model_coef_value), self.topK-1, axis=0)[0:self.topK]
-                nonzero_model_coef_index = nonzero_model_coef_index[relevant_items_partition]
-                nonzero_model_coef_value = nonzero_model_coef_value[relevant_items_partition]
+        for currentItem in range(n_items):
 
-            similarity_builder.add_data_lists(row_list_to_add=nonzero_model_coef_index,
-                                              col_list_to_add=np.ones(len(nonzero_model_coef_index), dtype = np.int) * currentItem,
-                                              data_list_to_add=nonzero_model_coef_value)
+            path = elastic_net_solver.solve_path(currentItem, alphas)
 
+            for similarity_builder, coefficients in zip(similarity_builders, path):
+                nonzero_model_coef_index, nonzero_model_coef_value = select_topK(*coefficients, topK)
 
-            # finally, replace the original values of the j-th column
-            URM_train.data[start_pos:end_pos] = current_item_data_backup
+                similarity_builder.add_data_lists(row_list_to_add=nonzero_model_coef_index,
+                                                  col_list_to_add=np.full(len(nonzero_model_coef_index), currentItem),
+                                                  data_list_to_add=nonzero_model_coef_value)
 
             elapsed_time = time.time() - start_time
             new_time_value, new_time_unit = seconds_to_biggest_unit(elapsed_time)
 
-
             if time.time() - start_time_printBatch > 300 or currentItem == n_items-1:
-                self._print("Processed {} ({:4.1f}%) in {:.2f} {}. Items per second: {:.2f}".format(
+                self._print("Processed {} ({:4.1f}%) for {} alphas in {:.2f} {}. Items per second: {:.2f}".format(
                     currentItem+1,
                     100.0* float(currentItem+1)/n_items,
+                    len(alphas),
                     new_time_value,
                     new_time_unit,
-                    float(currentItem)/elapsed_time))
+                    float(currentItem+1)/elapsed_time))
 
                 sys.stdout.flush()
                 sys.stderr.flush()
 
                 start_time_printBatch = time.time()
 
-        self.W_sparse = similarity_builder.get_SparseMatrix()
+        return {alpha: similarity_builder.get_SparseMatrix() for alpha, similarity_builder in zip(alphas, similarity_builders)}
 
 
 
@@ -138,20 +450,90 @@ def create_shared_memory(a):
     return shm
 
 
-@ignore_warnings(category=ConvergenceWarning)
-def _partial_fit(items, topK, alpha, l1_ratio, urm_shape, positive_only=True, shm_names=None, shm_shapes=None, shm_dtypes=None):
+class SharedCoefficientBuffer(object):
+    """
+    Preallocated shared memory COO buffer of the topK coefficients of every item.
+
+    Item i owns the slots [i*topK, (i+1)*topK) of the rows and values arrays and its fill counter nnz[i], so each
+    worker writes the items of its chunks in place without any synchronization. The slots of an item are a column
+    of W_sparse, hence the buffer becomes a CSC matrix by masking the unused slots.
+    """
+
+    def __init__(self, n_items, topK, shm_names=None):
+        """
+        Args:
+            shm_names (list): names of the rows, values and nnz shared memory blocks to attach to, None to create them
+        """
+        self.n_items = n_items
+        self.topK = topK
+
+        shapes_dtypes = [((n_items, topK), np.int32), ((n_items, topK), np.float32), ((n_items,), np.int32)]
+
+        if shm_names is None:
+            self.shms = [shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize))
+                         for shape, dtype in shapes_dtypes]
+        else:
+            self.shms = [shared_memory.SharedMemory(name=shm_name, create=False) for shm_name in shm_names]
+
+        self.rows, self.values, self.nnz = [np.ndarray(shape, dtype=dtype, buffer=shm.buf) for (shape, dtype), shm in zip(shapes_dtypes, self.shms)]
+
+        if shm_names is None:
+            self.nnz[:] = 0
+
+    def get_shm_names(self):
+        return [shm.name for shm in self.shms]
+
+    def set_item(self, item, rows, values):
+        n_coefficients = len(rows)
+        self.rows[item, :n_coefficients] = rows
+        self.values[item, :n_coefficients] = values
+        self.nnz[item] = n_coefficients
+
+    def get_items_coo(self, items):
+        """Return rows, cols and values of the coefficients of the given items"""
+        items = np.asarray(items)
+        nnz = self.nnz[items]
+        slot_mask = np.arange(self.topK) < nnz[:, None]
+        return self.rows[items][slot_mask], np.repeat(items, nnz), self.values[items][slot_mask]
+
+    def get_W_sparse(self):
+        slot_mask = np.arange(self.topK) < self.nnz[:, None]
+        indptr = np.concatenate(([0], np.cumsum(self.nnz, dtype=np.int64)))
+
+        W_sparse = sps.csc_matrix((self.values[slot_mask], self.rows[slot_mask], indptr), shape=(self.n_items, self.n_items))
+        return W_sparse.tocsr()
+
+    def close(self, unlink=False):
+        # The arrays must be released before their shared memory is closed
+        del self.rows, self.values, self.nnz
+        for shm in self.shms:
+            shm.close()
+            if unlink:
+                shm.unlink()
+
+
+def get_balanced_item_chunks(items, item_cost, n_chunks):
+    """
+    Split items in at most n_chunks chunks of similar total cost, the most expensive items first.
+
+    The first chunks hold few expensive items and the last many cheap ones, so the chunks still running when the
+    others are done are short.
+    """
+    items = np.asarray(items)
+    if len(items) == 0:
+        return []
 
-    model = ElasticNet(
-        alpha=alpha,
-        l1_ratio=l1_ratio,
-        positive=positive_only,
-        fit_intercept=False,
-        copy_X=False,
-        precompute=True,
-        selection='random',
-        max_iter=100,
-        tol=1e-4
-    )
+    items = items[np.argsort(-item_cost[items], kind="stable")]
+    cumulative_cost = np.cumsum(item_cost[items], dtype=np.float64)
+
+    n_chunks = max(1, min(n_chunks, len(items)))
+    chunk_ends = np.searchsorted(cumulative_cost, cumulative_cost[-1] * np.arange(1, n_chunks) / n_chunks, side="right")
+
+    return [chunk for chunk in np.split(items, np.unique(chunk_ends)) if len(chunk) > 0]
+
+
+def _partial_fit(items, topK, alpha, l1_ratio, urm_shape, positive_only=True, shm_names=None, shm_shapes=None, shm_dtypes=None,
+                 coefficient_shm_names=None):
 
     indptr_shm = shared_memory.SharedMemory(name=shm_names[0], create=False)
     indices_shm = shared_memory.SharedMemory(name=shm_names[1], create=False)
@@ -163,46 +545,36 @@ def _partial_fit(items, topK, alpha, l1_ratio, urm_shape, positive_only=True, sh
             np.ndarray(shm_shapes[0], dtype=shm_dtypes[0], buffer=indptr_shm.buf),
         ), shape=urm_shape)
 
-    values, rows, cols = [], [], []
-
-    for currentItem in items:
-
-        y = X_j[:, currentItem].toarray()
-
-        backup = X_j.data[X_j.indptr[currentItem]:X_j.indptr[currentItem + 1]]
-        X_j.data[X_j.indptr[currentItem]:X_j.indptr[currentItem + 1]] = 0.0
-
-        model.fit(X_j, y)
-
-        nonzero_model_coef_index = model.sparse_coef_.indices
-        nonzero_model_coef_value = model.sparse_coef_.data
+    coefficient_buffer = SharedCoefficientBuffer(urm_shape[1], topK, shm_names=coefficient_shm_names)
 
-        # Check if there are more data points than topK, if so, extract the set of K best values
-        if len(nonzero_model_coef_value) > topK:
-            # Partition the data because this operation does not require to fully sort the data
-            relevant_items_partition = np.argpartition(-np.abs(nonzero_model_coef_value), topK-1, axis=0)[0:topK]
-            nonzero_model_coef_index = nonzero_model_coef_index[relevant_items_partition]
-            nonzero_model_coef_value = nonzero_model_coef_value[relevant_items_partition]
+    elastic_net_solver = SklearnElasticNetSolver(X_j, alpha=alpha, l1_ratio=l1_ratio, positive_only=positive_only)
 
-        values.extend(nonzero_model_coef_value)
-        rows.extend(nonzero_model_coef_index)
-        cols.extend([currentItem] * len(nonzero_model_coef_index))
+    for currentItem in items:
+        coefficient_buffer.set_item(currentItem, *select_topK(*elastic_net_solver.solve(currentItem), topK))
 
-        X_j.data[X_j.indptr[currentItem]:X_j.indptr[currentItem + 1]] = backup
+    del elastic_net_solver, X_j
 
+    coefficient_buffer.close()
     indptr_shm.close()
     indices_shm.close()
     data_shm.close()
 
-    return values, rows, cols
+    return items
 
 
 
 
 class MultiThreadSLIM_SLIMElasticNetRecommender(SLIMElasticNetRecommender):
+    """
+    SLIMElasticNetRecommender fitting chunks of items in a pool of processes sharing the URM.
+    Workers write the coefficients in a SharedCoefficientBuffer and the chunks are balanced by the number of
+    interactions of their items, see get_balanced_item_chunks.
+    """
 
     def fit(self, alpha=1.0, l1_ratio=0.1, positive_only=True, topK=100,
-            verbose=True, workers=int(cpu_count()*0.3)):
+            verbose=True, workers=int(cpu_count()*0.3),
+            checkpoint_folder_path=None, checkpoint_every_n_items=1000, checkpoint_every_seconds=300,
+            chunks_per_worker=32):
 
         assert l1_ratio>= 0 and l1_ratio<=1, \
             "ElasticNet: l1_ratio must be between 0 and 1, provided value was {}".format(l1_ratio)
@@ -216,42 +588,67 @@ class MultiThreadSLIM_SLIMElasticNetRecommender(SLIMElasticNetRecommender):
 
         self.URM_train = check_matrix(self.URM_train, 'csc', dtype=np.float32)
 
+        checkpoint = None
+        items_to_fit = np.arange(self.n_items)
+
+        if checkpoint_folder_path is not None:
+            checkpoint = SLIMCheckpoint(checkpoint_folder_path, self.n_items,
+                                        {"l1_ratio": l1_ratio, "alpha": alpha, "positive_only": positive_only, "topK": topK, "solver": "sklearn",
+                                         "URM_train": get_URM_fingerprint(self.URM_train)},
+                                        checkpoint_every_n_items=checkpoint_every_n_items, checkpoint_every_seconds=checkpoint_every_seconds)
+            n_items_done = checkpoint.load()
+            items_to_fit = checkpoint.get_items_to_fit()
+
+            if n_items_done > 0:
+                self._print("Resuming from checkpoint, {} of {} items already fitted".format(n_items_done, self.n_items))
+
         indptr_shm = create_shared_memory(self.URM_train.indptr)
         indices_shm = create_shared_memory(self.URM_train.indices)
         data_shm = create_shared_memory(self.URM_train.data)
 
+        coefficient_buffer = SharedCoefficientBuffer(self.n_items, self.topK)
+
         _pfit = partial(_partial_fit, topK=self.topK, alpha=self.alpha, urm_shape=self.URM_train.shape,
                         l1_ratio=self.l1_ratio, positive_only=self.positive_only,
                         shm_names=[indptr_shm.name, indices_shm.name, data_shm.name],
                         shm_shapes=[self.URM_train.indptr.shape, self.URM_train.indices.shape, self.URM_train.data.shape],
-                        shm_dtypes=[self.URM_train.indptr.dtype, self.URM_train.indices.dtype, self.URM_train.data.dtype])
-
-        with Pool(processes=self.workers) as pool:
+                        shm_dtypes=[self.URM_train.indptr.dtype, self.URM_train.indices.dtype, self.URM_train.data.dtype],
+                        coefficient_shm_names=coefficient_buffer.get_shm_names())
 
-            pool_chunksize = 4
-            item_chunksize = 8
+        # Every item pays a solver setup on top of a cost growing with its interactions
+        item_cost = np.ediff1d(self.URM_train.indptr) + 1.0
+        itemchunks = get_balanced_item_chunks(items_to_fit, item_cost, self.workers * chunks_per_worker)
 
-            itemchunks = np.array_split(np.arange(self.n_items), int(self.n_items / item_chunksize))
-            if verbose:
-                pbar = tqdm(total=self.n_items)
+        try:
+            with Pool(processes=self.workers) as pool:
 
-            # res contains a vector of (values, rows, cols) tuples
-            values, rows, cols = [], [], []
-            for values_, rows_, cols_ in pool.imap_unordered(_pfit, itemchunks, pool_chunksize):
-                values.extend(values_)
-                rows.extend(rows_)
-                cols.extend(cols_)
                 if verbose:
-                    pbar.update(item_chunksize)
-
-        indptr_shm.close()
-        indices_shm.close()
-        data_shm.close()
-
-        indptr_shm.unlink()
-        indices_shm.unlink()
-        data_shm.unlink()
+                    pbar = tqdm(total=len(items_to_fit))
+
+                # Chunks arrive out of order, the checkpoint records the items of each one
+                for items_ in pool.imap_unordered(_pfit, itemchunks):
+                    if checkpoint is not None:
+                        checkpoint.add(items_, *coefficient_buffer.get_items_coo(items_))
+                    if verbose:
+                        pbar.update(len(items_))
+
+            # generate the sparse weight matrix
+            if checkpoint is not None:
+                checkpoint.flush()
+                self.W_sparse = checkpoint.get_W_sparse()
+                checkpoint.clear()
+            else:
+                self.W_sparse = coefficient_buffer.get_W_sparse()
+
+        finally:
+            coefficient_buffer.close(unlink=True)
+
+            indptr_shm.close()
+            indices_shm.close()
+            data_shm.close()
+
+            indptr_shm.unlink()
+            indices_shm.unlink()
+            data_shm.unlink()
 
-        # generate the sparse weight matrix
-        self.W_sparse = sps.csr_matrix((values, (rows, cols)), shape=(self.n_items, self.n_items), dtype=np.float32)
         self.URM_train = self.URM_train.tocsr()
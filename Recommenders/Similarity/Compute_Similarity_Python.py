@@ -20,8 +20,9 @@ class Incremental_Similarity_Builder:
     It is developed for all recommenders that need to build, for example, an item-item or user-user similarity one
     column at a time.
     This class uses arrays to store the partial data and only when requested creates the sparse matrix. The arrays are
-    pre-initialized with a size equal to the attribute initial_data_block. If the data points exceed the data_block size then a new
-    array of length additional_data_block is created and concatenated to the previous one. This may cause memory spikes.
+    pre-initialized with a size equal to the attribute initial_data_block. If the data points exceed the current size the arrays
+    are reallocated with at least additional_data_block more cells, or twice their size if larger, so the number of
+    reallocations grows only logarithmically with the number of data points.
     """
 
     def __init__(self, matrix_size, initial_data_block = 10000000, additional_data_block = 10000000, dtype = np.float32):
@@ -40,20 +41,35 @@ class Incremental_Similarity_Builder:
         self._data_array = np.zeros(self._initial_data_block, dtype=self._dtype_data)
 
 
+    def _ensure_capacity(self, n_data_points_to_add):
+
+        required_size = self._next_cell_pointer + n_data_points_to_add
+
+        if required_size <= len(self._row_array):
+            return
+
+        new_size = max(required_size, len(self._row_array) + self._additional_data_block, 2*len(self._row_array))
+
+        for array_name in ["_row_array", "_col_array", "_data_array"]:
+            old_array = getattr(self, array_name)
+            new_array = np.zeros(new_size, dtype=old_array.dtype)
+            new_array[:self._next_cell_pointer] = old_array[:self._next_cell_pointer]
+            setattr(self, array_name, new_array)
+
+
     def add_data_lists(self, row_list_to_add, col_list_to_add, data_list_to_add):
 
-        for data_point_index in range(len(row_list_to_add)):
+        n_data_points = len(row_list_to_add)
+
+        self._ensure_capacity(n_data_points)
 
-            if self._next_cell_pointer == len(self._row_array):
-                self._row_array = np.concatenate((self._row_array, np.zeros(self._additional_data_block, dtype=self._dtype_coordinates)))
-                self._col_array = np.concatenate((self._col_array, np.zeros(self._additional_data_block, dtype=self._dtype_coordinates)))
-                self._data_array = np.concatenate((self._data_array, np.zeros(self._additional_data_block, dtype=self._dtype_data)))
+        end_pointer = self._next_cell_pointer + n_data_points
 
-            self._row_array[self._next_cell_pointer] = row_list_to_add[data_point_index]
-            self._col_array[self._next_cell_pointer] = col_list_to_add[data_point_index]
-            self._data_array[self._next_cell_pointer] = data_list_to_add[data_point_index]
+        self._row_array[self._next_cell_pointer:end_pointer] = row_list_to_add
+        self._col_array[self._next_cell_pointer:end_pointer] = col_list_to_add
+        self._data_array[self._next_cell_pointer:end_pointer] = data_list_to_add
 
-            self._next_cell_pointer += 1
+        self._next_cell_pointer = end_pointer
 
 
 
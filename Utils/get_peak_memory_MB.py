@@ -0,0 +1,13 @@
+try:
+    import resource
+except ImportError:
+    # not available on Windows, peak memory is not reported
+    resource = None
+
+
+def get_peak_memory_MB():
+    """Return the peak resident memory of the current process in MB, or None if it cannot be measured"""
+    if resource is None:
+        return None
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
@@ -15,19 +15,23 @@ target = dataReader.load_target()
 
 URM_train, URM_validation = split_train_in_two_percentage_global_sample(urm, train_percentage=0.9)
 # Instantiate and fit hybrid recommender
-recommender = HybridRecommender(URM_train,dataReader.get_unique_items_based_on_urm(urm_df))
+recommender = HybridRecommender(URM_train)
 recommender.fit()
 
-all_items=dataReader.get_unique_items_based_on_urm(urm_df)
-impressions=Impressions(target,all_items)
+impressions = Impressions()
+impressions_count_urm = dataReader.load_impressions_count_urm()
 
 # Create CSV for submission
 recommended_items_for_each_user = {}
-recommended_items_for_each_user_updated = {}
+recommended_items_list = []
 for user_id in tqdm(target):
     recommended_items = recommender.recommend(user_id, cutoff=10, remove_seen_flag=True)
     recommended_items_for_each_user[int(user_id)] = recommended_items
-    recommended_items_for_each_user_updated[int(user_id)] = impressions.update_ranking(user_id=int(user_id),recommended_items=recommended_items)
+    recommended_items_list.append(recommended_items)
+
+# Re-rank all target users at once
+recommended_items_list_updated = impressions.update_ranking_batch(target, recommended_items_list, impressions_count_urm)
+recommended_items_for_each_user_updated = dict(zip([int(user_id) for user_id in target], recommended_items_list_updated))
 
 
 map = evaluate(recommended_items_for_each_user, URM_validation, target)
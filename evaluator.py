@@ -1,6 +1,7 @@
 from tqdm import tqdm
 import numpy as np
 import scipy.sparse as sp
+import itertools
 
 
 def mean_average_precision(recommendations: np.array, relevant_items: np.array) -> float:
@@ -13,23 +14,167 @@ def mean_average_precision(recommendations: np.array, relevant_items: np.array)
         return map_score
 
 
-def evaluate(recommended_items_for_each_user, urm_test: sp.csr_matrix, target: sp.csr_matrix):       
-    accum_map = 0
-    num_users_evaluated = 0
+def recommendations_to_array(recommendations):
+    """Turn a list of recommendation lists, possibly of different lengths, into a matrix padded with -1 on the right
 
-    for user_id in tqdm(target):
-        user_profile_start = urm_test.indptr[user_id]
-        user_profile_end = urm_test.indptr[user_id+1]
-    
-        relevant_items = urm_test.indices[user_profile_start:user_profile_end]
-    
-        if relevant_items.size == 0:
-            relevant_items = np.zeros(urm_test.indices[0])
+    Args:
+        recommendations (list or numpy.array): recommendation lists, e.g. the output of BaseRecommender.recommend
 
-        accum_map += mean_average_precision(recommended_items_for_each_user[int(user_id)], relevant_items)
-        num_users_evaluated += 1
+    Returns:
+        numpy.array, numpy.array: recommendations of shape (n_users, max length) and the length of each list
+    """
+    if isinstance(recommendations, np.ndarray) and recommendations.ndim == 2:
+        return recommendations.astype(np.int64, copy=False), np.full(recommendations.shape[0], recommendations.shape[1], dtype=np.int64)
 
-    accum_map /=  max(num_users_evaluated, 1)
+    list_lengths = np.array([len(user_recommendations) for user_recommendations in recommendations], dtype=np.int64)
+    max_length = list_lengths.max(initial=0)
 
-    return accum_map
+    recommendations_array = np.full((len(recommendations), max_length), -1, dtype=np.int64)
+    recommendations_array[np.arange(max_length) < list_lengths[:, None]] = np.fromiter(itertools.chain.from_iterable(recommendations),
+                                                                                      dtype=np.int64, count=list_lengths.sum())
+    return recommendations_array, list_lengths
 
+
+def get_relevance_matrix(recommendations_array, urm_test: sp.csr_matrix, user_id_array):
+    """Return a boolean matrix telling whether each recommended item is in the test profile of its user.
+    The test profiles of the given users are flattened into sorted user*n_items+item keys and every recommendation
+    is looked up with a single searchsorted, padding (-1) and out of range items are never relevant.
+
+    Args:
+        recommendations_array (numpy.array): recommendations of shape (n_users, k), see recommendations_to_array
+        urm_test (csr_matrix): test URM
+        user_id_array (numpy.array): UserID of each row of recommendations_array
+
+    Returns:
+        numpy.array: boolean matrix of shape (n_users, k)
+    """
+    n_items = urm_test.shape[1]
+    test_profiles = sp.csr_matrix(urm_test[user_id_array])
+    test_profiles.sort_indices()
+
+    test_keys = np.repeat(np.arange(len(user_id_array), dtype=np.int64), np.ediff1d(test_profiles.indptr)) * n_items \
+                + test_profiles.indices
+
+    valid_mask = (recommendations_array >= 0) & (recommendations_array < n_items)
+    recommendation_keys = np.arange(len(user_id_array), dtype=np.int64)[:, None] * n_items + recommendations_array
+
+    is_relevant = np.zeros(recommendations_array.shape, dtype=bool)
+    if len(test_keys) > 0:
+        position = np.minimum(np.searchsorted(test_keys, recommendation_keys[valid_mask]), len(test_keys) - 1)
+        is_relevant[valid_mask] = test_keys[position] == recommendation_keys[valid_mask]
+
+    return is_relevant
+
+
+def compute_metrics_batch(is_relevant, list_lengths, n_relevant):
+    """Precision, recall and average precision of each user, same definitions as the per-user functions
+
+    Args:
+        is_relevant (numpy.array): boolean matrix of shape (n_users, k), see get_relevance_matrix
+        list_lengths (numpy.array): length of each recommendation list, the denominator of precision
+        n_relevant (numpy.array): number of relevant items of each user, the denominator of recall
+
+    Returns:
+        numpy.array, numpy.array, numpy.array: precision, recall and average precision of each user
+    """
+    n_hits = np.sum(is_relevant, axis=1, dtype=np.float32)
+
+    # Cumulative sum: precision at 1, at 2, at 3 ...
+    precision_at_k = is_relevant * np.cumsum(is_relevant, axis=1, dtype=np.float32) / (1 + np.arange(is_relevant.shape[1]))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = n_hits / list_lengths
+        recall = n_hits / n_relevant
+        average_precision = np.sum(precision_at_k, axis=1) / np.minimum(n_relevant, list_lengths)
+
+    return precision, recall, average_precision
+
+
+def evaluate_batch(recommendations, urm_test: sp.csr_matrix, user_id_array):
+    """Mean precision, recall and MAP of the given recommendations, computed for all users at once
+
+    Args:
+        recommendations (list or numpy.array): recommendation lists of the users in user_id_array, in the same order
+        urm_test (csr_matrix): test URM
+        user_id_array (numpy.array): UserIDs
+
+    Returns:
+        float, float, float: precision, recall and MAP
+    """
+    user_id_array = np.asarray(user_id_array)
+    recommendations_array, list_lengths = recommendations_to_array(recommendations)
+
+    is_relevant = get_relevance_matrix(recommendations_array, urm_test, user_id_array)
+    n_relevant = np.ediff1d(urm_test.indptr)[user_id_array]
+
+    precision, recall, average_precision = compute_metrics_batch(is_relevant, list_lengths, n_relevant)
+
+    # Summed in user order, as the per-user loops did
+    n_users = max(len(user_id_array), 1)
+    return sum(precision.tolist()) / n_users, sum(recall.tolist()) / n_users, sum(average_precision.tolist()) / n_users
+
+
+def evaluate_recommender(recommender_object, urm_test: sp.csr_matrix, user_id_array=None, cutoff=10, block_size=1000,
+                         remove_seen_flag=True):
+    """Evaluate a recommender calling recommend on blocks of users, only the relevance matrix of a block is kept in memory
+
+    Args:
+        recommender_object (BaseRecommender): fitted recommender
+        urm_test (csr_matrix): test URM
+        user_id_array (numpy.array): UserIDs to evaluate, by default the users with at least one test item
+        cutoff (int): length of the recommendation lists, None to rank all items
+        block_size (int): number of users passed to each recommend call
+        remove_seen_flag (bool): passed to recommend
+
+    Returns:
+        float, float, float: precision, recall and MAP
+    """
+    urm_test = sp.csr_matrix(urm_test)
+
+    if user_id_array is None:
+        user_id_array = np.arange(urm_test.shape[0])[np.ediff1d(urm_test.indptr) > 0]
+
+    user_id_array = np.asarray(user_id_array)
+    n_relevant = np.ediff1d(urm_test.indptr)
+
+    precision_list = []
+    recall_list = []
+    average_precision_list = []
+
+    for block_start in range(0, len(user_id_array), block_size):
+        user_id_block = user_id_array[block_start:block_start + block_size]
+
+        recommendations = recommender_object.recommend(user_id_block, cutoff=cutoff, remove_seen_flag=remove_seen_flag)
+        recommendations_array, list_lengths = recommendations_to_array(recommendations)
+
+        is_relevant = get_relevance_matrix(recommendations_array, urm_test, user_id_block)
+        precision, recall, average_precision = compute_metrics_batch(is_relevant, list_lengths, n_relevant[user_id_block])
+
+        precision_list.extend(precision.tolist())
+        recall_list.extend(recall.tolist())
+        average_precision_list.extend(average_precision.tolist())
+
+    # Summed in user order, as the per-user loops did
+    n_users = max(len(user_id_array), 1)
+
+    return sum(precision_list) / n_users, sum(recall_list) / n_users, sum(average_precision_list) / n_users
+
+
+def evaluate(recommended_items_for_each_user, urm_test: sp.csr_matrix, target: sp.csr_matrix):
+    target = np.asarray(target)
+    recommendations_array, list_lengths = recommendations_to_array([recommended_items_for_each_user[int(user_id)] for user_id in target])
+
+    is_relevant = get_relevance_matrix(recommendations_array, urm_test, target)
+    n_relevant = np.ediff1d(urm_test.indptr)[target]
+
+    # Users without test items are scored as before: against a relevant list made of
+    # urm_test.indices[0] copies of item 0, so item 0 counts as a hit
+    empty_mask = n_relevant == 0
+    if empty_mask.any():
+        is_relevant[empty_mask] = (recommendations_array[empty_mask] == 0) & (urm_test.indices[0] > 0)
+        n_relevant = n_relevant.copy()
+        n_relevant[empty_mask] = urm_test.indices[0]
+
+    _, _, average_precision = compute_metrics_batch(is_relevant, list_lengths, n_relevant)
+
+    return sum(average_precision.tolist()) / max(len(target), 1)
@@ -17,11 +17,123 @@ from Data_Handler.DataReader import DataReader
 from tqdm import tqdm
 import numpy as np
 from numpy import linalg as LA
+import hashlib
+import weakref
 import scipy.sparse as sp
 import pandas as pd
 
 
-class HybridRecommender(BaseRecommender):
+NORMALIZATIONS = [None, "l1", "l2", "max", "zscore"]
+
+# Attributes holding the fitted model of a recommender, see get_model_fingerprint
+MODEL_ATTRIBUTE_NAMES = ["W_sparse", "USER_factors", "ITEM_factors"]
+
+
+def _normalize_rows(scores, norm="l2"):
+    """Normalize in place each row of scores, which should be a float32 array.
+
+    Args:
+        scores (numpy.array): scores of shape (n_users, n_items)
+        norm (str): "l1", "l2" or "max" divide each row by its L1, L2 or max absolute value, "zscore" subtracts the
+            row mean and divides by the row standard deviation, None leaves the scores as they are.
+            Rows whose norm is 0 are left unchanged instead of becoming NaN
+
+    Returns:
+        numpy.array: scores, normalized
+    """
+    if norm is None:
+        return scores
+
+    if norm == "l1":
+        norms = LA.norm(scores, 1, axis=1)
+    elif norm == "l2":
+        norms = LA.norm(scores, 2, axis=1)
+    elif norm == "max":
+        norms = LA.norm(scores, np.inf, axis=1)
+    elif norm == "zscore":
+        scores -= scores.mean(axis=1, keepdims=True)
+        norms = scores.std(axis=1)
+    else:
+        raise ValueError("Normalization '{}' not supported, available values are {}".format(norm, NORMALIZATIONS))
+
+    norms[norms == 0.0] = 1.0
+    scores /= norms[:, None].astype(scores.dtype, copy=False)
+    return scores
+
+
+class TieredHybridRecommender(BaseRecommender):
+    """
+    Base class of the hybrids that mix L2-normalized scores of other recommenders with weights depending on the
+    length of the user profile in URM_train_aug.
+
+    The profile lengths are read from the indptr of URM_train_aug, the users of the batch are grouped by tier and every
+    recommender of a tier is called once on the whole group, so the cost is close to the one of a batched model.
+    Each row of the result is the same as the one computed user by user.
+
+    Subclasses set TIER_UPPER_BOUNDS, the inclusive upper bound of the profile length of each tier but the last,
+    and implement _get_tier_components. Hybrids with no bounds have a single tier applied to every user.
+    """
+
+    TIER_UPPER_BOUNDS = []
+
+    def _get_tier_components(self):
+        """Return, for each tier, the list of (recommender, weight) pairs whose normalized scores are summed"""
+        raise NotImplementedError()
+
+    def _get_tier_index(self, user_id_array):
+        profile_length = np.ediff1d(sp.csr_matrix(self.URM_train_aug).indptr)[user_id_array]
+        # A profile with length equal to a bound belongs to that bound's tier
+        return np.searchsorted(self.TIER_UPPER_BOUNDS, profile_length, side="left")
+
+    def _compute_weighted_item_score(self, components, user_id_array, items_to_compute=None):
+
+        item_scores = None
+
+        for recommender, weight in components:
+            if weight == 0.0:
+                continue
+
+            w = np.asarray(recommender._compute_item_score(user_id_array, items_to_compute), dtype=np.float32)
+            _normalize_rows(w, "l2")
+            w *= weight
+
+            if item_scores is None:
+                item_scores = w
+            else:
+                item_scores += w
+
+        if item_scores is None:
+            item_scores = np.zeros((len(user_id_array), self.n_items), dtype=np.float32)
+
+        return item_scores
+
+    def _compute_item_score(self, user_id_array, items_to_compute=None):
+
+        user_id_array = np.atleast_1d(user_id_array)
+        tier_index_array = self._get_tier_index(user_id_array)
+        tier_components = self._get_tier_components()
+
+        item_weights = None
+
+        for tier_index in np.unique(tier_index_array):
+            tier_mask = tier_index_array == tier_index
+            tier_item_weights = self._compute_weighted_item_score(tier_components[tier_index], user_id_array[tier_mask], items_to_compute)
+
+            if item_weights is None:
+                item_weights = np.zeros((len(user_id_array), tier_item_weights.shape[1]), dtype=np.float32)
+
+            item_weights[tier_mask, :] = tier_item_weights
+
+        if item_weights is None:
+            item_weights = np.zeros((0, self.n_items), dtype=np.float32)
+
+        return item_weights
+
+    def _compute_item_score_per_user(self, user_id, items_to_compute=None):
+        return self._compute_item_score(np.atleast_1d(user_id), items_to_compute)
+
+
+class HybridRecommender(TieredHybridRecommender):
 
     RECOMMENDER_NAME = "Hybrid_Recommender"
 
@@ -49,27 +161,11 @@ class HybridRecommender(BaseRecommender):
         self.RP3beta.fit(alpha=0.3648761546066018,
                          beta=0.5058870363874656, topK=480, normalize_similarity=True)
 
-    def _compute_item_score(self, user_id_array, items_to_compute=None):
-
-        # num_items = 24507
-        num_items = 27968
-        # num_items=19630
-        # num_items = len(self.items) # num_items changes based on used urm
-        item_weights = np.empty([len(user_id_array), num_items])
-
-        for i in tqdm(range(len(user_id_array))):
-
-            # w = self.ItemCF._compute_item_score(user_id_array[i], items_to_compute)
-            w1 = self.RP3beta._compute_item_score(
-                user_id_array[i], items_to_compute)
-            w1 /= LA.norm(w1, 2)
-            w2 = self.SLIM_ElasticNet._compute_item_score(user_id_array[i], items_to_compute)
-            w2 /= LA.norm(w2, 2)
-            
-            w = w1 + w2
-            item_weights[i, :] = w
-
-        return item_weights
+    def _get_tier_components(self):
+        return [
+            [(self.RP3beta, 1.0),
+             (self.SLIM_ElasticNet, 1.0)],
+        ]
 
 
 '''-----------------------------------------------------------------------------------------------------------------------------'''
@@ -202,10 +298,12 @@ class HybridRecommender_3(BaseRecommender):
         return item_weights
 
 
-class HybridRecommender_4(BaseRecommender):
+class HybridRecommender_4(TieredHybridRecommender):
 
     RECOMMENDER_NAME = "Hybrid_Recommender_4"
 
+    TIER_UPPER_BOUNDS = [15, 19, 28]
+
     def __init__(self, URM_train_aug, URM_train_pow, UserKNNCF, RP3beta_pow, S_SLIM):
         """ Constructor of Hybrid_Recommender_2
         Args:
@@ -243,69 +341,24 @@ class HybridRecommender_4(BaseRecommender):
         self.S_SLIM.fit()
     '''
 
-    def _compute_item_score(self, user_id_array, items_to_compute=None):
-
-        # num_items_aug = 24507
-        num_items_pow = 27968
-        item_weights = np.empty([len(user_id_array), num_items_pow])
-
-        for i in range(len(user_id_array)):
-
-            interactions = len(self.URM_train_aug[user_id_array[i], :].indices)
+    def _get_tier_components(self):
+        return [
+            [(self.RP3beta_pow, self.RP3beta_pow_tier1_weight),
+             (self.UserKNNCF, self.UserKNNCF_tier1_weight)],
+            [(self.RP3beta_pow, self.RP3beta_pow_tier2_weight),
+             (self.UserKNNCF, self.UserKNNCF_tier2_weight)],
+            [(self.RP3beta_pow, self.RP3beta_pow_tier3_weight),
+             (self.S_SLIM, self.S_SLIM_tier3_weight)],
+            [(self.S_SLIM, 1.0)],
+        ]
 
-            if interactions <= 15:  # TIER 1
-                w1 = self.RP3beta_pow._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w1 /= LA.norm(w1, 2)
 
-                w2 = self.UserKNNCF._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w2 /= LA.norm(w2, 2)
-
-                w = self.RP3beta_pow_tier1_weight*w1 + self.UserKNNCF_tier1_weight*w2
-                # w = np.pad(w, ((0, 0), (0, num_items_pow-num_items_aug)))
-                item_weights[i, :] = w
-
-            elif interactions > 15 and interactions <= 19:  # TIER 2
-                w1 = self.RP3beta_pow._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w1 /= LA.norm(w1, 2)
-
-                w2 = self.UserKNNCF._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w2 /= LA.norm(w2, 2)
-
-                w = self.RP3beta_pow_tier2_weight*w1 + self.UserKNNCF_tier2_weight*w2
-                # w = np.pad(w, ((0, 0), (0, num_items_pow-num_items_aug)))
-                item_weights[i, :] = w
-
-            elif interactions > 19 and interactions <= 28:  # TIER 3
-                w1 = self.RP3beta_pow._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w1 /= LA.norm(w1, 2)
-
-                w2 = self.S_SLIM._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w2 /= LA.norm(w2, 2)
-
-                w = self.RP3beta_pow_tier3_weight*w1 + self.S_SLIM_tier3_weight*w2
-                item_weights[i, :] = w
-
-            else:  # TIER 4
-                w = self.S_SLIM._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w /= LA.norm(w, 2)
-                item_weights[i, :] = w
-
-            item_weights[i, :] = w
-
-        return item_weights
-
-
-class HybridRecommender_5(BaseRecommender):
+class HybridRecommender_5(TieredHybridRecommender):
 
     RECOMMENDER_NAME = "Hybrid_Recommender_5"
 
+    TIER_UPPER_BOUNDS = [15, 19, 28]
+
     def __init__(self, URM_train_aug, URM_train_pow, UserKNNCF, RP3beta_pow, S_SLIM, EASE_R):
         """ Constructor of Hybrid_Recommender_2
         Args:
@@ -349,157 +402,28 @@ class HybridRecommender_5(BaseRecommender):
         self.S_SLIM.fit()
     '''
 
-    def _compute_item_score(self, user_id_array, items_to_compute=None):
-
-        # num_items_aug = 24507
-        num_items_pow = 27968
-        item_weights = np.empty([len(user_id_array), num_items_pow])
-
-        for i in range(len(user_id_array)):
-
-            interactions = len(self.URM_train_aug[user_id_array[i], :].indices)
-
-            if interactions <= 15:  # TIER 1
-                w1 = self.RP3beta_pow._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w1 /= LA.norm(w1, 2)
-
-                w2 = self.UserKNNCF._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w2 /= LA.norm(w2, 2)
-
-                w3 = self.EASE_R._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w3 /= LA.norm(w3, 2)
-
-                w = self.RP3beta_pow_tier1_weight*w1 + \
-                    self.UserKNNCF_tier1_weight*w2 + self.EASE_R_tier1_weight*w3
-                # w = np.pad(w, ((0, 0), (0, num_items_pow-num_items_aug)))
-
-            elif interactions > 15 and interactions <= 19:  # TIER 2
-                w1 = self.RP3beta_pow._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w1 /= LA.norm(w1, 2)
-
-                w2 = self.UserKNNCF._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w2 /= LA.norm(w2, 2)
-
-                w3 = self.EASE_R._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w3 /= LA.norm(w3, 2)
-
-                w = self.RP3beta_pow_tier2_weight*w1 + \
-                    self.UserKNNCF_tier2_weight*w2 + self.EASE_R_tier2_weight*w3
-                # w = np.pad(w, ((0, 0), (0, num_items_pow-num_items_aug)))
-
-            elif interactions > 19 and interactions <= 28:  # TIER 3
-                w1 = self.RP3beta_pow._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w1 /= LA.norm(w1, 2)
-
-                w2 = self.S_SLIM._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w2 /= LA.norm(w2, 2)
-
-                w3 = self.EASE_R._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w3 /= LA.norm(w3, 2)
-
-                w = self.RP3beta_pow_tier3_weight*w1 + \
-                    self.S_SLIM_tier3_weight*w2 + self.EASE_R_tier3_weight*w3
-
-            else:  # TIER 4
-                w1 = self.S_SLIM._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w1 /= LA.norm(w1, 2)
-
-                w2 = self.EASE_R._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w2 /= LA.norm(w2, 2)
-
-                w = self.S_SLIM_tier4_weight*w1 + self.EASE_R_tier4_weight*w2
-
-            item_weights[i, :] = w
-
-        return item_weights
-
-    def _compute_item_score_per_user(self, user_id, items_to_compute=None):
-
-        interactions = len(self.URM_train_aug[user_id, :].indices)
-
-        if interactions <= 15:  # TIER 1
-
-            w1 = self.RP3beta_pow._compute_item_score(
-                user_id, items_to_compute)
-            w1 /= LA.norm(w1, 2)
-
-            w2 = self.UserKNNCF._compute_item_score(
-                user_id, items_to_compute)
-            w2 /= LA.norm(w2, 2)
-
-            w3 = self.EASE_R._compute_item_score(
-                user_id, items_to_compute)
-            w3 /= LA.norm(w3, 2)
-
-            w = self.RP3beta_pow_tier1_weight*w1 + \
-                self.UserKNNCF_tier1_weight*w2 + self.EASE_R_tier1_weight*w3
-            # w = np.pad(w, ((0, 0), (0, num_items_pow-num_items_aug)))
-
-        elif interactions > 15 and interactions <= 19:  # TIER 2
-
-            w1 = self.RP3beta_pow._compute_item_score(
-                user_id, items_to_compute)
-            w1 /= LA.norm(w1, 2)
-
-            w2 = self.UserKNNCF._compute_item_score(
-                user_id, items_to_compute)
-            w2 /= LA.norm(w2, 2)
-
-            w3 = self.EASE_R._compute_item_score(
-                user_id, items_to_compute)
-            w3 /= LA.norm(w3, 2)
-
-            w = self.RP3beta_pow_tier2_weight*w1 + \
-                self.UserKNNCF_tier2_weight*w2 + self.EASE_R_tier2_weight*w3
-            # w = np.pad(w, ((0, 0), (0, num_items_pow-num_items_aug)))
+    def _get_tier_components(self):
+        return [
+            [(self.RP3beta_pow, self.RP3beta_pow_tier1_weight),
+             (self.UserKNNCF, self.UserKNNCF_tier1_weight),
+             (self.EASE_R, self.EASE_R_tier1_weight)],
+            [(self.RP3beta_pow, self.RP3beta_pow_tier2_weight),
+             (self.UserKNNCF, self.UserKNNCF_tier2_weight),
+             (self.EASE_R, self.EASE_R_tier2_weight)],
+            [(self.RP3beta_pow, self.RP3beta_pow_tier3_weight),
+             (self.S_SLIM, self.S_SLIM_tier3_weight),
+             (self.EASE_R, self.EASE_R_tier3_weight)],
+            [(self.S_SLIM, self.S_SLIM_tier4_weight),
+             (self.EASE_R, self.EASE_R_tier4_weight)],
+        ]
 
-        elif interactions > 19 and interactions <= 28:  # TIER 3
 
-            w1 = self.RP3beta_pow._compute_item_score(
-                user_id, items_to_compute)
-            w1 /= LA.norm(w1, 2)
-
-            w2 = self.S_SLIM._compute_item_score(
-                user_id, items_to_compute)
-            w2 /= LA.norm(w2, 2)
-
-            w3 = self.EASE_R._compute_item_score(
-                user_id, items_to_compute)
-            w3 /= LA.norm(w3, 2)
-
-            w = self.RP3beta_pow_tier3_weight*w1 + \
-                self.S_SLIM_tier3_weight*w2 + self.EASE_R_tier3_weight*w3
-
-        else:  # TIER 4
-
-            w1 = self.S_SLIM._compute_item_score(
-                user_id, items_to_compute)
-            w1 /= LA.norm(w1, 2)
-
-            w2 = self.EASE_R._compute_item_score(
-                user_id, items_to_compute)
-            w2 /= LA.norm(w2, 2)
-
-            w = self.S_SLIM_tier4_weight*w1 + self.EASE_R_tier4_weight * w2
-
-        return w
-
-
-class HybridRecommender_6(BaseRecommender):
+class HybridRecommender_6(TieredHybridRecommender):
 
     RECOMMENDER_NAME = "Hybrid_Recommender_6"
 
+    TIER_UPPER_BOUNDS = [17, 19, 28]
+
     def __init__(self, URM_train_aug, URM_train_pow, UserKNNCF, RP3beta_pow, S_SLIM, EASE_R):
         self.URM_train_aug = URM_train_aug
         self.URM_train_pow = URM_train_pow
@@ -509,11 +433,12 @@ class HybridRecommender_6(BaseRecommender):
         self.EASE_R = EASE_R
         super(HybridRecommender_6, self).__init__(self.URM_train_aug)
 
-    def fit(self, UserKNNCF_tier1_weight=0.9, RP3beta_pow_tier1_weight=0.6, UserKNNCF_tier2_weight=0.7, RP3beta_pow_tier2_weight=0.9, RP3beta_pow_tier3_weight=0.6, S_SLIM_tier3_weight=1.0, tiers_block_tail_weight=0.5, EASE_R_tail_weight=0.5):
+    def fit(self, UserKNNCF_tier1_weight=0.9, RP3beta_pow_tier1_weight=0.6, UserKNNCF_tier2_weight=0.7, RP3beta_pow_tier2_weight=0.9, RP3beta_pow_tier3_weight=0.6, S_SLIM_tier3_weight=1.0, tiers_block_tail_weight=0.5, EASE_R_tail_weight=0.5, EASE_R_tier1_weight=0.5):
         """ Set the weights for every algorithm involved in the hybrid recommender """
 
         self.UserKNNCF_tier1_weight = UserKNNCF_tier1_weight
         self.RP3beta_pow_tier1_weight = RP3beta_pow_tier1_weight
+        self.EASE_R_tier1_weight = EASE_R_tier1_weight
 
         self.UserKNNCF_tier2_weight = UserKNNCF_tier2_weight
         self.RP3beta_pow_tier2_weight = RP3beta_pow_tier2_weight
@@ -524,71 +449,37 @@ class HybridRecommender_6(BaseRecommender):
         self.tiers_block_tail_weight = tiers_block_tail_weight
         self.EASE_R_tail_weight = EASE_R_tail_weight
 
-    def _compute_item_score(self, user_id_array, items_to_compute=None):
-
-        num_items_pow = 27968
-        item_weights = np.empty([len(user_id_array), num_items_pow])
-
-        for i in range(len(user_id_array)):
-
-            interactions = len(self.URM_train_aug[user_id_array[i], :].indices)
-
-            if interactions <= 17:  # TIER 1
-                w1 = self.UserKNNCF._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w1 /= LA.norm(w1, 2)
-
-                w2 = self.EASE_R._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w2 /= LA.norm(w2, 2)
-
-                w = self.UserKNNCF_tier1_weight*w1 + self.EASE_R_tier1_weight*w2
-
-            elif interactions > 15 and interactions <= 19:  # TIER 2
-                w1 = self.RP3beta_pow._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w1 /= LA.norm(w1, 2)
-
-                w2 = self.UserKNNCF._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w2 /= LA.norm(w2, 2)
-
-                w = self.RP3beta_pow_tier2_weight*w1 + self.UserKNNCF_tier2_weight*w2
+    def _get_tier_components(self):
+        return [
+            [(self.UserKNNCF, self.UserKNNCF_tier1_weight),
+             (self.EASE_R, self.EASE_R_tier1_weight)],
+            [(self.RP3beta_pow, self.RP3beta_pow_tier2_weight),
+             (self.UserKNNCF, self.UserKNNCF_tier2_weight)],
+            [(self.RP3beta_pow, self.RP3beta_pow_tier3_weight),
+             (self.S_SLIM, self.S_SLIM_tier3_weight)],
+            [(self.S_SLIM, 1.0)],
+        ]
 
-            elif interactions > 19 and interactions <= 28:  # TIER 3
-                w1 = self.RP3beta_pow._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w1 /= LA.norm(w1, 2)
-
-                w2 = self.S_SLIM._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w2 /= LA.norm(w2, 2)
-
-                w = self.RP3beta_pow_tier3_weight*w1 + self.S_SLIM_tier3_weight*w2
-
-            else:  # TIER 4
-                w = self.S_SLIM._compute_item_score(
-                    user_id_array[i], items_to_compute)
-
-            # At the end, add EASE_R
-            w1 = w  # rename w
-            w1 /= LA.norm(w1, 2)
+    def _compute_item_score(self, user_id_array, items_to_compute=None):
 
-            w2 = self.EASE_R._compute_item_score(
-                user_id_array[i], items_to_compute)
-            w2 /= LA.norm(w2, 2)
+        user_id_array = np.atleast_1d(user_id_array)
 
-            w = self.tiers_block_tail_weight*w1 + self.EASE_R_tail_weight*w2
+        # At the end, add EASE_R
+        w1 = _normalize_rows(super(HybridRecommender_6, self)._compute_item_score(user_id_array, items_to_compute), "l2")
+        w2 = _normalize_rows(np.asarray(self.EASE_R._compute_item_score(user_id_array, items_to_compute), dtype=np.float32), "l2")
 
-            item_weights[i, :] = w
+        w1 *= self.tiers_block_tail_weight
+        w1 += self.EASE_R_tail_weight*w2
 
-        return item_weights
+        return w1
 
 
-class HybridRecommender_7(BaseRecommender):
+class HybridRecommender_7(TieredHybridRecommender):
 
     RECOMMENDER_NAME = "Hybrid_Recommender_7"
 
+    TIER_UPPER_BOUNDS = [15, 19, 28]
+
     def __init__(self, URM_train_aug, URM_train_pow, UCM, UserKNNCF, RP3beta_pow, S_SLIM, EASE_R, UserKNN_CFCBF_Hybrid):
 
         self.URM_train_aug = URM_train_aug
@@ -644,102 +535,29 @@ class HybridRecommender_7(BaseRecommender):
         self.S_SLIM_tier4_weight = S_SLIM_tier4_weight
         self.EASE_R_tier4_weight = EASE_R_tier4_weight
 
-    def _compute_item_score(self, user_id_array, items_to_compute=None):
-
-        # num_items_aug = 24507
-        num_items_pow = 27968
-        item_weights = np.empty([len(user_id_array), num_items_pow])
-
-        for i in range(len(user_id_array)):
-
-            interactions = len(self.URM_train_aug[user_id_array[i], :].indices)
-
-            if interactions <= 15:  # TIER 1
-
-                w1 = self.RP3beta_pow._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w1 /= LA.norm(w1, 2)
-
-                w2 = self.UserKNNCF._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w2 /= LA.norm(w2, 2)
-
-                w3 = self.EASE_R._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w3 /= LA.norm(w3, 2)
-
-                w = self.RP3beta_pow_tier1_weight*w1 + \
-                    self.UserKNNCF_tier1_weight*w2 + self.EASE_R_tier1_weight*w3
-                # w = np.pad(w, ((0, 0), (0, num_items_pow-num_items_aug)))
-
-            elif interactions > 15 and interactions <= 19:  # TIER 2
-                w4 = self.UserKNNCB_Hybrid._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w4 /= LA.norm(w4, 2)
-
-                w1 = self.RP3beta_pow._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w1 /= LA.norm(w1, 2)
-
-                w2 = self.UserKNNCF._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w2 /= LA.norm(w2, 2)
-
-                w3 = self.EASE_R._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w3 /= LA.norm(w3, 2)
-
-                w = self.RP3beta_pow_tier2_weight*w1 + self.UserKNNCF_tier2_weight*w2 + \
-                    self.EASE_R_tier2_weight*w3 + self.UserKNNCB_Hybrid_tier2_weight*w4
-                # w = np.pad(w, ((0, 0), (0, num_items_pow-num_items_aug)))
-
-            elif interactions > 19 and interactions <= 28:  # TIER 3
-
-                w1 = self.RP3beta_pow._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w1 /= LA.norm(w1, 2)
-
-                w2 = self.S_SLIM._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w2 /= LA.norm(w2, 2)
-
-                w3 = self.EASE_R._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w3 /= LA.norm(w3, 2)
-
-                w4 = self.UserKNNCB_Hybrid._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w4 /= LA.norm(w4, 2)
-
-                w = self.RP3beta_pow_tier3_weight*w1 + self.S_SLIM_tier3_weight*w2 + \
-                    self.EASE_R_tier3_weight*w3 + self.UserKNNCB_Hybrid_tier3_weight*w4
-
-            else:  # TIER 4
-
-                w1 = self.S_SLIM._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w1 /= LA.norm(w1, 2)
-
-                w2 = self.EASE_R._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w2 /= LA.norm(w2, 2)
-
-                w3 = self.UserKNNCB_Hybrid._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w3 /= LA.norm(w3, 2)
-
-                w = self.S_SLIM_tier4_weight*w1 + self.EASE_R_tier4_weight * \
-                    w2 + self.UserKNNCB_Hybrid_tier4_weight*w3
-
-            item_weights[i, :] = w
-
-        return item_weights
+    def _get_tier_components(self):
+        return [
+            [(self.RP3beta_pow, self.RP3beta_pow_tier1_weight),
+             (self.UserKNNCF, self.UserKNNCF_tier1_weight),
+             (self.EASE_R, self.EASE_R_tier1_weight)],
+            [(self.RP3beta_pow, self.RP3beta_pow_tier2_weight),
+             (self.UserKNNCF, self.UserKNNCF_tier2_weight),
+             (self.EASE_R, self.EASE_R_tier2_weight),
+             (self.UserKNNCB_Hybrid, self.UserKNNCB_Hybrid_tier2_weight)],
+            [(self.RP3beta_pow, self.RP3beta_pow_tier3_weight),
+             (self.S_SLIM, self.S_SLIM_tier3_weight),
+             (self.EASE_R, self.EASE_R_tier3_weight),
+             (self.UserKNNCB_Hybrid, self.UserKNNCB_Hybrid_tier3_weight)],
+            [(self.S_SLIM, self.S_SLIM_tier4_weight),
+             (self.EASE_R, self.EASE_R_tier4_weight),
+             (self.UserKNNCB_Hybrid, self.UserKNNCB_Hybrid_tier4_weight)],
+        ]
 
 
 ############################################################# Hybrids per layer ###########################################################
 
 
-class Hybrid_SSLIM_EASER(BaseRecommender):
+class Hybrid_SSLIM_EASER(TieredHybridRecommender):
     RECOMMENDER_NAME = "Hybrid_SSLIM_EASER"
 
     def __init__(self, URM_train_aug, URM_train_pow, SSLIM, EASE_R):
@@ -755,43 +573,14 @@ class Hybrid_SSLIM_EASER(BaseRecommender):
         self.SSLIM_weight = SSLIM_weight
         self.EASE_R_weight = EASE_R_weight
 
-    def _compute_item_score(self, user_id_array, items_to_compute=None):
-
-        num_items_pow = 27968
-        item_weights = np.empty([len(user_id_array), num_items_pow])
-
-        for i in range(len(user_id_array)):
-
-            w1 = self.SSLIM._compute_item_score(
-                user_id_array[i], items_to_compute)
-            w1 /= LA.norm(w1, 2)
-
-            w2 = self.EASE_R._compute_item_score(
-                user_id_array[i], items_to_compute)
-            w2 /= LA.norm(w2, 2)
+    def _get_tier_components(self):
+        return [
+            [(self.SSLIM, self.SSLIM_weight),
+             (self.EASE_R, self.EASE_R_weight)],
+        ]
 
-            w = self.SSLIM_weight*w1 + self.EASE_R_weight*w2
-
-            item_weights[i, :] = w
 
-        return item_weights
-
-    def _compute_item_score_per_user(self, user_id, items_to_compute=None):
-
-        w1 = self.SSLIM._compute_item_score(
-            user_id, items_to_compute)
-        w1 /= LA.norm(w1, 2)
-
-        w2 = self.EASE_R._compute_item_score(
-            user_id, items_to_compute)
-        w2 /= LA.norm(w2, 2)
-
-        w = self.SSLIM_weight*w1 + self.EASE_R_weight*w2
-
-        return w
-
-
-class Hybrid_SSLIM_RP3B_aug(BaseRecommender):
+class Hybrid_SSLIM_RP3B_aug(TieredHybridRecommender):
     RECOMMENDER_NAME = "Hybrid_SSLIM_RP3B_aug"
 
     def __init__(self, URM_train_aug, SSLIM, RP3B):
@@ -804,44 +593,14 @@ class Hybrid_SSLIM_RP3B_aug(BaseRecommender):
         """ Set the weights for every algorithm involved in the hybrid recommender """
         self.alpha = alpha
 
-    def _compute_item_score(self, user_id_array, items_to_compute=None):
+    def _get_tier_components(self):
+        return [
+            [(self.SSLIM, self.alpha),
+             (self.RP3B, 1-self.alpha)],
+        ]
 
-        #num_items_pow = 27286
-        num_items_pow = 27968
-        item_weights = np.empty([len(user_id_array), num_items_pow])
-
-        for i in range(len(user_id_array)):
-
-            w1 = self.SSLIM._compute_item_score(
-                user_id_array[i], items_to_compute)
-            w1 /= LA.norm(w1, 2)
 
-            w2 = self.RP3B._compute_item_score(
-                user_id_array[i], items_to_compute)
-            w2 /= LA.norm(w2, 2)
-
-            w = self.alpha*w1 + (1-self.alpha)*w2
-
-            item_weights[i, :] = w
-
-        return item_weights
-
-    def _compute_item_score_per_user(self, user_id, items_to_compute=None):
-
-        w1 = self.SSLIM._compute_item_score(
-            user_id, items_to_compute)
-        w1 /= LA.norm(w1, 2)
-
-        w2 = self.RP3B._compute_item_score(
-            user_id, items_to_compute)
-        w2 /= LA.norm(w2, 2)
-
-        w = self.alpha*w1 + (1-self.alpha)*w2
-
-        return w
-
-
-class Hybrid_UserKNNCF_RP3B_aug(BaseRecommender):
+class Hybrid_UserKNNCF_RP3B_aug(TieredHybridRecommender):
     RECOMMENDER_NAME = "Hybrid_UserKNNCF_RP3B_aug"
 
     def __init__(self, URM_train_aug, URM_train_pow, UserKNNCF, RP3B):
@@ -857,43 +616,14 @@ class Hybrid_UserKNNCF_RP3B_aug(BaseRecommender):
         self.UserKNNCF_weight = UserKNNCF_weight
         self.RP3B_weight = RP3B_weight
 
-    def _compute_item_score(self, user_id_array, items_to_compute=None):
-
-        num_items_pow = 27968
-        item_weights = np.empty([len(user_id_array), num_items_pow])
-
-        for i in range(len(user_id_array)):
-
-            w1 = self.UserKNNCF._compute_item_score(
-                user_id_array[i], items_to_compute)
-            w1 /= LA.norm(w1, 2)
-
-            w2 = self.RP3B._compute_item_score(
-                user_id_array[i], items_to_compute)
-            w2 /= LA.norm(w2, 2)
-
-            w = self.UserKNNCF_weight*w1 + self.RP3B_weight*w2
-
-            item_weights[i, :] = w
-
-        return item_weights
-
-    def _compute_item_score_per_user(self, user_id, items_to_compute=None):
-
-        w1 = self.UserKNNCF._compute_item_score(
-            user_id, items_to_compute)
-        w1 /= LA.norm(w1, 2)
-
-        w2 = self.RP3B._compute_item_score(
-            user_id, items_to_compute)
-        w2 /= LA.norm(w2, 2)
-
-        w = self.UserKNNCF_weight*w1 + self.RP3B_weight*w2
-
-        return w
+    def _get_tier_components(self):
+        return [
+            [(self.UserKNNCF, self.UserKNNCF_weight),
+             (self.RP3B, self.RP3B_weight)],
+        ]
 
 
-class Hybrid_UserKNNCF_ItemKNNCF(BaseRecommender):
+class Hybrid_UserKNNCF_ItemKNNCF(TieredHybridRecommender):
     RECOMMENDER_NAME = "Hybrid_UserKNNCF_ItemKNNCF"
 
     def __init__(self, URM_train_aug, URM_train_pow, UserKNNCF, ItemKNNCF):
@@ -908,42 +638,14 @@ class Hybrid_UserKNNCF_ItemKNNCF(BaseRecommender):
 
         self.alpha = alpha
 
-    def _compute_item_score(self, user_id_array, items_to_compute=None):
-
-        num_items_pow = 27968
-        item_weights = np.empty([len(user_id_array), num_items_pow])
-
-        for i in range(len(user_id_array)):
-
-            w1 = self.UserKNNCF._compute_item_score(
-                user_id_array[i], items_to_compute)
-            w1 /= LA.norm(w1, 2)
+    def _get_tier_components(self):
+        return [
+            [(self.UserKNNCF, self.alpha),
+             (self.ItemKNNCF, 1-self.alpha)],
+        ]
 
-            w2 = self.ItemKNNCF._compute_item_score(
-                user_id_array[i], items_to_compute)
-            w2 /= LA.norm(w2, 2)
-
-            w = self.alpha*w1 + (1-self.alpha)*w2
-
-            item_weights[i, :] = w
-
-        return item_weights
-
-    def _compute_item_score_per_user(self, user_id, items_to_compute=None):
 
-        w1 = self.UserKNNCF._compute_item_score(
-            user_id, items_to_compute)
-        w1 /= LA.norm(w1, 2)
-
-        w2 = self.ItemKNNCF._compute_item_score(
-            user_id, items_to_compute)
-        w2 /= LA.norm(w2, 2)
-
-        w = self.UserKNNCF_weight*w1 + self.ItemKNNCF_weight*w2
-
-        return w
-
-class Hybrid_HybridSSLIMRP3B_UserKNNCF(BaseRecommender):
+class Hybrid_HybridSSLIMRP3B_UserKNNCF(TieredHybridRecommender):
     RECOMMENDER_NAME = "Hybrid_HybridSSLIMRP3B_UserKNNCF"
 
     def __init__(self, URM_train_aug, URM_train_pow, Hybrid_SSLIM_RP3B_aug, UserKNNCF):
@@ -959,42 +661,14 @@ class Hybrid_HybridSSLIMRP3B_UserKNNCF(BaseRecommender):
         self.UserKNNCF_weight = UserKNNCF_weight
         self.Hybrid_weight = Hybrid_weight
 
-    def _compute_item_score(self, user_id_array, items_to_compute=None):
+    def _get_tier_components(self):
+        return [
+            [(self.UserKNNCF, self.UserKNNCF_weight),
+             (self.Hybrid_SSLIM_RP3B_aug, self.Hybrid_weight)],
+        ]
 
-        num_items_pow = 27968
-        item_weights = np.empty([len(user_id_array), num_items_pow])
 
-        for i in range(len(user_id_array)):
-
-            w1 = self.UserKNNCF._compute_item_score(
-                user_id_array[i], items_to_compute)
-            w1 /= LA.norm(w1, 2)
-
-            w2 = self.Hybrid_SSLIM_RP3B_aug._compute_item_score_per_user(
-                user_id_array[i], items_to_compute)
-            w2 /= LA.norm(w2, 2)
-
-            w = self.UserKNNCF_weight*w1 + self.Hybrid_weight*w2
-
-            item_weights[i, :] = w
-
-        return item_weights
-
-    def _compute_item_score_per_user(self, user_id, items_to_compute=None):
-
-        w1 = self.UserKNNCF._compute_item_score(
-            user_id, items_to_compute)
-        w1 /= LA.norm(w1, 2)
-
-        w2 = self.Hybrid_SSLIM_RP3B_aug._compute_item_score_per_user(
-            user_id, items_to_compute)
-        w2 /= LA.norm(w2, 2)
-
-        w = self.UserKNNCF_weight*w1 + self.Hybrid_weight*w2
-
-        return w
-
-class Hybrid_User_and_Item_KNN_CFCBF_Hybrid(BaseRecommender):
+class Hybrid_User_and_Item_KNN_CFCBF_Hybrid(TieredHybridRecommender):
     RECOMMENDER_NAME = "Hybrid_User_and_Item_KNN_CFCBF_Hybrid"
 
     def __init__(self, URM_train_aug, URM_train_pow, ItemKNN_CFCBF_Hybrid_Recommender, UserKNN_CFCBF_Hybrid_Recommender):
@@ -1011,42 +685,11 @@ class Hybrid_User_and_Item_KNN_CFCBF_Hybrid(BaseRecommender):
         self.ItemKNN_CFCBF_Hybrid_Recommender_weight = ItemKNN_CFCBF_Hybrid_Recommender_weight
         self.UserKNN_CFCBF_Hybrid_Recommender_weight = UserKNN_CFCBF_Hybrid_Recommender_weight
 
-    def _compute_item_score(self, user_id_array, items_to_compute=None):
-
-        num_items_pow = 27968
-        item_weights = np.empty([len(user_id_array), num_items_pow])
-
-        for i in range(len(user_id_array)):
-
-            w1 = self.ItemKNN_CFCBF_Hybrid_Recommender._compute_item_score(
-                user_id_array[i], items_to_compute)
-            w1 /= LA.norm(w1, 2)
-
-            w2 = self.UserKNN_CFCBF_Hybrid_Recommender._compute_item_score(
-                user_id_array[i], items_to_compute)
-            w2 /= LA.norm(w2, 2)
-
-            w = self.ItemKNN_CFCBF_Hybrid_Recommender_weight*w1 + \
-                self.UserKNN_CFCBF_Hybrid_Recommender_weight*w2
-
-            item_weights[i, :] = w
-
-        return item_weights
-
-    def _compute_item_score_per_user(self, user_id, items_to_compute=None):
-
-        w1 = self.ItemKNN_CFCBF_Hybrid_Recommender._compute_item_score(
-            user_id, items_to_compute)
-        w1 /= LA.norm(w1, 2)
-
-        w2 = self.UserKNN_CFCBF_Hybrid_Recommender._compute_item_score(
-            user_id, items_to_compute)
-        w2 /= LA.norm(w2, 2)
-
-        w = self.ItemKNN_CFCBF_Hybrid_Recommender_weight*w1 + \
-            self.UserKNN_CFCBF_Hybrid_Recommender_weight*w2
-
-        return w
+    def _get_tier_components(self):
+        return [
+            [(self.ItemKNN_CFCBF_Hybrid_Recommender, self.ItemKNN_CFCBF_Hybrid_Recommender_weight),
+             (self.UserKNN_CFCBF_Hybrid_Recommender, self.UserKNN_CFCBF_Hybrid_Recommender_weight)],
+        ]
 
 
 #######################################################################################################
@@ -1054,10 +697,12 @@ class Hybrid_User_and_Item_KNN_CFCBF_Hybrid(BaseRecommender):
 #######################################################################################################
 
 
-class Hybrid_of_Hybrids(BaseRecommender):
+class Hybrid_of_Hybrids(TieredHybridRecommender):
 
     RECOMMENDER_NAME = "Hybrid_of_Hybrids"
 
+    TIER_UPPER_BOUNDS = [22, 24]
+
     def __init__(self, URM_train_aug, Hybrid_SSLIM_RP3B_aug, UserKNNCF, S_SLIM):
 
         self.URM_train_aug = URM_train_aug
@@ -1075,64 +720,23 @@ class Hybrid_of_Hybrids(BaseRecommender):
         self.beta = beta
         self.gamma = gamma
 
-    def _compute_item_score(self, user_id_array, items_to_compute=None):
-
-        num_items_pow = 27286
-        #num_items_pow = 27968
-        item_weights = np.empty([len(user_id_array), num_items_pow])
-
-        for i in range(len(user_id_array)):
-
-            interactions = len(self.URM_train_aug[user_id_array[i], :].indices)
-
-            if interactions <= 22:  # TIER 1
-
-                w1 = self.Hybrid1_tier1._compute_item_score_per_user(
-                    user_id_array[i], items_to_compute)
-                w1 /= LA.norm(w1, 2)
-
-                w2 = self.UserKNNCF._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w2 /= LA.norm(w2, 2)
-
-                w = self.alpha*w1 + (1-self.alpha)*w2
+    def _get_tier_components(self):
+        return [
+            [(self.Hybrid_SSLIM_RP3B_aug, self.alpha),
+             (self.UserKNNCF, 1-self.alpha)],
+            [(self.Hybrid_SSLIM_RP3B_aug, self.beta),
+             (self.UserKNNCF, 1-self.beta)],
+            [(self.Hybrid_SSLIM_RP3B_aug, self.gamma),
+             (self.S_SLIM, 1-self.gamma)],
+        ]
 
-            elif interactions > 22 and interactions <= 24:  # TIER 2
 
-                w1 = self.Hybrid1_tier1._compute_item_score_per_user(
-                    user_id_array[i], items_to_compute)
-                w1 /= LA.norm(w1, 2)
-
-                w2 = self.UserKNNCF._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w2 /= LA.norm(w2, 2)
-
-                w = self.beta*w1 + (1-self.beta)*w2
-
-            else:  # TIER 3
-
-                w1 = self.Hybrid1_tier1._compute_item_score_per_user(
-                    user_id_array[i], items_to_compute)
-                w1 /= LA.norm(w1, 2)
-
-                w2 = self.S_SLIM._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w2 /= LA.norm(w2, 2)
-
-                w = self.gamma*w1 +(1- self.gamma)*w2
-
-            item_weights[i, :] = w
-
-        return item_weights
-
-
-
-# 0.06021
-
-class Hybrid_Best(BaseRecommender):
+class Hybrid_Best(TieredHybridRecommender):
 
     RECOMMENDER_NAME = "Hybrid_Best"
 
+    TIER_UPPER_BOUNDS = [22, 24]
+
     def __init__(self, URM_train_aug, URM_train_pow, ICM, UCM, Hybrid_SSLIM_RP3B_aug=None, Hybrid_UserKNNCF_ItemKNNCF=None, UserKNNCF=None, Hybrid_UserKNNCF_RP3B_aug=None, Hybrid_SSLIM_EASER=None):
 
         self.URM_train_aug = URM_train_aug
@@ -1185,115 +789,23 @@ class Hybrid_Best(BaseRecommender):
         self.Hybrid_1_tier3_weight = Hybrid_1_tier3_weight
         self.Hybrid_2_tier3_weight = Hybrid_2_tier3_weight
 
-    def _compute_item_score(self, user_id_array, items_to_compute=None):
-
-        num_items_pow = 27968
-        item_weights = np.empty([len(user_id_array), num_items_pow])
-
-        for i in range(len(user_id_array)):
-
-            interactions = len(self.URM_train_aug[user_id_array[i], :].indices)
-
-            if interactions <= 22:  # TIER 1
-
-                w1 = self.Hybrid_SSLIM_RP3B_aug._compute_item_score_per_user(
-                    user_id_array[i], items_to_compute)
-                w1 /= LA.norm(w1, 2)
-
-                w2 = self.UserKNNCF._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w2 /= LA.norm(w2, 2)
-
-                '''
-                w3 = self.Hybrid_3_tier2._compute_item_score_per_user(
-                    user_id_array[i], items_to_compute)
-                w3 /= LA.norm(w3, 2)
-                '''
-
-                w = self.Hybrid_1_tier1_weight*w1 + self.Hybrid_2_tier1_weight*w2
-
-            elif interactions > 22 and interactions <= 24:  # TIER 2
-
-                w1 = self.Hybrid_SSLIM_RP3B_aug._compute_item_score_per_user(
-                    user_id_array[i], items_to_compute)
-                w1 /= LA.norm(w1, 2)
-
-                w2 = self.UserKNNCF._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w2 /= LA.norm(w2, 2)
-
-                w = self.Hybrid_1_tier2_weight*w1 + self.Hybrid_2_tier2_weight*w2
-
-            else:  # TIER 3
-
-                w1 = self.Hybrid_SSLIM_RP3B_aug._compute_item_score_per_user(
-                    user_id_array[i], items_to_compute)
-                w1 /= LA.norm(w1, 2)
-
-                w2 = self.Hybrid_SSLIM_EASER._compute_item_score_per_user(
-                    user_id_array[i], items_to_compute)
-                w2 /= LA.norm(w2, 2)
-
-                w = self.Hybrid_1_tier3_weight*w1 + self.Hybrid_2_tier3_weight*w2
-
-            item_weights[i, :] = w
-
-        return item_weights
-
-    def _compute_item_score_per_user(self, user_id, items_to_compute=None):
-
-        interactions = len(self.URM_train_aug[user_id, :].indices)
-
-        if interactions <= 22:  # TIER 1
-
-            w1 = self.Hybrid_SSLIM_RP3B_aug._compute_item_score_per_user(
-                user_id, items_to_compute)
-            w1 /= LA.norm(w1, 2)
-
-            w2 = self.UserKNNCF._compute_item_score(
-                user_id, items_to_compute)
-            w2 /= LA.norm(w2, 2)
-
-            '''
-            w3 = self.Hybrid_3_tier2._compute_item_score_per_user(
-                user_id_array[i], items_to_compute)
-            w3 /= LA.norm(w3, 2)
-            '''
-
-            w = self.Hybrid_1_tier1_weight*w1 + self.Hybrid_2_tier1_weight*w2
-
-        elif interactions > 22 and interactions <= 24:  # TIER 2
-
-            w1 = self.Hybrid_SSLIM_RP3B_aug._compute_item_score_per_user(
-                user_id, items_to_compute)
-            w1 /= LA.norm(w1, 2)
+    def _get_tier_components(self):
+        return [
+            [(self.Hybrid_SSLIM_RP3B_aug, self.Hybrid_1_tier1_weight),
+             (self.UserKNNCF, self.Hybrid_2_tier1_weight)],
+            [(self.Hybrid_SSLIM_RP3B_aug, self.Hybrid_1_tier2_weight),
+             (self.UserKNNCF, self.Hybrid_2_tier2_weight)],
+            [(self.Hybrid_SSLIM_RP3B_aug, self.Hybrid_1_tier3_weight),
+             (self.Hybrid_SSLIM_EASER, self.Hybrid_2_tier3_weight)],
+        ]
 
-            w2 = self.UserKNNCF._compute_item_score(
-                user_id, items_to_compute)
-            w2 /= LA.norm(w2, 2)
 
-            w = self.Hybrid_1_tier2_weight*w1 + self.Hybrid_2_tier2_weight*w2
-
-        else:  # TIER 3
-
-            w1 = self.Hybrid_SSLIM_RP3B_aug._compute_item_score_per_user(
-                user_id, items_to_compute)
-            w1 /= LA.norm(w1, 2)
-
-            w2 = self.Hybrid_SSLIM_EASER._compute_item_score_per_user(
-                user_id, items_to_compute)
-            w2 /= LA.norm(w2, 2)
-
-            w = self.Hybrid_1_tier3_weight*w1 + self.Hybrid_2_tier3_weight*w2
-
-        return w
-
-
-
-class Hybrid_006022(BaseRecommender):
+class Hybrid_006022(TieredHybridRecommender):
 
     RECOMMENDER_NAME = "Hybrid_006022"
 
+    TIER_UPPER_BOUNDS = [22, 24]
+
     def __init__(self, URM_train_aug, URM_train_pow, ICM, UCM, Hybrid1_tier1=None, Hybrid2_tier1=None):
 
         self.URM_train_aug = URM_train_aug
@@ -1318,164 +830,187 @@ class Hybrid_006022(BaseRecommender):
 
         self.Hybrid_1_tier3_weight = Hybrid_1_tier3_weight
 
-    def _compute_item_score(self, user_id_array, items_to_compute=None):
+    def _get_tier_components(self):
+        return [
+            [(self.Hybrid1_tier1, self.Hybrid_1_tier1_weight),
+             (self.Hybrid2_tier1, self.Hybrid_2_tier1_weight)],
+            [(self.Hybrid1_tier1, self.Hybrid_1_tier2_weight),
+             (self.Hybrid2_tier1, self.Hybrid_2_tier2_weight)],
+            [(self.Hybrid1_tier1, self.Hybrid_1_tier3_weight)],
+        ]
 
-        num_items_pow = 27968
-        item_weights = np.empty([len(user_id_array), num_items_pow])
 
-        for i in range(len(user_id_array)):
+###################################################################
+########################## LINEAR HYBRID ##########################
 
-            interactions = len(self.URM_train_aug[user_id_array[i], :].indices)
+def _get_model_arrays(recommender):
+    """The MODEL_ATTRIBUTE_NAMES arrays of a fitted recommender, its URM_train if it has none, e.g. a hybrid"""
+    model_arrays = [getattr(recommender, name, None) for name in MODEL_ATTRIBUTE_NAMES]
+    model_arrays = [array for array in model_arrays if array is not None]
 
-            if interactions <= 22:  # TIER 1
+    return model_arrays if len(model_arrays) > 0 else [recommender.URM_train]
 
-                w1 = self.Hybrid1_tier1._compute_item_score_per_user(
-                    user_id_array[i], items_to_compute)
-                w1 /= LA.norm(w1, 2)
 
-                w2 = self.Hybrid2_tier1._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w2 /= LA.norm(w2, 2)
+def get_model_fingerprint(recommender):
+    """
+    Cheap fingerprint of the fitted model of a recommender: RECOMMENDER_NAME, shape, nnz and sha1 of its W_sparse or
+    latent factors, see _get_model_arrays. Two models of the same class fitted with different hyperparameters or
+    data have different fingerprints, the hybrids without a model of their own are told apart by their URM_train only.
+    """
+    sha1 = hashlib.sha1(recommender.RECOMMENDER_NAME.encode("utf-8"))
 
-                w = self.Hybrid_1_tier1_weight*w1 + self.Hybrid_2_tier1_weight*w2
+    for array in _get_model_arrays(recommender):
+        if sp.issparse(array):
+            array = sp.csr_matrix(array)
+            sha1.update(repr((array.shape, array.nnz, array.dtype.str)).encode("utf-8"))
+            for array_part in [array.indptr, array.indices, array.data]:
+                sha1.update(np.ascontiguousarray(array_part))
+        else:
+            array = np.ascontiguousarray(array)
+            sha1.update(repr((array.shape, array.dtype.str)).encode("utf-8"))
+            sha1.update(array)
 
-            elif interactions > 22 and interactions <= 24:  # TIER 2
+    return sha1.hexdigest()
 
-                w1 = self.Hybrid1_tier1._compute_item_score_per_user(
-                    user_id_array[i], items_to_compute)
-                w1 /= LA.norm(w1, 2)
 
-                w2 = self.Hybrid2_tier1._compute_item_score(
-                    user_id_array[i], items_to_compute)
-                w2 /= LA.norm(w2, 2)
+class LinearHybrid(BaseRecommender):
+    """
+    Weighted sum of the scores of any number of fitted recommenders, each normalized row by row.
 
-                w = self.Hybrid_1_tier2_weight*w1 + self.Hybrid_2_tier2_weight*w2
+    The scores are computed in float32 and normalized in place, then accumulated into a single output buffer.
+    If a score_cache is given, the normalized scores of each recommender are stored in it and reused on the next
+    calls with the same users, so that when tuning the weights over frozen recommenders only the weighted sum is
+    computed again. Any object with dict-like get and item assignment can be used, e.g. a dict for small user sets.
+    The scores are cached under the name of the recommender, its RECOMMENDER_NAME by default, and its
+    get_model_fingerprint, so that differently fitted models of the same class sharing a cache, or a refit one,
+    do not read each other's scores. The hybrids without a model of their own need a distinct name.
+    """
 
-            else:  # TIER 3
+    RECOMMENDER_NAME = "LinearHybrid"
 
-                w1 = self.Hybrid1_tier1._compute_item_score_per_user(
-                    user_id_array[i], items_to_compute)
-                w1 /= LA.norm(w1, 2)
+    def __init__(self, URM_train, recommenders, score_cache=None, names=None, verbose=True):
+        """
+        Args:
+            names (list): name of each recommender in the score cache, its RECOMMENDER_NAME if None
+        """
+        super(LinearHybrid, self).__init__(URM_train, verbose=verbose)
 
-                w = self.Hybrid_1_tier3_weight*w1 
+        self.recommenders = list(recommenders)
+        self.score_cache = score_cache
+        self.names = [recommender.RECOMMENDER_NAME for recommender in self.recommenders] if names is None else list(names)
 
-            item_weights[i, :] = w
+        assert len(self.names) == len(self.recommenders), "{}: {} names given for {} recommenders".format(
+            self.RECOMMENDER_NAME, len(self.names), len(self.recommenders))
 
-        return item_weights
+        # Weak references to the model arrays of each recommender and their fingerprint, see _get_model_fingerprint
+        self._model_fingerprints = {}
 
-    def _compute_item_score_per_user(self, user_id, items_to_compute=None):
+    def fit(self, weights=None, norm="l2"):
+        """
+        Args:
+            weights (list): weight of each recommender, all 1.0 if None
+            norm (str): row normalization applied to the scores of each recommender, see NORMALIZATIONS
+        """
+        if weights is None:
+            weights = [1.0]*len(self.recommenders)
 
-        interactions = len(self.URM_train_aug[user_id, :].indices)
+        assert len(weights) == len(self.recommenders), "{}: {} weights given for {} recommenders".format(
+            self.RECOMMENDER_NAME, len(weights), len(self.recommenders))
+        assert norm in NORMALIZATIONS, "{}: normalization '{}' not supported, available values are {}".format(
+            self.RECOMMENDER_NAME, norm, NORMALIZATIONS)
 
-        if interactions <= 22:  # TIER 1
+        self.weights = [float(weight) for weight in weights]
+        self.norm = norm
 
-            w1 = self.Hybrid1_tier1._compute_item_score_per_user(
-                user_id, items_to_compute)
-            w1 /= LA.norm(w1, 2)
+    def _get_model_fingerprint(self, recommender_index):
+        """get_model_fingerprint of a recommender, computed again only when its model arrays are replaced, e.g. by a refit"""
+        model_arrays = _get_model_arrays(self.recommenders[recommender_index])
+        model_array_references, fingerprint = self._model_fingerprints.get(recommender_index, ([], None))
 
-            w2 = self.Hybrid2_tier1._compute_item_score(
-                user_id, items_to_compute)
-            w2 /= LA.norm(w2, 2)
+        if len(model_array_references) != len(model_arrays) or \
+                any(reference() is not array for reference, array in zip(model_array_references, model_arrays)):
+            fingerprint = get_model_fingerprint(self.recommenders[recommender_index])
+            self._model_fingerprints[recommender_index] = ([weakref.ref(array) for array in model_arrays], fingerprint)
 
-            w = self.Hybrid_1_tier1_weight*w1 + self.Hybrid_2_tier1_weight*w2
+        return fingerprint
 
-        elif interactions > 22 and interactions <= 24:  # TIER 2
+    def _get_normalized_item_score(self, recommender_index, user_id_array, items_to_compute=None):
+        """Return the normalized scores of one recommender, and whether they are shared with the score cache"""
 
-            w1 = self.Hybrid1_tier1._compute_item_score_per_user(
-                user_id, items_to_compute)
-            w1 /= LA.norm(w1, 2)
+        use_cache = self.score_cache is not None and items_to_compute is None
 
-            w2 = self.Hybrid2_tier1._compute_item_score(
-                user_id, items_to_compute)
-            w2 /= LA.norm(w2, 2)
+        if use_cache:
+            key = (recommender_index, self.names[recommender_index], self._get_model_fingerprint(recommender_index), self.norm,
+                   hashlib.sha1(np.ascontiguousarray(user_id_array, dtype=np.int64).tobytes()).hexdigest())
+            item_scores = self.score_cache.get(key)
+            if item_scores is not None:
+                return item_scores, True
 
-            w = self.Hybrid_1_tier2_weight*w1 + self.Hybrid_2_tier2_weight*w2
+        item_scores = np.array(self.recommenders[recommender_index]._compute_item_score(user_id_array, items_to_compute), dtype=np.float32)
+        _normalize_rows(item_scores, self.norm)
 
-        else:  # TIER 3
+        if use_cache:
+            # Return the stored scores, so that every call reads the same values whatever the dtype of the cache
+            self.score_cache[key] = item_scores
+            return self.score_cache[key], True
 
-            w1 = self.Hybrid1_tier1._compute_item_score_per_user(
-                user_id, items_to_compute)
-            w1 /= LA.norm(w1, 2)
+        return item_scores, False
 
-            w = self.Hybrid_1_tier3_weight*w1
-        return w
+    def _compute_item_score(self, user_id_array, items_to_compute=None):
 
+        user_id_array = np.atleast_1d(user_id_array)
+        item_weights = np.zeros((len(user_id_array), self.n_items), dtype=np.float32)
+        weighted_scores = None
 
-###################################################################
-########################## LINEAR HYBRID ##########################
+        for recommender_index, weight in enumerate(self.weights):
+            if weight == 0.0:
+                continue
 
-class Linear_Hybrid(BaseRecommender):
-    RECOMMENDER_NAME = "Linear_Hybrid"
+            item_scores, is_shared = self._get_normalized_item_score(recommender_index, user_id_array, items_to_compute)
 
-    def __init__(self, URM_train, recommender_1, recommender_2, recommender_3, recommender_4, recommender_5, recommender_6, recommender_7):
-        super(Linear_Hybrid, self).__init__(URM_train)
+            if is_shared:
+                # Do not modify the cached scores, reuse a single temporary buffer instead
+                if weighted_scores is None:
+                    weighted_scores = np.empty_like(item_weights)
+                np.multiply(item_scores, weight, out=weighted_scores)
+                item_weights += weighted_scores
+            else:
+                item_scores *= weight
+                item_weights += item_scores
 
-        self.URM_train = sps.csr_matrix(URM_train)
-        self.recommender_1 = recommender_1
-        self.recommender_2 = recommender_2
-        self.recommender_3 = recommender_3
-        self.recommender_4 = recommender_4
-        self.recommender_5 = recommender_5
-        self.recommender_6 = recommender_6
-        self.recommender_7 = recommender_7
+        return item_weights
 
-        
-    def fit(self, alpha = 0.5, beta =0.5, teta = 0.5, gamma = 0.5, delta = 0.5, sigma = 0.5, rho = 0.5):
-        
-        self.alpha = alpha
-        self.beta = beta
-        self.teta = teta
-        self.gamma = gamma
-        self.delta = delta
-        self.sigma = sigma
-        self.rho = rho
+    def _compute_item_score_per_user(self, user_id, items_to_compute=None):
+        return self._compute_item_score(np.atleast_1d(user_id), items_to_compute)
 
 
-    def _compute_item_score(self, user_id_array, items_to_compute):
-        
-        item_weights_1 = self.recommender_1._compute_item_score(user_id_array,items_to_compute)
-        item_weights_2 = self.recommender_2._compute_item_score(user_id_array,items_to_compute)
-        item_weights_3 = self.recommender_3._compute_item_score(user_id_array,items_to_compute)
-        item_weights_4 = self.recommender_4._compute_item_score(user_id_array,items_to_compute)
-        item_weights_5 = self.recommender_5._compute_item_score(user_id_array,items_to_compute)
-        item_weights_6 = self.recommender_6._compute_item_score(user_id_array,items_to_compute)
-        item_weights_7 = self.recommender_7._compute_item_score(user_id_array,items_to_compute)
-
-        norm_item_weights_1 = LA.norm(item_weights_1, 2)
-        norm_item_weights_2 = LA.norm(item_weights_2, 2)
-        norm_item_weights_3 = LA.norm(item_weights_3, 2)
-        norm_item_weights_4 = LA.norm(item_weights_4, 2)
-        norm_item_weights_5 = LA.norm(item_weights_5, 2)
-        norm_item_weights_6 = LA.norm(item_weights_4, 2)
-        norm_item_weights_7 = LA.norm(item_weights_5, 2)
-
-        #item_weights = item_weights_1 * self.alpha + item_weights_2 * self.beta + item_weights_3 * self.teta + item_weights_4 * self.gamma + self.teta + item_weights_5 * self.delta + item_weights_6 * self.sigma + item_weights_7 * self.rho
-        item_weights = (item_weights_1 / norm_item_weights_1) * self.alpha + (item_weights_2 / norm_item_weights_2) * self.beta + (item_weights_3 / norm_item_weights_3) * self.teta + (item_weights_4 / norm_item_weights_4) * self.gamma + (item_weights_5 / norm_item_weights_5) * self.delta + (item_weights_6 / norm_item_weights_6) * self.sigma + (item_weights_7 / norm_item_weights_7) * self.rho
+class Linear_Hybrid(LinearHybrid):
+    """
+    LinearHybrid with the parameter names used in the tuning scripts, one weight per recommender in the order
+    alpha, beta, teta, gamma, delta, sigma, rho. With two recommenders and no beta, beta is 1-alpha.
+    """
 
+    RECOMMENDER_NAME = "Linear_Hybrid"
 
-        return item_weights
+    WEIGHT_NAMES = ["alpha", "beta", "teta", "gamma", "delta", "sigma", "rho"]
 
-    
-    def _compute_item_score_per_user(self, user_id_array, items_to_compute):
-        
-        item_weights_1 = self.recommender_1._compute_item_score_per_user(user_id_array,items_to_compute)
-        item_weights_2 = self.recommender_2._compute_item_score(user_id_array,items_to_compute)
+    # Norm orders accepted by numpy.linalg.norm and the equivalent row normalization
+    NORM_ORDERS = {1: "l1", 2: "l2", np.inf: "max"}
 
-        norm_item_weights_1 = LA.norm(item_weights_1, self.norm)
-        norm_item_weights_2 = LA.norm(item_weights_2, self.norm)
-        
-        '''
-        if norm_item_weights_1 == 0:
-            raise ValueError("Norm {} of item weights for recommender 1 is zero. Avoiding division by zero".format(self.norm))
-        
-        if norm_item_weights_2 == 0:
-            raise ValueError("Norm {} of item weights for recommender 2 is zero. Avoiding division by zero".format(self.norm))
-        '''
-        if norm_item_weights_2 == 0 and self.recommender_2==EASE_R_Recommender:
-            item_weights = (item_weights_1 / norm_item_weights_1)
-        else:
-            item_weights = (item_weights_1 / norm_item_weights_1) * self.alpha + (item_weights_2 / norm_item_weights_2) * (1-self.alpha)
-        return item_weights
+    def __init__(self, URM_train, *recommenders, score_cache=None, names=None):
+        assert 0 < len(recommenders) <= len(self.WEIGHT_NAMES), "{}: between 1 and {} recommenders are supported, {} given".format(
+            self.RECOMMENDER_NAME, len(self.WEIGHT_NAMES), len(recommenders))
+
+        super(Linear_Hybrid, self).__init__(URM_train, recommenders, score_cache=score_cache, names=names)
+
+    def fit(self, alpha=0.5, beta=None, teta=0.5, gamma=0.5, delta=0.5, sigma=0.5, rho=0.5, norm=2):
+
+        if beta is None:
+            beta = 1-alpha if len(self.recommenders) == 2 else 0.5
+
+        weights = [alpha, beta, teta, gamma, delta, sigma, rho][:len(self.recommenders)]
+
+        super(Linear_Hybrid, self).fit(weights=weights, norm=self.NORM_ORDERS.get(norm, norm))
 
 
 
@@ -1,5 +1,6 @@
 from Data_Handler.DataReader import DataReader
 import numpy as np
+import itertools
 
 
 class Impressions(object):
@@ -32,4 +33,52 @@ class Impressions(object):
             new_ranking= sorted(recommended_items, key=lambda x:sorted_presentations[x], reverse=False) # ascending order
             return new_ranking
         else:
-            return recommended_items
\ No newline at end of file
+            return recommended_items
+
+    def update_ranking_batch(self, user_id_array, recommendations, impressions_count_urm):
+        """Batch version of update_ranking, re-ranks the recommendations of all the given users at once.
+        The presentation counts are gathered from impressions_count_urm in a single lookup and each row is sorted
+        with a stable argsort, so items with the same count keep the order given by the recommender.
+
+        Args:
+            user_id_array (numpy.array): UserIDs, one for each row of recommendations
+            recommendations (list or numpy.array): output of BaseRecommender.recommend for user_id_array, either a list of lists
+                (rows may have different lengths) or an array of shape (n_users, cutoff)
+            impressions_count_urm (csr_matrix): presentation counts, see DataReader.load_impressions_count_urm
+
+        Returns:
+            list or numpy.array: re-ranked recommendations, of the same type as the given ones
+        """
+        user_id_array = np.asarray(user_id_array, dtype=np.int64)
+
+        if isinstance(recommendations, np.ndarray):
+            recommendations_array = recommendations.astype(np.int64, copy=False)
+            valid_mask = np.ones(recommendations_array.shape, dtype=bool)
+        else:
+            # Pad the ragged lists with -1 on the right, the padding is kept at the end of each row by the sort
+            list_lengths = np.array([len(user_recommendations) for user_recommendations in recommendations], dtype=np.int64)
+            max_length = list_lengths.max(initial=0)
+            valid_mask = np.arange(max_length) < list_lengths[:, None]
+            recommendations_array = np.full((len(recommendations), max_length), -1, dtype=np.int64)
+            recommendations_array[valid_mask] = np.fromiter(itertools.chain.from_iterable(recommendations),
+                                                             dtype=np.int64, count=list_lengths.sum())
+
+        assert len(user_id_array) == recommendations_array.shape[0], \
+            "Impressions: user_id_array has {} users but recommendations have {} rows".format(len(user_id_array), recommendations_array.shape[0])
+
+        n_users, n_items = impressions_count_urm.shape
+        user_id_matrix = np.broadcast_to(user_id_array[:, None], recommendations_array.shape)
+        lookup_mask = valid_mask & (recommendations_array < n_items) & (user_id_matrix < n_users)
+
+        counts = np.zeros(recommendations_array.shape, dtype=np.int64)
+        counts[lookup_mask] = np.asarray(impressions_count_urm[user_id_matrix[lookup_mask], recommendations_array[lookup_mask]]).ravel()
+        counts[~valid_mask] = np.iinfo(np.int64).max
+
+        # ascending order, as in update_ranking
+        new_ranking = np.argsort(counts, axis=1, kind="stable")
+        reranked_array = np.take_along_axis(recommendations_array, new_ranking, axis=1)
+
+        if isinstance(recommendations, np.ndarray):
+            return reranked_array.astype(recommendations.dtype, copy=False)
+
+        return [reranked_array[user_index, :list_lengths[user_index]].tolist() for user_index in range(len(recommendations))]
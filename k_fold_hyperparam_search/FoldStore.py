@@ -0,0 +1,102 @@
+import os
+import json
+import shutil
+
+from Data_Handler.DataCache import DataCache
+from Data_Handler.DataReader import DataReader
+from Data_manager.split_functions.split_train_validation_random_holdout import split_train_in_two_percentage_global_sample
+from k_fold_hyperparam_search.Utility import store_sparse_matrix, load_sparse_matrix
+
+
+# Files the folds are built from, editing any of them invalidates the stored folds
+SOURCE_ENV_VARS = ['INTERACTIONS_AND_IMPRESSIONS_PATH', 'DATA_ICM_TYPE_PATH', 'DATA_AUG_UCM']
+
+
+class FoldStore(object):
+    """
+    Seeded k folds of the augmented URM, generated once and stored on disk.
+
+    Each fold is stored as the URM_train_aug_{i}, URM_train_pow_{i} and URM_test_{i} .npy triplets of
+    store_sparse_matrix, next to the ICM and UCM. Folds are identified by k, validation_percentage, seed and
+    by the state of the source files, so two searches with the same seed are evaluated on the same folds.
+    They are opened memory-mapped, hence the processes of a parallel search share the same pages
+    instead of holding their own copy.
+    """
+
+    def __init__(self, k, validation_percentage, seed, folder_path=None):
+        """
+        Args:
+            k (int): number of folds
+            validation_percentage (float): fraction of the interactions of each fold used as test
+            seed (int): fold i is split with seed + i
+            folder_path (str): root folder of the stored folds, by default the FOLD_STORE_PATH env variable or '.fold_store/'
+        """
+        if folder_path is None:
+            folder_path = os.getenv('FOLD_STORE_PATH', '.fold_store/')
+
+        self.k = k
+        self.validation_percentage = validation_percentage
+        self.seed = seed
+
+        key = DataCache().get_key("folds", {"k": k, "validation_percentage": validation_percentage, "seed": seed},
+                                  [os.getenv(env_var) for env_var in SOURCE_ENV_VARS])
+
+        self.folder_path = os.path.join(folder_path, key) + "/"
+
+    def exists(self):
+        return os.path.exists(self.folder_path + "meta.json")
+
+    def build(self):
+        """Split and store the folds, in a private folder renamed only once complete"""
+        temp_folder_path = "{}.temp_{}/".format(self.folder_path[:-1], os.getpid())
+        shutil.rmtree(temp_folder_path, ignore_errors=True)
+        os.makedirs(temp_folder_path)
+
+        try:
+            dataReader = DataReader()
+
+            URM = dataReader.load_augmented_binary_urm()
+            URM_aug, ICM = dataReader.pad_with_zeros_ICMandURM(URM)
+            UCM = dataReader.load_aug_ucm()
+
+            store_sparse_matrix(temp_folder_path, "ICM", ICM)
+            store_sparse_matrix(temp_folder_path, "UCM", UCM)
+
+            for fold_index in range(self.k):
+                URM_train_aug, URM_validation = split_train_in_two_percentage_global_sample(
+                    URM_aug, train_percentage=1 - self.validation_percentage, seed=self.seed + fold_index)
+                URM_train_pow = dataReader.stackMatrixes(URM_train_aug)
+
+                store_sparse_matrix(temp_folder_path, "URM_train_aug_{}".format(fold_index), URM_train_aug)
+                store_sparse_matrix(temp_folder_path, "URM_train_pow_{}".format(fold_index), URM_train_pow)
+                store_sparse_matrix(temp_folder_path, "URM_test_{}".format(fold_index), URM_validation)
+
+            with open(temp_folder_path + "meta.json", "w") as meta_file:
+                json.dump({"k": self.k, "validation_percentage": self.validation_percentage, "seed": self.seed}, meta_file)
+
+            try:
+                os.rename(temp_folder_path, self.folder_path)
+            except OSError:
+                # Another process stored the same folds in the meantime
+                shutil.rmtree(temp_folder_path, ignore_errors=True)
+
+        except Exception as exception:
+            shutil.rmtree(temp_folder_path, ignore_errors=True)
+            raise exception
+
+    def load(self, mmap_mode="r"):
+        """Return the folds as give_me_randomized_k_folds_with_val_percentage does, building them if not stored yet
+
+        Returns:
+            tuple: URM_aug_trains, URM_pow_trains, ICM, UCM, URM_tests
+        """
+        if not self.exists():
+            os.makedirs(os.path.dirname(self.folder_path[:-1]), exist_ok=True)
+            self.build()
+
+        URM_aug_trains = [load_sparse_matrix(self.folder_path, "URM_train_aug_{}".format(fold_index), mmap_mode) for fold_index in range(self.k)]
+        URM_pow_trains = [load_sparse_matrix(self.folder_path, "URM_train_pow_{}".format(fold_index), mmap_mode) for fold_index in range(self.k)]
+        URM_tests = [load_sparse_matrix(self.folder_path, "URM_test_{}".format(fold_index), mmap_mode) for fold_index in range(self.k)]
+
+        return URM_aug_trains, URM_pow_trains, load_sparse_matrix(self.folder_path, "ICM", mmap_mode), \
+            load_sparse_matrix(self.folder_path, "UCM", mmap_mode), URM_tests
@@ -10,7 +10,13 @@ from Data_manager.split_functions.split_train_validation_random_holdout import s
 
 class Utility():
 
-    def give_me_randomized_k_folds_with_val_percentage(self,k,validation_percentage):
+    def give_me_randomized_k_folds_with_val_percentage(self,k,validation_percentage,seed=None):
+        """With a seed the folds are read from, or generated once into, a FoldStore and opened memory-mapped,
+        otherwise new random folds are generated in memory at every call"""
+
+        if seed is not None:
+            from k_fold_hyperparam_search.FoldStore import FoldStore
+            return FoldStore(k, validation_percentage, seed).load()
 
         dataReader = DataReader()
 
@@ -84,3 +90,21 @@ def evaluate_algorithm(self,URM_test, recommender_object):
 
     return cumulative_precision, cumulative_recall, cumulative_MAP
 
+
+
+def store_sparse_matrix(folder_path, name, matrix):
+    """Store a sparse matrix as CSR data/indices/indptr .npy files, so it can be opened memory-mapped by other processes"""
+    matrix = sps.csr_matrix(matrix)
+    np.save(os.path.join(folder_path, name + "_data.npy"), matrix.data)
+    np.save(os.path.join(folder_path, name + "_indices.npy"), matrix.indices)
+    np.save(os.path.join(folder_path, name + "_indptr.npy"), matrix.indptr)
+    np.save(os.path.join(folder_path, name + "_shape.npy"), np.array(matrix.shape, dtype=np.int64))
+
+
+def load_sparse_matrix(folder_path, name, mmap_mode="r"):
+    """Load a matrix stored by store_sparse_matrix. With mmap_mode "r" the arrays are shared through the page cache
+    among all the processes opening the same files instead of being copied"""
+    return sps.csr_matrix((np.load(os.path.join(folder_path, name + "_data.npy"), mmap_mode=mmap_mode),
+                           np.load(os.path.join(folder_path, name + "_indices.npy"), mmap_mode=mmap_mode),
+                           np.load(os.path.join(folder_path, name + "_indptr.npy"), mmap_mode=mmap_mode)),
+                          shape=tuple(np.load(os.path.join(folder_path, name + "_shape.npy"))))
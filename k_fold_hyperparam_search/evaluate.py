@@ -1,5 +1,7 @@
 import numpy as np
 
+from evaluator import evaluate_recommender
+
 
 def precision(recommended_items, relevant_items):
     is_relevant = np.in1d(recommended_items, relevant_items, assume_unique=True)
@@ -23,27 +25,12 @@ def MAP(recommended_items, relevant_items):
     return map_score
 
 
-def evaluate_algorithm(URM_test, recommender_object):
-    cumulative_precision = 0.0
-    cumulative_recall = 0.0
-    cumulative_MAP = 0.0
-
-    num_eval = 0
-
-    for user_id in range(URM_test.shape[0]):
-
-        relevant_items = URM_test.indices[URM_test.indptr[user_id]:URM_test.indptr[user_id + 1]]
-
-        if len(relevant_items) > 0:
-            recommended_items = recommender_object.recommend(user_id)
-            num_eval += 1
-
-            cumulative_precision += precision(recommended_items, relevant_items)
-            cumulative_recall += recall(recommended_items, relevant_items)
-            cumulative_MAP += MAP(recommended_items, relevant_items)
-
-    cumulative_precision /= num_eval
-    cumulative_recall /= num_eval
-    cumulative_MAP /= num_eval
+def evaluate_algorithm(URM_test, recommender_object, cutoff=None, block_size=None):
+    """Precision, recall and MAP over the users with at least one test item, computed in blocks of users.
+    With cutoff None all the items are ranked, as in the original per-user loop, so the numbers are the same.
+    """
+    if block_size is None:
+        # Full rankings are ~n_items long, keep the blocks small
+        block_size = 100 if cutoff is None else 1000
 
-    return cumulative_precision, cumulative_recall, cumulative_MAP
+    return evaluate_recommender(recommender_object, URM_test, cutoff=cutoff, block_size=block_size)
@@ -1,11 +1,17 @@
 import os
+import shutil
+import itertools
+import tempfile
+import numpy as np
 import pandas as pd
 import skopt
 from skopt.utils import use_named_args
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 
 # Import utilities for k_fold_hyperparam_search
-from k_fold_hyperparam_search.Utility import Utility
+from k_fold_hyperparam_search.Utility import Utility, store_sparse_matrix, load_sparse_matrix
+from k_fold_hyperparam_search.FoldStore import FoldStore
 from k_fold_hyperparam_search.evaluate import evaluate_algorithm
 from k_fold_hyperparam_search.hyperparam_def import names, spaces
 
@@ -42,7 +48,8 @@ def read_df(name, param_names, metric="MAP"):
     df = load_df(name)
 
     if df is not None:
-        y = df[metric].tolist()
+        # skopt minimizes, the stored metric is the MAP itself
+        y = [-value for value in df[metric].tolist()]
         x_series = [df[param_name].tolist() for param_name in param_names]
         x = [t for t in zip(*x_series)]
 
@@ -58,7 +65,7 @@ def store_df(name, df: pd.DataFrame):
 
 def append_new_data_to_df(name, new_df):
     df = load_df(name)
-    df = df.append(new_df, ignore_index=True)
+    df = new_df if df is None else pd.concat([df, new_df], ignore_index=True)
     store_df(name, df)
 
 
@@ -68,13 +75,146 @@ def create_df(param_tuples, param_names, value_list, metric="MAP"):
     return df
 
 
+#########################################################################################################
+#########################################################################################################
+#########################################################################################################
+# Pruning
+
+PRUNING_MODES = [None, "median", "incumbent"]
+
+TRIAL_COMPLETE = "complete"
+TRIAL_PRUNED = "pruned"
+
+
+def load_trials_df(name, n_folds):
+    """Load the stored candidates, marking the ones written before pruning existed as complete"""
+    df = load_df(name)
+
+    if df is not None:
+        if "status" not in df.columns:
+            df["status"] = TRIAL_COMPLETE
+        if "n_folds" not in df.columns:
+            df["n_folds"] = n_folds
+        if "fold_MAPs" not in df.columns:
+            df["fold_MAPs"] = [None] * len(df)
+
+    return df
+
+
+def should_prune(fold_MAPs, trials_df, pruning, min_folds=2, confidence=1.96):
+    """Decide whether to stop evaluating a candidate given the MAP of the folds evaluated so far
+
+    Args:
+        fold_MAPs (dict): MAP of each fold evaluated so far, with the fold index as key
+        trials_df (dataframe): previous candidates, as returned by load_trials_df
+        pruning (str): "median" stops the candidate if its mean MAP is below the median of the previous candidates
+            on the same folds, "incumbent" stops it if the upper confidence bound of its mean MAP is below the MAP
+            of the best complete candidate, None never stops it
+        min_folds (int): number of folds to evaluate before the candidate can be stopped
+        confidence (float): width of the "incumbent" confidence bound, in standard errors
+
+    Returns:
+        bool: True if the candidate should be stopped
+    """
+    if pruning is None or len(fold_MAPs) < min_folds or trials_df is None or len(trials_df) == 0:
+        return False
+
+    fold_indices = list(fold_MAPs.keys())
+    current_MAP = np.mean(list(fold_MAPs.values()))
+
+    if pruning == "median":
+        # Only the candidates evaluated on all these folds are comparable, pruned ones included
+        previous_MAPs = [np.mean([previous_fold_MAPs[fold_index] for fold_index in fold_indices])
+                         for previous_fold_MAPs in trials_df["fold_MAPs"]
+                         if isinstance(previous_fold_MAPs, dict) and all(fold_index in previous_fold_MAPs for fold_index in fold_indices)]
+
+        return len(previous_MAPs) > 0 and current_MAP < np.median(previous_MAPs)
+
+    elif pruning == "incumbent":
+        complete_MAPs = trials_df.loc[trials_df["status"] == TRIAL_COMPLETE, "MAP"]
+        if len(complete_MAPs) == 0:
+            return False
+
+        upper_bound = current_MAP + confidence * np.std(list(fold_MAPs.values()), ddof=1) / np.sqrt(len(fold_MAPs))
+
+        return upper_bound < complete_MAPs.max()
+
+    raise ValueError("Pruning '{}' not supported, available values are {}".format(pruning, PRUNING_MODES))
+
+
+#########################################################################################################
+#########################################################################################################
+#########################################################################################################
+# Folds
+
+def build_recommender(recommender_class, URM_train_aug, URM_train_pow, ICM, UCM):
+    if(recommender_class == HybridRecommender_7):
+        return recommender_class(URM_train_aug, URM_train_pow, UCM)
+
+    elif(recommender_class == UserKNN_CFCBF_Hybrid_Recommender):
+        return recommender_class(URM_train_aug, UCM)
+
+    elif(recommender_class == ItemKNN_CFCBF_Hybrid_Recommender):
+        return recommender_class(URM_train_pow, ICM)
+
+    elif(recommender_class == UserKNNCFRecommender):
+        return recommender_class(URM_train_aug)
+
+    elif(recommender_class == SLIMElasticNetRecommender or recommender_class == RP3betaRecommender):
+        return recommender_class(URM_train_pow)
+
+    else:
+        return recommender_class(URM_train_aug, URM_train_pow)
+
+
+def store_folds(folds_folder_path, URM_aug_trains, URM_pow_trains, URM_tests, ICM, UCM):
+    for fold_index, (URM_train_aug, URM_train_pow, URM_test) in enumerate(zip(URM_aug_trains, URM_pow_trains, URM_tests)):
+        store_sparse_matrix(folds_folder_path, "URM_train_aug_{}".format(fold_index), URM_train_aug)
+        store_sparse_matrix(folds_folder_path, "URM_train_pow_{}".format(fold_index), URM_train_pow)
+        store_sparse_matrix(folds_folder_path, "URM_test_{}".format(fold_index), URM_test)
+
+    store_sparse_matrix(folds_folder_path, "ICM", ICM)
+    store_sparse_matrix(folds_folder_path, "UCM", UCM)
+
+
+def fit_and_evaluate_fold(recommender_class, folds_folder_path, fold_index, params):
+    """Run in the worker processes: open the fold memory-mapped, fit the recommender and return its MAP"""
+
+    recommender = build_recommender(recommender_class,
+                                    load_sparse_matrix(folds_folder_path, "URM_train_aug_{}".format(fold_index)),
+                                    load_sparse_matrix(folds_folder_path, "URM_train_pow_{}".format(fold_index)),
+                                    load_sparse_matrix(folds_folder_path, "ICM"),
+                                    load_sparse_matrix(folds_folder_path, "UCM"))
+    recommender.fit(**params)
+
+    _, _, MAP = evaluate_algorithm(load_sparse_matrix(folds_folder_path, "URM_test_{}".format(fold_index)), recommender)
+
+    return fold_index, MAP
+
+
 #########################################################################################################
 #########################################################################################################
 #########################################################################################################
 # Tuning - Optimization function
 
 def optimize_parameters(recommender_class: type, n_calls=100, k=5, validation_percentage=0.05, n_random_starts=None,
-                        seed=None, limit_at=1000, forest=False, xi=0.01):
+                        seed=None, limit_at=1000, forest=False, xi=0.01, n_workers=1, pruning=None, min_folds=2,
+                        pruning_confidence=1.96):
+    """
+    Args:
+        seed (int): if not None the folds are the seeded ones of a FoldStore, the same at every call,
+            otherwise new random folds are drawn
+        n_workers (int): number of processes fitting and evaluating the folds of a candidate concurrently.
+            With more than one worker the folds are written once as .npy files opened memory-mapped by the workers,
+            so they are not pickled for every task
+        pruning (str): one of PRUNING_MODES, see should_prune. A stopped candidate reports to skopt the mean MAP
+            of the folds evaluated so far and is stored with status "pruned"
+        min_folds (int): number of folds to evaluate before a candidate can be stopped
+        pruning_confidence (float): width of the "incumbent" confidence bound, in standard errors
+    """
+    if pruning not in PRUNING_MODES:
+        raise ValueError("Pruning '{}' not supported, available values are {}".format(pruning, PRUNING_MODES))
+
     if n_random_starts is None:
         n_random_starts = int(0.5 * n_calls)
 
@@ -87,7 +227,7 @@ def optimize_parameters(recommender_class: type, n_calls=100, k=5, validation_pe
         print("Using randomized datasets. k={}, val_percentage={}".format(
             k, validation_percentage))
         URM_aug_trains, URM_pow_trains, ICM, UCM, URM_tests = utility.give_me_randomized_k_folds_with_val_percentage(
-            k, validation_percentage)
+            k, validation_percentage, seed)
 
     else:
         raise Exception("Validation set percentage must be grater than 0")
@@ -99,93 +239,133 @@ def optimize_parameters(recommender_class: type, n_calls=100, k=5, validation_pe
 
     assert len(URM_aug_trains) == len(URM_tests)
 
-    print("Starting optimization: N_folds={}, Recommender={}".format(
-        len(URM_aug_trains), names[recommender_class]))
+    print("Starting optimization: N_folds={}, Recommender={}, N_workers={}".format(
+        len(URM_aug_trains), names[recommender_class], n_workers))
 
     recommenders = []
-    if(recommender_class == HybridRecommender_7):
-        for URM_train_aug, URM_train_pow in zip(URM_aug_trains, URM_pow_trains):
-            recommenders.append(recommender_class(
-                URM_train_aug, URM_train_pow, UCM))
-
-    elif(recommender_class == UserKNN_CFCBF_Hybrid_Recommender):
-        for URM_train_aug in URM_aug_trains:
-            recommenders.append(recommender_class(URM_train_aug, UCM))
-
-    elif(recommender_class == ItemKNN_CFCBF_Hybrid_Recommender):
-        for URM_train_pow in URM_pow_trains:
-            recommenders.append(recommender_class(URM_train_pow,ICM))
-
-    elif(recommender_class == UserKNNCFRecommender):
-        for URM_train_aug in URM_aug_trains:
-            recommenders.append(recommender_class(URM_train_aug))
-
-    elif(recommender_class == SLIMElasticNetRecommender or recommender_class == RP3betaRecommender):
-        for URM_train_pow in URM_pow_trains:
-            recommenders.append(recommender_class(URM_train_pow))
+    executor = None
+    folds_folder_path = None
+
+    if n_workers > 1:
+        if seed is not None:
+            # The workers open the seeded folds from the FoldStore, which is kept
+            folds_folder_path = FoldStore(k, validation_percentage, seed).folder_path
+        else:
+            folds_folder_path = tempfile.mkdtemp(prefix="folds_", dir=output_root_path)
+            store_folds(folds_folder_path, URM_aug_trains, URM_pow_trains, URM_tests, ICM, UCM)
+        executor = ProcessPoolExecutor(max_workers=n_workers)
 
     else:
         for URM_train_aug, URM_train_pow in zip(URM_aug_trains, URM_pow_trains):
-            recommenders.append(recommender_class(
-                URM_train_aug, URM_train_pow))
+            recommenders.append(build_recommender(recommender_class, URM_train_aug, URM_train_pow, ICM, UCM))
+
+    def evaluate_folds(params):
+        """Yield the MAP of each fold as soon as it is available. If the caller stops early the remaining folds are not run"""
+        if executor is None:
+            for fold_index, (recommender, test) in enumerate(zip(recommenders, URM_tests)):
+                recommender.fit(**params)
+                _, _, MAP = evaluate_algorithm(test, recommender)
+                yield fold_index, MAP
+        else:
+            # No more than n_workers folds are submitted at a time, and the next fold is submitted only once the
+            # caller has consumed the result of the finished one, so a pruned candidate starts no new fold
+            pending_fold_indices = iter(range(len(URM_tests)))
+            running = set()
+            try:
+                for fold_index in itertools.islice(pending_fold_indices, n_workers):
+                    running.add(executor.submit(fit_and_evaluate_fold, recommender_class, folds_folder_path, fold_index, params))
+
+                while running:
+                    future = next(as_completed(running))
+                    running.remove(future)
+
+                    yield future.result()
+
+                    for fold_index in itertools.islice(pending_fold_indices, 1):
+                        running.add(executor.submit(fit_and_evaluate_fold, recommender_class, folds_folder_path, fold_index, params))
+            finally:
+                for future in running:
+                    future.cancel()
+
+    param_names = [v.name for v in spaces[recommender_class]]
+    xs, ys = read_df(name, param_names)
+    trials_df = load_trials_df(name, len(URM_tests))
 
     @use_named_args(space)
     def objective(**params):
-        scores = []
-        for recommender, test in zip(recommenders, URM_tests):
-            recommender.fit(**params)
-            _, _, MAP = evaluate_algorithm(test, recommender)
-            scores.append(MAP)
-            #print("current MAP: {}".format(MAP))
+        nonlocal trials_df
+
+        fold_MAPs = {}
+        status = TRIAL_COMPLETE
+
+        for fold_index, MAP in evaluate_folds(params):
+            fold_MAPs[fold_index] = MAP
+            print("Fold {} done ({}/{}), MAP: {}".format(fold_index, len(fold_MAPs), len(URM_tests), MAP))
             #print("current parameters: {}".format(params))
 
-        print(">>> Just Evaluated this: {}".format(params))
-        print(">>> MAP: {}, diff (= max_map - min_map): {}".format(sum(scores) /
-              len(scores), max(scores) - min(scores)))
-        print("\n")
+            if len(fold_MAPs) < len(URM_tests) and should_prune(fold_MAPs, trials_df, pruning, min_folds, pruning_confidence):
+                status = TRIAL_PRUNED
+                break
 
-        return sum(scores) / len(scores)
+        scores = list(fold_MAPs.values())
 
-    param_names = [v.name for v in spaces[recommender_class]]
-    xs, ys = read_df(name, param_names)
+        print(">>> Just Evaluated this: {}".format(params))
+        print(">>> MAP: {}, diff (= max_map - min_map): {}, {} on {} folds".format(sum(scores) /
+              len(scores), max(scores) - min(scores), status, len(scores)))
+        print("\n")
 
-    if not forest:
-        res_gp = skopt.gp_minimize(
-            objective,
-            space,
-            n_calls=n_calls,
-            n_random_starts=n_random_starts,
-            n_points=10000,
-            n_jobs=1,
-            # noise = 'gaussian',
-            noise=1e-5,
-            acq_func='gp_hedge',
-            acq_optimizer='auto',
-            random_state=None,
-            verbose=True,
-            n_restarts_optimizer=10,
-            xi=xi,
-            kappa=1.96,
-            x0=xs,
-            y0=ys,
-        )
-    else:
-        res_gp = skopt.forest_minimize(
-            objective,
-            space,
-            n_calls=n_calls,
-            n_random_starts=n_random_starts,
-            verbose=True,
-            x0=xs,
-            y0=ys,
-            acq_func="EI",
-            xi=xi
-        )
-
-    print("Writing a total of {} points for {}. Newly added records: {}".format(len(res_gp.x_iters), name,
-                                                                                n_calls))
-
-    df = create_df(res_gp.x_iters, param_names, res_gp.func_vals, "MAP")
-    store_df(names[recommender_class], df)
-
-    print(name + " reached best performance = ", -res_gp.fun, " at: ", res_gp.x)
+        # Stored after every candidate, so an interrupted search resumes from all of them
+        trial_df = create_df([[params[param_name] for param_name in param_names]], param_names, [sum(scores) / len(scores)], "MAP")
+        trial_df["status"] = status
+        trial_df["n_folds"] = len(scores)
+        trial_df["fold_MAPs"] = [fold_MAPs]
+
+        trials_df = trial_df if trials_df is None else pd.concat([trials_df, trial_df], ignore_index=True)
+        store_df(name, trials_df)
+
+        # skopt minimizes
+        return -sum(scores) / len(scores)
+
+    try:
+        if not forest:
+            res_gp = skopt.gp_minimize(
+                objective,
+                space,
+                n_calls=n_calls,
+                n_random_starts=n_random_starts,
+                n_points=10000,
+                n_jobs=1,
+                # noise = 'gaussian',
+                noise=1e-5,
+                acq_func='gp_hedge',
+                acq_optimizer='auto',
+                random_state=None,
+                verbose=True,
+                n_restarts_optimizer=10,
+                xi=xi,
+                kappa=1.96,
+                x0=xs,
+                y0=ys,
+            )
+        else:
+            res_gp = skopt.forest_minimize(
+                objective,
+                space,
+                n_calls=n_calls,
+                n_random_starts=n_random_starts,
+                verbose=True,
+                x0=xs,
+                y0=ys,
+                acq_func="EI",
+                xi=xi
+            )
+
+        print("Stored a total of {} points for {}. Newly added records: {}".format(len(res_gp.x_iters), name, n_calls))
+
+        print(name + " reached best performance = ", -res_gp.fun, " at: ", res_gp.x)
+
+    finally:
+        if executor is not None:
+            executor.shutdown()
+            if seed is None:
+                shutil.rmtree(folds_folder_path, ignore_errors=True)
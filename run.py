@@ -4,6 +4,7 @@ from impressions import Impressions
 from hybrid import *
 from tqdm import tqdm
 from evaluator import evaluate
+from submission import write_submission
 import pandas as pd
 import numpy as np
 from Recommenders.EASE_R.EASE_R_Recommender import EASE_R_Recommender
@@ -62,16 +63,9 @@ recommender.fit(norm= 2, alpha= 0.8845750718247858)
 
             
 ########################## CREATE CSV FOR SUBMISISON ##########################
-f = open("submission.csv", "w+")
-f.write("user_id,item_list\n")
-recommended_items_for_each_user = {}
-for user_id in tqdm(target):
-    recommended_items = recommender.recommend(
-        user_id, cutoff=10, remove_seen_flag=True)
-    # recommended_items=impressions.update_ranking(user_id,recommended_items,dataReader)
-    recommended_items_for_each_user[int(user_id)] = recommended_items
-    well_formatted = " ".join([str(x) for x in recommended_items])
-    f.write(f"{user_id}, {well_formatted}\n")
+recommended_items_for_each_user = write_submission(recommender, target, file_path="submission.csv", block_size=1000, cutoff=10)
+# recommended_items_for_each_user = write_submission(recommender, target, file_path="submission.csv", block_size=1000, cutoff=10,
+#                                                    impressions=Impressions(), impressions_count_urm=dataReader.load_impressions_count_urm())
 
 # Evaluate recommended items
 map = evaluate(recommended_items_for_each_user, URM_validation, target)
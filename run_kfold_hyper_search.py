@@ -16,7 +16,10 @@ if __name__ == '__main__':
     val_percentage = 0.1
     k = 10
     limit_at = 10
+    n_workers = 2  # folds fitted concurrently, each worker holds one fold in memory
+    pruning = "median"  # stop candidates worse than the median of the previous ones after min_folds folds
     n_calls = 50
+    seed = 1234  # same folds at every run, stored once in the FoldStore
 
     '''
     rec_class = SLIMElasticNetRecommender
@@ -49,6 +52,10 @@ if __name__ == '__main__':
         n_calls=100,
         limit_at=limit_at,
         forest=True,
+        seed=seed,
+        n_workers=n_workers,
+        pruning=pruning,
+        min_folds=3,
     )   
 
     '''
@@ -0,0 +1,61 @@
+from Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
+from Utils.get_peak_memory_MB import get_peak_memory_MB
+from tqdm import tqdm
+import numpy as np
+import time
+
+
+def write_submission(recommender, target, file_path="submission.csv", block_size=1000, cutoff=10, remove_seen_flag=True,
+                     impressions=None, impressions_count_urm=None, verbose=True):
+    """Write the submission csv computing the recommendations of a whole block of target users with each recommend call.
+    Rows are formatted per block and streamed into a buffered file, so the memory used is bounded by the block size
+    (block_size x n_items scores) rather than by the number of target users.
+
+    Args:
+        recommender (BaseRecommender): fitted recommender
+        target (numpy.array): UserIDs to recommend to, in the order they are written
+        file_path (str): path of the csv to write
+        block_size (int): number of users passed to each recommend call
+        cutoff (int): length of each recommendation list
+        remove_seen_flag (bool): passed to recommend
+        impressions (Impressions): if given together with impressions_count_urm, each block is re-ranked with update_ranking_batch
+        impressions_count_urm (csr_matrix): presentation counts, see DataReader.load_impressions_count_urm
+        verbose (bool): print throughput and peak memory at the end
+
+    Returns:
+        dict: UserIDs as keys and recommendation lists as values
+    """
+    target = np.asarray(target)
+    recommended_items_for_each_user = {}
+
+    start_time = time.time()
+
+    with open(file_path, "w", buffering=1024*1024) as f:
+        f.write("user_id,item_list\n")
+
+        for block_start in tqdm(range(0, len(target), block_size), disable=not verbose):
+            user_id_block = target[block_start:block_start + block_size]
+
+            recommended_items_block = recommender.recommend(user_id_block, cutoff=cutoff, remove_seen_flag=remove_seen_flag)
+
+            if impressions is not None and impressions_count_urm is not None:
+                recommended_items_block = impressions.update_ranking_batch(user_id_block, recommended_items_block, impressions_count_urm)
+
+            lines = []
+            for user_id, recommended_items in zip(user_id_block, recommended_items_block):
+                recommended_items_for_each_user[int(user_id)] = recommended_items
+                well_formatted = " ".join([str(x) for x in recommended_items])
+                lines.append(f"{user_id}, {well_formatted}\n")
+
+            f.write("".join(lines))
+
+    elapsed_time = time.time() - start_time
+
+    if verbose:
+        new_time_value, new_time_unit = seconds_to_biggest_unit(elapsed_time)
+        peak_memory = get_peak_memory_MB()
+        print("Submission: {} users in {:.2f} {}, {:.0f} users/sec, block size {}, peak memory {}".format(
+            len(target), new_time_value, new_time_unit, len(target) / max(elapsed_time, 1e-9), block_size,
+            "{:.0f} MB".format(peak_memory) if peak_memory is not None else "not available"))
+
+    return recommended_items_for_each_user
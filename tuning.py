@@ -20,6 +20,7 @@ from Evaluation.Evaluator import EvaluatorHoldout
 from Recommenders.DataIO import DataIO
 from HyperparameterTuning.SearchBayesianSkopt import SearchBayesianSkopt
 from HyperparameterTuning.SearchAbstractClass import SearchInputRecommenderArgs
+from HyperparameterTuning.ScoreCache import ScoreCache
 from skopt.space import Real, Integer, Categorical
 import os
 
@@ -86,6 +87,11 @@ output_folder_path = "result_experiments/"
 if not os.path.exists(output_folder_path):
     os.makedirs(output_folder_path)
 
+# The base models are frozen, their scores on the validation users are computed once and reused by every trial.
+# The cache is cleared since the base models are fitted again at every run
+score_cache = ScoreCache(output_folder_path + "score_cache/", dtype=np.float32)
+score_cache.clear()
+
 n_cases = 300
 n_random_starts = int(n_cases*0.3)
 metric_to_optimize = "MAP"
@@ -156,7 +162,7 @@ hyperparameterSearch = SearchBayesianSkopt(recommender_class,
 recommender_input_args = SearchInputRecommenderArgs(
     # For a CBF model simply put [URM_train, ICM_train]
     CONSTRUCTOR_POSITIONAL_ARGS=[URM_train_aug,S_SLIM, UserKNNCF, RP3beta_aug, CustomItemKNNCF, EASE_R, IALS, P3alpha],
-    CONSTRUCTOR_KEYWORD_ARGS={},
+    CONSTRUCTOR_KEYWORD_ARGS={"score_cache": score_cache},
     FIT_POSITIONAL_ARGS=[],
     FIT_KEYWORD_ARGS={},
     EARLYSTOPPING_KEYWORD_ARGS={},
@@ -164,7 +170,7 @@ recommender_input_args = SearchInputRecommenderArgs(
 
 recommender_input_args_last_test = SearchInputRecommenderArgs(
     CONSTRUCTOR_POSITIONAL_ARGS=[URM_train_aug,S_SLIM, UserKNNCF, RP3beta_aug, CustomItemKNNCF, EASE_R, IALS, P3alpha],
-    CONSTRUCTOR_KEYWORD_ARGS={},
+    CONSTRUCTOR_KEYWORD_ARGS={"score_cache": score_cache},
     FIT_POSITIONAL_ARGS=[],
     FIT_KEYWORD_ARGS={},
     EARLYSTOPPING_KEYWORD_ARGS={},